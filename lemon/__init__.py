@@ -1,3 +1,14 @@
-from lemon.core.bot import LemonBot
+import time
 
-__version__ = "0.1.0"
\ No newline at end of file
+# Reference point of the startup-time report
+IMPORT_STARTED = time.perf_counter()
+
+__version__ = "0.1.0"
+
+def __getattr__(name):
+    # Loaded on first use, so processes that only need a submodule, like the
+    # captcha renderers, don't import the bot and connect to the database
+    if name == "LemonBot":
+        from lemon.core.bot import LemonBot
+        return LemonBot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
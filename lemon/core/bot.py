@@ -1,8 +1,21 @@
+import asyncio
 import logging
 import os
-from telegram.ext import Updater, CommandHandler, MessageHandler, CallbackQueryHandler, Filters
+import signal
+import threading
+from urllib.parse import urlparse
+from telegram import Update, Message
+from telegram.ext import Updater, ExtBot, CommandHandler, MessageHandler, CallbackQueryHandler, Filters
+from telegram.utils.request import Request
 from dotenv import load_dotenv
 
+from lemon import IMPORT_STARTED
+from lemon.core.dispatch import AsyncDispatcher
+from lemon.core.startup import StartupReport
+from lemon.core.scheduler import RequestScheduler, GROUP_CHAT_RATE
+from lemon.utils.history import message_history, HISTORY_PERSIST
+from lemon.utils.captcha_pool import captcha_pool
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -13,22 +26,42 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+class RecordingBot(ExtBot):
+    """Bot that remembers the messages it sends, updates never include them"""
+    
+    def _message(self, endpoint, *args, **kwargs):
+        result = super()._message(endpoint, *args, **kwargs)
+        # Edits return a message that was recorded when it was sent
+        if isinstance(result, Message) and endpoint.startswith(("send", "forward")):
+            message_history.record_message(result)
+        return result
+
 class LemonBot:
     """Main bot class for Lemon Telegram Bot"""
     
     def __init__(self):
         """Initialize the bot with token from environment variables"""
+        self.startup = StartupReport(IMPORT_STARTED)
+        self.startup.mark("imports")
+        
         self.token = os.getenv("BOT_TOKEN")
         if not self.token:
             raise ValueError("No token provided. Set the BOT_TOKEN environment variable.")
         
-        self.updater = Updater(self.token, use_context=True)
+        # Connections for the dispatcher workers, the job queue and the request scheduler
+        api_workers = int(os.getenv("API_WORKERS", 8))
+        request = Request(con_pool_size=4 + 4 + api_workers)
+        
+        # A custom API URL allows running against a local Bot API or fake server
+        bot = RecordingBot(self.token, base_url=os.getenv("TELEGRAM_API_URL") or None, request=request)
+        self.updater = Updater(bot=bot, use_context=True)
         self.dispatcher = self.updater.dispatcher
         
         # Bot information
         self.bot = self.updater.bot
         self.bot_id = self.bot.id
         self.bot_username = os.getenv("BOT_USERNAME") or self.bot.username
+        self.startup.mark("bot init")
         
         # Admin information
         self.owner_id = int(os.getenv("OWNER_ID", 0))
@@ -41,34 +74,263 @@ class LemonBot:
         self.dispatcher.bot_data["bot_instance"] = self
         self.dispatcher.bot_data["log_channel"] = os.getenv("LOG_CHANNEL")
         
+        # Event loop running the async handlers
+        self.async_dispatcher = AsyncDispatcher(
+            concurrency=int(os.getenv("ASYNC_CONCURRENCY", 256)),
+            lanes=int(os.getenv("ASYNC_LANES", 64)),
+            lane_size=int(os.getenv("ASYNC_LANE_SIZE", 1000)),
+            policy=os.getenv("ASYNC_LANE_POLICY", "drop_newest")
+        )
+        self.dispatcher.bot_data["async_dispatcher"] = self.async_dispatcher
+        
+        # Outbound Bot API calls, limited globally and per chat
+        self.request_scheduler = RequestScheduler(
+            rate=int(os.getenv("API_RATE", 30)),
+            chat_rate=float(os.getenv("API_CHAT_RATE", 1)),
+            chat_burst=int(os.getenv("API_CHAT_BURST", 3)),
+            workers=api_workers,
+            group_chat_rate=float(os.getenv("API_GROUP_CHAT_RATE", GROUP_CHAT_RATE))
+        )
+        self.dispatcher.bot_data["request_scheduler"] = self.request_scheduler
+        self.async_dispatcher.add_shutdown_hook(self.request_scheduler.close)
+        self.async_dispatcher.add_shutdown_hook(captcha_pool.close)
+        
+        # Keep message history across restarts
+        if HISTORY_PERSIST:
+            from lemon.database.state import state
+            self.async_dispatcher.add_shutdown_hook(lambda: message_history.save(state))
+        
+        # Keep pending captcha and verification deadlines across restarts
+        self.async_dispatcher.add_shutdown_hook(self.flush_deadlines)
+        
+        # Last, as the hooks above and the tasks they start may still write to the database
+        self.async_dispatcher.add_shutdown_hook(self.close_database, final=True)
+        
         # Other settings
         self.log_channel = os.getenv("LOG_CHANNEL")
         self.support_chat = os.getenv("SUPPORT_CHAT")
         self.default_language = os.getenv("DEFAULT_LANGUAGE", "en")
         
+        # Webhook settings, long polling is used when no webhook URL is set
+        self.webhook_url = os.getenv("WEBHOOK_URL")
+        self.webhook_listen = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+        self.webhook_port = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", 8443)))
+        self.webhook_secret = os.getenv("WEBHOOK_SECRET")
+        self.webhook_queue_size = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+        
+        # Worker processes, updates are sharded across them by chat when above 1
+        self.workers = int(os.getenv("WORKERS", 1))
+        self.worker_queue_size = int(os.getenv("WORKER_QUEUE_SIZE", 10000))
+        
+        # Modules only imported once one of their handlers runs
+        self.lazy_modules = [name.strip() for name in os.getenv("LAZY_MODULES", "").split(",") if name.strip()]
+        
         logger.info("Bot initialized")
     
     def register_handlers(self):
         """Register all command and message handlers"""
-        from lemon.modules import ALL_HANDLERS
+        from lemon.modules import load_modules
+        from lemon.modules.cleaning import record_message
+        from lemon.core.pipeline import MessagePipeline
         
-        for handler_list in ALL_HANDLERS:
+        all_handlers, message_stages, import_times = load_modules(self.lazy_modules)
+        
+        for group, handler_list in all_handlers:
             for handler in handler_list:
-                self.dispatcher.add_handler(handler)
+                self.add_handler(handler, group)
+        
+        # Remember messages for /clean, in a group of its own so it sees every message
+        self.add_handler(MessageHandler(Filters.update.message, record_message), group=-1)
+        
+        # Single handler running all per-message stages
+        self.add_handler(
+            MessageHandler(Filters.text & ~Filters.command, MessagePipeline(message_stages))
+        )
         
         logger.info("All handlers registered")
+        self.startup.mark("modules", import_times)
+    
+    def add_handler(self, handler, group=0):
+        """Add a handler whose async callback runs on the bot's event loop"""
+        handler.callback = self.async_dispatcher.wrap(handler.callback)
+        self.dispatcher.add_handler(handler, group)
     
     def start(self):
         """Start the bot"""
+        from lemon.database import db
+        from lemon.database.mongo import SyncMongoDB
+        
+        # The database client lives on the dispatcher's event loop
+        self.async_dispatcher.start()
+        
+        # Make sure queries are backed by indexes
+        SyncMongoDB(db, self.async_dispatcher.loop).ensure_indexes()
+        self.startup.mark("database indexes")
+        
+        if self.workers > 1:
+            self.start_cluster()
+            self.async_dispatcher.stop()
+            return
+        
         # Register handlers
         self.register_handlers()
+        self.restore_deadlines()
+        self.warm_captchas()
+        
+        if self.webhook_url:
+            self.start_webhook()
+            self.async_dispatcher.stop()
+            return
         
         # Start the Bot
-        self.updater.start_polling()
+        # Chat member updates are only delivered when requested explicitly
+        self.updater.start_polling(allowed_updates=Update.ALL_TYPES)
         logger.info("Bot started polling")
+        self.log_startup()
         
         # Run the bot until you press Ctrl-C
         self.updater.idle()
+        self.async_dispatcher.stop()
+    
+    def start_webhook(self, target=None):
+        """Receive updates through the embedded webhook server until stopped
+        
+        Updates go to the bot's own dispatcher, or to target, which can be
+        anything with a bot attribute and a process_update method.
+        """
+        from lemon.core.webhook import WebhookServer
+        
+        target = target or self.dispatcher
+        server = WebhookServer(
+            target,
+            listen=self.webhook_listen,
+            port=self.webhook_port,
+            url_path=urlparse(self.webhook_url).path,
+            secret_token=self.webhook_secret,
+            queue_size=self.webhook_queue_size
+        )
+        server.start()
+        if target is self.dispatcher:
+            self.updater.job_queue.start()
+        
+        # Register the webhook, the secret token is passed through as PTB 13 predates it
+        self.bot.set_webhook(
+            url=self.webhook_url,
+            allowed_updates=Update.ALL_TYPES,
+            api_kwargs={"secret_token": self.webhook_secret} if self.webhook_secret else None
+        )
+        logger.info(f"Bot started with webhook {self.webhook_url}")
+        self.log_startup()
+        
+        # Run the bot until interrupted or terminated
+        self.wait_for_stop_signal().wait()
+        
+        server.stop()
+        if target is self.dispatcher:
+            self.updater.job_queue.stop()
+        logger.info("Webhook server stopped")
+    
+    def start_cluster(self):
+        """Receive updates in this process and shard them by chat across worker processes"""
+        from lemon.core.cluster import Cluster
+        
+        cluster = Cluster(self.bot, self.workers, self.worker_queue_size)
+        cluster.start()
+        
+        if self.webhook_url:
+            self.start_webhook(cluster)
+        else:
+            logger.info(f"Bot started polling for {self.workers} workers")
+            self.log_startup()
+            cluster.poll(self.wait_for_stop_signal())
+        
+        cluster.stop()
+        logger.info("All workers stopped")
+    
+    def run_worker(self, index, update_queue, processed):
+        """Process the updates a cluster front process routes to this worker"""
+        # The front process coordinates shutdown for the whole process group
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        
+        self.register_handlers()
+        self.async_dispatcher.start()
+        self.restore_deadlines(lambda chat_id: hash(chat_id) % self.workers == index)
+        self.warm_captchas()
+        self.updater.job_queue.start()
+        logger.info(f"Worker {index} started")
+        self.log_startup()
+        
+        while True:
+            update_data = update_queue.get()
+            if update_data is None:
+                break
+            
+            try:
+                self.dispatcher.process_update(Update.de_json(update_data, self.bot))
+            except Exception as e:
+                logger.error(f"Worker {index} failed to process update: {e}")
+            
+            with processed.get_lock():
+                processed.value += 1
+        
+        self.updater.job_queue.stop()
+        self.async_dispatcher.stop()
+        logger.info(f"Worker {index} stopped")
+    
+    def restore_deadlines(self, owns=None):
+        """Reload the pending deadlines of the chats this process handles"""
+        from lemon.utils.raid import restore_sweepers
+        
+        try:
+            restored = asyncio.run_coroutine_threadsafe(
+                restore_sweepers(self.updater.job_queue, owns), self.async_dispatcher.loop
+            ).result()
+            logger.info(f"Restored {restored} pending deadlines")
+        except Exception as e:
+            logger.error(f"Failed to restore pending deadlines: {e}")
+        self.startup.mark("pending deadlines")
+    
+    def warm_captchas(self):
+        """Start rendering captchas ahead of the first join if any chat uses them"""
+        try:
+            warming = asyncio.run_coroutine_threadsafe(self._warm_captchas(), self.async_dispatcher.loop).result()
+            if warming:
+                logger.info("Warming the captcha pool")
+        except Exception as e:
+            logger.error(f"Failed to warm the captcha pool: {e}")
+    
+    async def _warm_captchas(self):
+        """Start the captcha pool refill on the loop, returns whether any chat needs captchas"""
+        from lemon.database import db
+        
+        if not await db.has_captcha_chats():
+            return False
+        captcha_pool.warm()
+        return True
+    
+    async def flush_deadlines(self):
+        """Persist deadline changes not written yet"""
+        from lemon.utils.raid import flush_sweepers
+        
+        await flush_sweepers()
+    
+    async def close_database(self):
+        """Close the database client once nothing uses it anymore"""
+        from lemon.database import db
+        
+        await db.close()
+    
+    def log_startup(self):
+        """Log how long startup took, once the bot is ready for updates"""
+        self.startup.mark("ready")
+        logger.info(self.startup.format())
+    
+    def wait_for_stop_signal(self):
+        """Get an event that is set once SIGINT or SIGTERM is received"""
+        stop_event = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop_event.set())
+        return stop_event
     
     def send_log(self, message):
         """Send a log message to the log channel"""
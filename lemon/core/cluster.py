@@ -0,0 +1,195 @@
+import sys
+import time
+import queue
+import random
+import logging
+import multiprocessing
+from telegram import Update
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Seconds a getUpdates long poll waits for new updates
+POLL_TIMEOUT = 30
+
+# Seconds routing waits on a full worker queue before checking that the worker is still alive
+ROUTE_TIMEOUT = 5
+
+# Update fields that carry the chat an update belongs to
+CHAT_UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request"
+)
+
+def chat_id_of(update_data):
+    """Get the chat ID a raw update belongs to, or the sender for chat-less updates"""
+    for field in CHAT_UPDATE_FIELDS:
+        if field in update_data:
+            return update_data[field]["chat"]["id"]
+
+    callback_query = update_data.get("callback_query")
+    if callback_query and "message" in callback_query:
+        return callback_query["message"]["chat"]["id"]
+
+    # Inline queries, polls and the like have no chat, route them by sender
+    for value in update_data.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"]["id"]
+    return 0
+
+def run_worker(index, update_queue, processed):
+    """Entry point of a worker process"""
+    from lemon.core.bot import LemonBot
+
+    bot = LemonBot()
+    bot.run_worker(index, update_queue, processed)
+
+class Cluster:
+    """Front process routing updates by chat ID to a pool of worker processes
+
+    Every chat always lands on the same worker, so in-memory per-chat state
+    such as flood counters and pending captchas stays consistent. Workers
+    that die are restarted on the same queue, keeping their chats.
+    """
+
+    def __init__(self, bot, workers, queue_size=10000):
+        """Initialize the cluster"""
+        self.bot = bot
+        self.worker_count = workers
+
+        # Spawned workers don't inherit database clients or threads from the front process
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.processed = [self._context.Value("q", 0) for _ in range(workers)]
+        self.processes = [None] * workers
+
+    def _spawn(self, index):
+        """Start the worker process for a queue"""
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self.queues[index], self.processed[index]),
+            name=f"lemon_worker_{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        """Start all worker processes"""
+        for index in range(self.worker_count):
+            self._spawn(index)
+        logger.info(f"Started {self.worker_count} worker processes")
+
+    def check_workers(self):
+        """Restart worker processes that exited"""
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self._spawn(index)
+
+    def route(self, update_data):
+        """Send a raw update to the worker owning its chat, blocking while that worker is backed up"""
+        index = hash(chat_id_of(update_data)) % self.worker_count
+        while True:
+            try:
+                self.queues[index].put(update_data, timeout=ROUTE_TIMEOUT)
+                return
+            except queue.Full:
+                # A worker that died with a full queue would never drain it
+                logger.warning(f"Queue of worker {index} is full, checking the workers")
+                self.check_workers()
+
+    def process_update(self, update):
+        """Route a parsed update, lets the cluster stand in for a dispatcher"""
+        self.route(update.to_dict())
+
+    def poll(self, stop_event):
+        """Long poll Telegram for updates and route them until stop_event is set"""
+        self.bot.delete_webhook()
+        offset = None
+
+        while not stop_event.is_set():
+            self.check_workers()
+            try:
+                updates = self.bot.get_updates(
+                    offset=offset,
+                    timeout=POLL_TIMEOUT,
+                    allowed_updates=Update.ALL_TYPES
+                )
+            except TelegramError as e:
+                logger.error(f"Failed to get updates: {e}")
+                time.sleep(1)
+                continue
+
+            for update in updates:
+                offset = update.update_id + 1
+                self.process_update(update)
+
+    def stop(self, timeout=30):
+        """Let the workers finish their queues and stop them"""
+        for index, update_queue in enumerate(self.queues):
+            try:
+                update_queue.put(None, timeout=ROUTE_TIMEOUT)
+            except queue.Full:
+                logger.warning(f"Queue of worker {index} is still full, it will be terminated")
+
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in time, terminating")
+                process.terminate()
+
+    def total_processed(self):
+        """Get the number of updates processed by all workers"""
+        return sum(counter.value for counter in self.processed)
+
+def synthetic_updates(count, chats=100, users=1000):
+    """Generate raw text message updates spread over a number of chats"""
+    for update_id in range(1, count + 1):
+        chat_id = -1000000000000 - random.randrange(chats)
+        user_id = random.randrange(1, users + 1)
+        yield {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+                "text": f"synthetic message {update_id}"
+            }
+        }
+
+def benchmark(cluster, count=10000, chats=100):
+    """Push synthetic updates through a started cluster and return updates per second"""
+    baseline = cluster.total_processed()
+    started = time.monotonic()
+
+    for update_data in synthetic_updates(count, chats):
+        cluster.route(update_data)
+
+    while cluster.total_processed() - baseline < count:
+        cluster.check_workers()
+        time.sleep(0.1)
+
+    elapsed = time.monotonic() - started
+    return count / elapsed
+
+if __name__ == "__main__":
+    # Usage: python -m lemon.core.cluster [workers] [updates] [chats]
+    from lemon.core.bot import LemonBot
+
+    args = [int(arg) for arg in sys.argv[1:4]]
+    workers, count, chats = args + [4, 10000, 100][len(args):]
+
+    cluster = Cluster(LemonBot().bot, workers)
+    cluster.start()
+    rate = benchmark(cluster, count, chats)
+    cluster.stop()
+    print(f"{workers} workers processed {count} updates across {chats} chats at {rate:.0f} updates/s")
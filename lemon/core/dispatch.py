@@ -0,0 +1,268 @@
+import asyncio
+import inspect
+import logging
+import functools
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# What a full lane does with new work
+LANE_POLICIES = ("drop_newest", "drop_oldest", "coalesce")
+
+# Name prefix of tasks that run until a shutdown hook stops them, draining doesn't wait for them
+SERVICE_TASK_PREFIX = "service:"
+
+# Seconds draining waits for outstanding tasks before cancelling them
+TASK_DRAIN_TIMEOUT = 10
+
+class Lane:
+    """Ordered queue of coroutines processed one at a time"""
+
+    def __init__(self, index, maxsize):
+        self.index = index
+        self.maxsize = maxsize
+        self.items = deque()
+        self.wakeup = asyncio.Event()
+        self.busy = False
+
+        # Lane statistics
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.items)
+
+class AsyncDispatcher:
+    """Run coroutine handlers concurrently on one event loop owned by the bot
+
+    python-telegram-bot 13 calls handlers from its worker threads and has no
+    idea what to do with the coroutines our async handlers return. Wrapped
+    callbacks hand those coroutines to this dispatcher, which runs them on a
+    shared loop in a background thread.
+
+    Work for a chat is hashed by chat ID onto one of ``lanes`` ordered lanes.
+    Each lane runs its coroutines one after another, so updates of a chat are
+    handled in order, while the lanes themselves run in parallel. A lane
+    holds at most ``lane_size`` waiting coroutines. When it is full the
+    ``policy`` either drops the new work, drops the oldest waiting work, or
+    coalesces the new work into waiting work with the same coalesce key.
+    """
+
+    def __init__(self, concurrency=256, lanes=64, lane_size=1000, policy="drop_newest"):
+        """Initialize the dispatcher"""
+        if policy not in LANE_POLICIES:
+            raise ValueError(f"Unknown lane policy {policy}, expected one of {', '.join(LANE_POLICIES)}")
+
+        self.concurrency = concurrency
+        self.lane_count = lanes
+        self.lane_size = lane_size
+        self.policy = policy
+        self.loop = asyncio.new_event_loop()
+        self.in_flight = 0
+
+        self._semaphore = None
+        self._lanes = []
+        self._workers = []
+        self._shutdown_hooks = []
+        self._final_hooks = []
+        self._thread = threading.Thread(target=self._run_loop, name="async_dispatcher", daemon=True)
+        self._ready = threading.Event()
+
+    def _run_loop(self):
+        """Run the event loop until stopped"""
+        asyncio.set_event_loop(self.loop)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._lanes = [Lane(index, self.lane_size) for index in range(self.lane_count)]
+        self._workers = [self.loop.create_task(self._lane_worker(lane)) for lane in self._lanes]
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    def start(self):
+        """Start the event loop thread"""
+        self._thread.start()
+        self._ready.wait()
+        logger.info(
+            f"Async dispatcher started with {self.lane_count} lanes "
+            f"and concurrency {self.concurrency}"
+        )
+
+    def stop(self, timeout=60):
+        """Wait for queued and in-flight coroutines to finish and stop the event loop"""
+        if not self._thread.is_alive():
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(), self.loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Async dispatcher did not drain cleanly: {e}")
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def add_shutdown_hook(self, hook, final=False):
+        """Register a coroutine function awaited on stop, once no more handlers will run
+
+        Final hooks run after every other hook and every task those started,
+        for things nothing may use afterwards like the database client.
+        """
+        (self._final_hooks if final else self._shutdown_hooks).append(hook)
+
+    async def _run_hooks(self, hooks):
+        for hook in hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"Error in shutdown hook: {e}")
+
+    async def _wait_for_tasks(self, timeout=TASK_DRAIN_TIMEOUT):
+        """Wait for outstanding tasks, like chat-less handlers and background jobs, cancelling those that overrun"""
+        tasks = [
+            task for task in asyncio.all_tasks()
+            if task is not asyncio.current_task() and not task.get_name().startswith(SERVICE_TASK_PREFIX)
+        ]
+        if not tasks:
+            return
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} tasks still running after {timeout}s")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _drain(self):
+        """Wait for the lanes and all other tasks to finish, then run the shutdown hooks"""
+        while any(lane.items or lane.busy for lane in self._lanes):
+            await asyncio.sleep(0.05)
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+        await self._wait_for_tasks()
+        await self._run_hooks(self._shutdown_hooks)
+
+        # Hooks may have started tasks of their own, e.g. a last flush
+        await self._wait_for_tasks()
+        await self._run_hooks(self._final_hooks)
+
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, coro, chat_id=None, coalesce_key=None):
+        """Schedule a coroutine from any thread
+
+        Work without a chat runs right away, subject only to the concurrency
+        limit, and a concurrent.futures.Future is returned for it. Work for a
+        chat is queued on the chat's lane and None is returned.
+        """
+        if chat_id is None:
+            return asyncio.run_coroutine_threadsafe(self._execute(coro), self.loop)
+
+        self.loop.call_soon_threadsafe(self._enqueue, coro, chat_id, coalesce_key)
+        return None
+
+    def _enqueue(self, coro, chat_id, coalesce_key):
+        """Add a coroutine to its chat's lane, applying the overflow policy"""
+        lane = self._lanes[hash(chat_id) % self.lane_count]
+
+        if len(lane.items) >= lane.maxsize:
+            if self.policy == "drop_oldest":
+                dropped, _ = lane.items.popleft()
+                dropped.close()
+                lane.dropped += 1
+            elif self.policy == "coalesce" and coalesce_key is not None and self._coalesce(lane, coro, coalesce_key):
+                return
+            else:
+                coro.close()
+                lane.dropped += 1
+                logger.warning(f"Lane {lane.index} is full, dropped work for chat {chat_id}")
+                return
+
+        lane.items.append((coro, coalesce_key))
+        lane.wakeup.set()
+
+    def _coalesce(self, lane, coro, coalesce_key):
+        """Replace waiting work that has the same key, returns False if there is none"""
+        for position, (waiting, key) in enumerate(lane.items):
+            if key == coalesce_key:
+                waiting.close()
+                lane.items[position] = (coro, coalesce_key)
+                lane.coalesced += 1
+                return True
+        return False
+
+    async def _lane_worker(self, lane):
+        """Process the coroutines of a lane in order"""
+        while True:
+            while not lane.items:
+                lane.wakeup.clear()
+                await lane.wakeup.wait()
+
+            coro, _ = lane.items.popleft()
+            lane.busy = True
+            try:
+                await self._execute(coro)
+            finally:
+                lane.busy = False
+                lane.processed += 1
+
+    async def _execute(self, coro):
+        """Run a coroutine under the concurrency limit"""
+        self.in_flight += 1
+        try:
+            async with self._semaphore:
+                return await coro
+        except Exception as e:
+            logger.error(f"Error in async handler: {e}", exc_info=True)
+        finally:
+            self.in_flight -= 1
+
+    def lane_depths(self):
+        """Get the number of waiting coroutines per lane"""
+        return [len(lane) for lane in self._lanes]
+
+    def stats(self):
+        """Get dispatcher and lane statistics"""
+        return {
+            "in_flight": self.in_flight,
+            "queued": sum(len(lane) for lane in self._lanes),
+            "max_lane_depth": max(self.lane_depths(), default=0),
+            "processed": sum(lane.processed for lane in self._lanes),
+            "dropped": sum(lane.dropped for lane in self._lanes),
+            "coalesced": sum(lane.coalesced for lane in self._lanes)
+        }
+
+    def wrap(self, callback):
+        """Wrap a handler callback so coroutines it returns run on the loop"""
+        @functools.wraps(callback)
+        def wrapper(update, context, *args, **kwargs):
+            result = callback(update, context, *args, **kwargs)
+            if not inspect.isawaitable(result):
+                return result
+
+            chat = getattr(update, "effective_chat", None)
+            if chat is None:
+                self.submit(result)
+                return None
+
+            # Under backlog, repeated work of one user for one handler collapses into the latest
+            user = getattr(update, "effective_user", None)
+            coalesce_key = (id(callback), chat.id, user.id if user else None)
+            self.submit(result, chat.id, coalesce_key)
+            return None
+        return wrapper
+
+def async_job(callback):
+    """Make an async job callback runnable by the PTB job queue"""
+    @functools.wraps(callback)
+    def wrapper(context):
+        job_context = context.job.context
+        chat_id = job_context.get("chat_id") if isinstance(job_context, dict) else None
+        context.bot_data["async_dispatcher"].submit(callback(context), chat_id)
+    return wrapper
@@ -0,0 +1,197 @@
+import sys
+import time
+import asyncio
+import logging
+from types import SimpleNamespace
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from lemon.database import db
+
+logger = logging.getLogger(__name__)
+
+class MessagePipeline:
+    """Run all message stages for an update on a single chat settings lookup
+
+    Each stage is called as ``stage(update, context, chat_data)`` and returns
+    True when it handled the message, which stops the remaining stages.
+    """
+
+    def __init__(self, stages, get_chat=None):
+        """Initialize the pipeline with an ordered list of stages
+
+        get_chat loads the settings of a chat, the database by default.
+        """
+        self.stages = list(stages)
+        self.get_chat = get_chat or db.get_chat
+
+    async def __call__(self, update: Update, context: CallbackContext) -> None:
+        """Process a message through every stage until one handles it"""
+        chat = update.effective_chat
+
+        # Load chat settings once for all stages
+        if chat.type == "private":
+            chat_data = {}
+        else:
+            chat_data = await self.get_chat(chat.id) or {}
+
+        for stage in self.stages:
+            try:
+                if await stage(update, context, chat_data):
+                    break
+            except Exception as e:
+                logger.error(f"Error in message stage {stage.__name__}: {e}")
+
+class SimulatedCollection:
+    """MongoDB collection answering from a list of documents after a fixed round trip"""
+
+    def __init__(self, latency, documents=()):
+        self.latency = latency
+        self.documents = list(documents)
+        self.queries = 0
+
+    def _matching(self, query):
+        return [document for document in self.documents if all(document.get(key) == value for key, value in query.items())]
+
+    async def find_one(self, query):
+        self.queries += 1
+        await asyncio.sleep(self.latency)
+        found = self._matching(query)
+        return dict(found[0]) if found else None
+
+    def find(self, query):
+        collection = self
+
+        class Cursor:
+            async def to_list(self, length=None):
+                collection.queries += 1
+                await asyncio.sleep(collection.latency)
+                return collection._matching(query)[:length]
+
+        return Cursor()
+
+class SimulatedBot:
+    """Bot answering the Bot API calls the message stages make without a network"""
+
+    id = 1
+
+    def get_chat_administrators(self, chat_id):
+        return [SimpleNamespace(user=SimpleNamespace(id=self.id))]
+
+class DirectScheduler:
+    """Request scheduler running calls right away, the benchmark measures the stages"""
+
+    async def call(self, func, *args, priority=None, **kwargs):
+        return func(*args, **kwargs)
+
+# Chats and users the synthetic messages are spread over
+BENCHMARK_CHATS = 100
+BENCHMARK_USERS = 1000
+
+def synthetic_messages(count, chats=BENCHMARK_CHATS, users=BENCHMARK_USERS):
+    """Generate text message updates spread over chats and users
+
+    Most are plain chatter, one in ten triggers the chat's filter and one in
+    twenty asks for its note, so every stage does its usual work.
+    """
+    for index in range(count):
+        chat_id = -1000000000000 - index % chats
+        if index % 20 == 0:
+            text = "#rules"
+        elif index % 10 == 0:
+            text = "hello everyone"
+        else:
+            text = f"message {index}"
+
+        message = SimpleNamespace(
+            text=text,
+            chat_id=chat_id,
+            reply_to_message=None,
+            reply_text=lambda *args, **kwargs: None
+        )
+        yield SimpleNamespace(
+            effective_chat=SimpleNamespace(id=chat_id, type="supergroup"),
+            effective_user=SimpleNamespace(id=index % users, first_name="User"),
+            effective_message=message
+        )
+
+def simulated_collections(latency, chats=BENCHMARK_CHATS):
+    """Build the chats, filters and notes collections the stages read, one filter and note per chat"""
+    chat_ids = [-1000000000000 - index for index in range(chats)]
+    return {
+        # A flood limit the synthetic users stay below
+        "async_chats": SimulatedCollection(latency, [{"_id": chat_id, "flood": {"limit": 100}} for chat_id in chat_ids]),
+        "async_filters": SimulatedCollection(latency, [
+            {"chat_id": chat_id, "keyword": "hello", "content": "Hi!", "reply_markup": None} for chat_id in chat_ids
+        ]),
+        "async_notes": SimulatedCollection(latency, [
+            {"chat_id": chat_id, "name": "rules", "content": "Be nice", "reply_markup": None} for chat_id in chat_ids
+        ])
+    }
+
+def per_module_handlers(stages, get_chat):
+    """Wrap each stage the way it ran as its own handler, loading chat settings itself"""
+    def handler(stage):
+        async def run(update, context):
+            chat_data = await get_chat(update.effective_chat.id) or {}
+            return await stage(update, context, chat_data)
+        return run
+    return [handler(stage) for stage in stages]
+
+async def benchmark(count=10000, latency=0.0005, concurrency=64):
+    """Process synthetic messages through the real message stages, per module and as a pipeline
+
+    The shared database gets simulated collections costing latency seconds
+    per query, behind its real settings cache, and the Bot API is mocked.
+    Returns (updates per second, database queries) for each wiring.
+    """
+    from lemon.modules import load_modules
+    from lemon.modules.filters import filter_matchers
+    from lemon.utils.admins import admin_cache
+
+    _, stages, _ = load_modules()
+    context = SimpleNamespace(bot=SimulatedBot(), bot_data={"request_scheduler": DirectScheduler()})
+    saved = {name: getattr(db, name) for name in ("async_chats", "async_filters", "async_notes")}
+    results = {}
+
+    try:
+        for mode in ("per-module handlers", "pipeline"):
+            # Both wirings start with cold caches
+            collections = simulated_collections(latency)
+            for name, collection in collections.items():
+                setattr(db, name, collection)
+            db.chat_cache.clear()
+            filter_matchers.clear()
+            admin_cache.clear()
+
+            if mode == "pipeline":
+                handlers = [MessagePipeline(stages)]
+            else:
+                handlers = per_module_handlers(stages, db.get_chat)
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def process(update):
+                async with semaphore:
+                    for handler in handlers:
+                        await handler(update, context)
+
+            started = time.monotonic()
+            await asyncio.gather(*(process(update) for update in synthetic_messages(count)))
+            queries = sum(collection.queries for collection in collections.values())
+            results[mode] = (count / (time.monotonic() - started), queries)
+    finally:
+        for name, value in saved.items():
+            setattr(db, name, value)
+        db.chat_cache.clear()
+
+    return results
+
+if __name__ == "__main__":
+    # Usage: python -m lemon.core.pipeline [updates] [query latency in ms]
+    args = sys.argv[1:3]
+    count = int(args[0]) if len(args) > 0 else 10000
+    latency = float(args[1]) / 1000 if len(args) > 1 else 0.5 / 1000
+
+    for mode, (rate, queries) in asyncio.run(benchmark(count, latency)).items():
+        print(f"{mode}: {rate:.0f} updates/s, {queries} database queries")
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from lemon.core.dispatch import SERVICE_TASK_PREFIX
+from lemon.utils.cache import TTLCache
+from lemon.utils.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, lower runs first
+INTERACTIVE = 0
+BULK = 1
+
+# Times a request is retried after Telegram answered with 429
+API_RETRIES = 3
+
+# Methods that post into a chat and count towards its per-chat limit
+CHAT_LIMITED_PREFIXES = ("send_", "reply_", "edit_", "copy_", "forward_")
+
+# Methods with those prefixes that don't post a message
+CHAT_UNLIMITED_METHODS = ("send_chat_action",)
+
+# Messages per second Telegram allows in one group, about 20 a minute
+GROUP_CHAT_RATE = 20 / 60
+
+class Request:
+    """Bot API call waiting in the scheduler"""
+
+    __slots__ = ("func", "args", "kwargs", "chat_id", "future", "attempts")
+
+    def __init__(self, func, args, kwargs, chat_id, future):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.future = future
+        self.attempts = 0
+
+def chat_of(func, args, kwargs):
+    """Get the chat a Bot API call posts into, or None if it is not chat limited"""
+    if not func.__name__.startswith(CHAT_LIMITED_PREFIXES) or func.__name__ in CHAT_UNLIMITED_METHODS:
+        return None
+
+    if "chat_id" in kwargs:
+        return kwargs["chat_id"]
+
+    # Bot methods take the chat as first argument
+    owner = getattr(func, "__self__", None)
+    if owner is None or isinstance(owner, Bot):
+        return args[0] if args else None
+
+    # Shortcuts like Message.reply_text, CallbackQuery.edit_message_text and Chat.send_message
+    if hasattr(owner, "chat_id"):
+        return owner.chat_id
+    if getattr(owner, "message", None) is not None:
+        return owner.message.chat_id
+    return getattr(owner, "id", None)
+
+class RequestScheduler:
+    """Central queue for outbound Bot API calls
+
+    Calls are awaited by handlers and run in a dedicated thread pool, so the
+    event loop never blocks on Telegram. Every call takes a token from a
+    global limiter, and calls posting into a chat also from that chat's
+    limiter, which runs at ``chat_rate`` in private chats and at the lower
+    ``group_chat_rate`` in groups and channels. A call whose chat is out of tokens is parked until it has some
+    instead of holding a worker. Interactive calls are always served before
+    bulk ones, and 429 answers are retried after their retry_after.
+    """
+
+    def __init__(self, rate=30, chat_rate=1, chat_burst=3, workers=8, chat_limiters=10000, group_chat_rate=GROUP_CHAT_RATE):
+        """Initialize the scheduler"""
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.chat_burst = chat_burst
+        self.worker_count = workers
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="api_request")
+        self._chat_limiters = TTLCache(maxsize=chat_limiters, ttl=60)
+        self._limiter = None
+        self._queue = None
+        self._workers = []
+        self._sequence = 0
+        self.pending = 0
+
+        # Scheduler statistics
+        self.sent = 0
+        self.failed = 0
+        self.deferred = 0
+        self.retried = 0
+
+    def _start(self):
+        """Create the queue and workers on the running loop on first use"""
+        if self._queue is not None:
+            return
+
+        loop = asyncio.get_running_loop()
+        self._limiter = RateLimiter(self.rate)
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [
+            loop.create_task(self._worker(), name=f"{SERVICE_TASK_PREFIX}request_scheduler")
+            for _ in range(self.worker_count)
+        ]
+
+    async def call(self, func, *args, priority=INTERACTIVE, **kwargs):
+        """Run a blocking Bot API call under the rate limits and return its result"""
+        self._start()
+
+        request = Request(func, args, kwargs, chat_of(func, args, kwargs), asyncio.get_running_loop().create_future())
+        self.pending += 1
+        self._put(priority, request)
+        try:
+            return await request.future
+        finally:
+            self.pending -= 1
+
+    def _put(self, priority, request):
+        # The sequence number keeps requests of equal priority in order
+        self._sequence += 1
+        self._queue.put_nowait((priority, self._sequence, request))
+
+    def _chat_limiter(self, chat_id):
+        limiter = self._chat_limiters.get(chat_id)
+        if limiter is None:
+            # Private chats have positive IDs, groups and channels negative ones or a @username
+            private = isinstance(chat_id, int) and chat_id > 0
+            limiter = RateLimiter(self.chat_rate if private else self.group_chat_rate, self.chat_burst)
+            self._chat_limiters.set(chat_id, limiter)
+        return limiter
+
+    async def _worker(self):
+        """Run queued requests one at a time"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            priority, _, request = await self._queue.get()
+            if request.future.done():
+                continue
+
+            chat_limiter = self._chat_limiter(request.chat_id) if request.chat_id is not None else None
+            if chat_limiter and not chat_limiter.try_acquire():
+                # Park the request until its chat has capacity
+                self.deferred += 1
+                loop.call_later(chat_limiter.wait_time(), self._put, priority, request)
+                continue
+
+            await self._limiter.acquire()
+            try:
+                result = await loop.run_in_executor(
+                    self._executor,
+                    functools.partial(request.func, *request.args, **request.kwargs)
+                )
+            except RetryAfter as e:
+                request.attempts += 1
+                if request.attempts > API_RETRIES:
+                    self.failed += 1
+                    self._resolve(request, exception=e)
+                    continue
+
+                # Flood waits apply to the chat when there is one, otherwise to the bot
+                self.retried += 1
+                (chat_limiter or self._limiter).pause(e.retry_after)
+                loop.call_later(e.retry_after, self._put, priority, request)
+            except Exception as e:
+                self.failed += 1
+                self._resolve(request, exception=e)
+            else:
+                self.sent += 1
+                self._resolve(request, result=result)
+
+    @staticmethod
+    def _resolve(request, result=None, exception=None):
+        # The caller may have been cancelled meanwhile
+        if request.future.done():
+            return
+        if exception is not None:
+            request.future.set_exception(exception)
+        else:
+            request.future.set_result(result)
+
+    async def close(self):
+        """Wait for pending requests, then stop the workers"""
+        while self.pending:
+            await asyncio.sleep(0.05)
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        """Get scheduler statistics"""
+        return {
+            "pending": self.pending,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "retried": self.retried
+        }
+
+async def api_call(context, func, *args, priority=INTERACTIVE, **kwargs):
+    """Run a Bot API call through the bot's request scheduler"""
+    return await context.bot_data["request_scheduler"].call(func, *args, priority=priority, **kwargs)
@@ -0,0 +1,30 @@
+import time
+
+
+class StartupReport:
+    """Wall-clock time spent in each startup phase, to measure cold starts"""
+
+    def __init__(self, started=None):
+        """Initialize the report, timing from started (a perf_counter value) or now"""
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []
+        self._last = self.started
+
+    def mark(self, phase, details=None):
+        """End the current phase, details maps sub-steps to their seconds"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last, details or {}))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def format(self) -> str:
+        """Get the report as text, slowest sub-steps first"""
+        lines = [f"Startup took {self.total:.3f}s"]
+        for phase, seconds, details in self.phases:
+            lines.append(f"  {phase}: {seconds:.3f}s")
+            for step, step_seconds in sorted(details.items(), key=lambda item: -item[1]):
+                lines.append(f"    {step}: {step_seconds:.3f}s")
+        return "\n".join(lines)
@@ -0,0 +1,114 @@
+import hmac
+import json
+import queue
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Seconds a request waits for room in a full update queue before being refused
+QUEUE_PUT_TIMEOUT = 1
+
+class WebhookServer:
+    """Embedded HTTP server that receives updates pushed by Telegram
+
+    Updates are buffered in a bounded queue and processed in arrival order
+    by a single worker thread. When the queue stays full the request is
+    answered with 503, and Telegram redelivers the update later.
+    """
+
+    def __init__(self, dispatcher, listen="0.0.0.0", port=8443, url_path="/", secret_token=None, queue_size=1000):
+        """Initialize the server"""
+        self.dispatcher = dispatcher
+        self.url_path = "/" + url_path.strip("/")
+        self.secret_token = secret_token
+        self.update_queue = queue.Queue(maxsize=queue_size)
+
+        # Delivery statistics
+        self.received = 0
+        self.rejected = 0
+
+        self._httpd = ThreadingHTTPServer((listen, port), self._make_handler())
+        self._threads = []
+
+    @property
+    def port(self):
+        """Port the server is bound to, useful when listening on port 0"""
+        return self._httpd.server_address[1]
+
+    def _make_handler(self):
+        """Build the request handler class bound to this server"""
+        server = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                status = server.handle_request(self.path, self.headers, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return WebhookHandler
+
+    def handle_request(self, path, headers, body) -> int:
+        """Validate and enqueue an update, returns the HTTP status to answer with"""
+        if path != self.url_path:
+            return 404
+
+        # Telegram echoes the secret given to setWebhook in this header
+        if self.secret_token:
+            received_token = headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(received_token, self.secret_token):
+                return 403
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400
+
+        try:
+            self.update_queue.put(data, timeout=QUEUE_PUT_TIMEOUT)
+        except queue.Full:
+            self.rejected += 1
+            return 503
+
+        self.received += 1
+        return 200
+
+    def _process_updates(self):
+        """Feed queued updates to the dispatcher until stopped"""
+        while True:
+            data = self.update_queue.get()
+            if data is None:
+                break
+
+            try:
+                update = Update.de_json(data, self.dispatcher.bot)
+                self.dispatcher.process_update(update)
+            except Exception as e:
+                logger.error(f"Error processing webhook update: {e}")
+
+    def start(self):
+        """Start serving requests and processing updates in background threads"""
+        self._threads = [
+            threading.Thread(target=self._process_updates, name="webhook_worker", daemon=True),
+            threading.Thread(target=self._httpd.serve_forever, name="webhook_server", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        logger.info(f"Webhook server listening on port {self.port}")
+
+    def stop(self):
+        """Stop the server and wait for queued updates to be processed"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.update_queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
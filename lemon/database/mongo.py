@@ -1,42 +1,144 @@
 import os
+import copy
+import asyncio
+import inspect
 import logging
+import threading
+from datetime import datetime, timedelta
 import motor.motor_asyncio
-from pymongo import MongoClient
+from pymongo import ASCENDING, ReturnDocument, UpdateOne, DeleteOne
+from pymongo.errors import OperationFailure
+from pymongo.monitoring import ConnectionPoolListener
 from dotenv import load_dotenv
 
+from lemon.utils.cache import TTLCache
+
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Chat settings cache configuration
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 10000))
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", 300))
+
+# Connection pool configuration
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 0)) or None
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0)) or None
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+# Marker for chats missing from the cache
+_MISSING = object()
+
+# Indexes backing the queries below, as (collection, keys, options)
+INDEXES = [
+    ("filters", [("chat_id", ASCENDING), ("keyword", ASCENDING)], {"unique": True}),
+    ("notes", [("chat_id", ASCENDING), ("name", ASCENDING)], {"unique": True}),
+    ("warns", [("chat_id", ASCENDING), ("user_id", ASCENDING)], {"unique": True}),
+    ("approvals", [("chat_id", ASCENDING), ("user_id", ASCENDING)], {"unique": True}),
+    ("fed_bans", [("fed_id", ASCENDING), ("user_id", ASCENDING)], {"unique": True}),
+    ("federations", [("chats", ASCENDING)], {}),
+    # Expired state is removed by MongoDB itself
+    ("state", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0})
+]
+
+class PoolMetrics(ConnectionPoolListener):
+    """Connection pool usage, fed by pymongo's pool events"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.clears = 0
+    
+    def _add(self, **deltas):
+        # Events arrive from pymongo's background threads
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        self._add(clears=1)
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        self._add(open=1)
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        self._add(open=-1)
+    
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+    
+    def connection_check_out_failed(self, event):
+        self._add(waiting=-1, checkout_failures=1)
+    
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, in_use=1, checkouts=1)
+    
+    def connection_checked_in(self, event):
+        self._add(in_use=-1)
+    
+    def stats(self):
+        """Get the current pool usage"""
+        with self._lock:
+            return {
+                "open": self.open,
+                "in_use": self.in_use,
+                "idle": self.open - self.in_use,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "clears": self.clears
+            }
+
 class MongoDB:
-    """MongoDB database connection and operations"""
+    """MongoDB database connection and operations
+    
+    All operations go through one pooled Motor client. Code outside the
+    event loop can use SyncMongoDB.
+    """
     
     def __init__(self):
         """Initialize MongoDB connection"""
         self.uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
         self.db_name = os.getenv("DB_NAME", "lemon_bot")
+        self.pool_metrics = PoolMetrics()
         
         try:
-            # Synchronous client for initialization
-            self.client = MongoClient(self.uri)
-            self.db = self.client[self.db_name]
-            
-            # Async client for operations
-            self.async_client = motor.motor_asyncio.AsyncIOMotorClient(self.uri)
+            # Connections are opened lazily by the pool
+            self.async_client = motor.motor_asyncio.AsyncIOMotorClient(
+                self.uri,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                readPreference=MONGO_READ_PREFERENCE,
+                event_listeners=[self.pool_metrics]
+            )
             self.async_db = self.async_client[self.db_name]
             
-            # Initialize collections
-            self.chats = self.db.chats
-            self.users = self.db.users
-            self.warns = self.db.warns
-            self.filters = self.db.filters
-            self.notes = self.db.notes
-            self.approvals = self.db.approvals
-            self.federations = self.db.federations
-            self.fed_bans = self.db.fed_bans
-            
-            # Async collections
+            # Collections
             self.async_chats = self.async_db.chats
             self.async_users = self.async_db.users
             self.async_warns = self.async_db.warns
@@ -45,12 +147,48 @@ class MongoDB:
             self.async_approvals = self.async_db.approvals
             self.async_federations = self.async_db.federations
             self.async_fed_bans = self.async_db.fed_bans
+            self.async_state = self.async_db.state
+            self.async_deadlines = self.async_db.deadlines
+            
+            # In-process cache for chat settings
+            self.chat_cache = TTLCache(maxsize=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL)
+            self._chat_writes = 0
             
             logger.info(f"Connected to MongoDB: {self.db_name}")
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
     
+    async def close(self):
+        """Close the client and its connections"""
+        logger.info(f"Closing MongoDB client, pool usage: {self.pool_stats()}")
+        self.async_client.close()
+    
+    def pool_stats(self):
+        """Get connection pool usage"""
+        return {**self.pool_metrics.stats(), "max_pool_size": MONGO_MAX_POOL_SIZE}
+    
+    async def ensure_indexes(self):
+        """Create any missing indexes, returns the names of the ones created"""
+        created = []
+        
+        for collection_name, keys, options in INDEXES:
+            collection = self.async_db[collection_name]
+            try:
+                existing = await collection.index_information()
+                index_name = await collection.create_index(keys, **options)
+                if index_name not in existing:
+                    created.append(f"{collection_name}.{index_name}")
+            except OperationFailure as e:
+                # Usually duplicate documents blocking a unique index
+                logger.error(f"Failed to create index on {collection_name}: {e}")
+        
+        if created:
+            logger.info(f"Created MongoDB indexes: {', '.join(created)}")
+        else:
+            logger.info("MongoDB indexes are up to date")
+        return created
+    
     # User methods
     async def get_user(self, user_id):
         """Get user data from database"""
@@ -66,16 +204,38 @@ class MongoDB:
     
     # Chat methods
     async def get_chat(self, chat_id):
-        """Get chat data from database"""
-        return await self.async_chats.find_one({"_id": chat_id})
+        """Get chat data, served from the settings cache when possible"""
+        chat_data = self.chat_cache.get(chat_id, _MISSING)
+        if chat_data is _MISSING:
+            writes = self._chat_writes
+            chat_data = await self.async_chats.find_one({"_id": chat_id})
+            
+            # Don't cache a read that raced with an update
+            if writes == self._chat_writes:
+                self.chat_cache.set(chat_id, chat_data)
+        
+        # Callers edit the returned document before saving it
+        return copy.deepcopy(chat_data)
     
     async def update_chat(self, chat_id, chat_data):
         """Update chat data in database"""
-        await self.async_chats.update_one(
-            {"_id": chat_id},
-            {"$set": chat_data},
-            upsert=True
-        )
+        self._chat_writes += 1
+        self.chat_cache.pop(chat_id)
+        
+        try:
+            await self.async_chats.update_one(
+                {"_id": chat_id},
+                {"$set": chat_data},
+                upsert=True
+            )
+        finally:
+            # Reads that overlapped the write must not be cached either
+            self._chat_writes += 1
+            self.chat_cache.pop(chat_id)
+    
+    async def has_captcha_chats(self):
+        """Check if any chat has CAPTCHA enabled"""
+        return await self.async_chats.find_one({"captcha.enabled": True}, projection={"_id": True}) is not None
     
     # Warning methods
     async def get_warns(self, chat_id, user_id):
@@ -83,14 +243,14 @@ class MongoDB:
         return await self.async_warns.find_one({"chat_id": chat_id, "user_id": user_id})
     
     async def add_warn(self, chat_id, user_id, reason=None):
-        """Add a warning for a user in a chat"""
-        warn_data = await self.get_warns(chat_id, user_id) or {"chat_id": chat_id, "user_id": user_id, "warns": []}
-        warn_data["warns"].append({"reason": reason, "count": len(warn_data["warns"]) + 1})
-        
-        await self.async_warns.update_one(
+        """Add a warning for a user in a chat, returns the new warning count"""
+        # Single atomic update, concurrent warns can't overwrite each other
+        warn_data = await self.async_warns.find_one_and_update(
             {"chat_id": chat_id, "user_id": user_id},
-            {"$set": warn_data},
-            upsert=True
+            {"$push": {"warns": {"reason": reason}}},
+            projection={"warns": True},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
         return len(warn_data["warns"])
     
@@ -99,10 +259,10 @@ class MongoDB:
         await self.async_warns.delete_one({"chat_id": chat_id, "user_id": user_id})
     
     # Filter methods
-    async def get_filters(self, chat_id):
-        """Get all filters for a chat"""
+    async def get_filters(self, chat_id, limit=100):
+        """Get all filters for a chat, pass limit=None to load every filter"""
         cursor = self.async_filters.find({"chat_id": chat_id})
-        return await cursor.to_list(length=100)
+        return await cursor.to_list(length=limit)
     
     async def add_filter(self, chat_id, keyword, content, reply_markup=None):
         """Add a filter to a chat"""
@@ -226,4 +386,90 @@ class MongoDB:
     async def is_user_fed_banned(self, fed_id, user_id):
         """Check if a user is banned in a federation"""
         ban = await self.async_fed_bans.find_one({"fed_id": fed_id, "user_id": user_id})
-        return bool(ban)
\ No newline at end of file
+        return bool(ban)
+    
+    # Shared state methods
+    async def get_state(self, namespace, keys):
+        """Get the unexpired state values stored under keys, as a dict"""
+        cursor = self.async_state.find(
+            {
+                "_id": {"$in": [f"{namespace}:{key}" for key in keys]},
+                # The TTL monitor only runs once a minute
+                "expires_at": {"$gt": datetime.utcnow()}
+            },
+            projection={"key": True, "value": True}
+        )
+        return {doc["key"]: doc["value"] async for doc in cursor}
+    
+    async def set_state(self, namespace, items, ttl):
+        """Store state values that expire after ttl seconds in one round trip"""
+        if not items:
+            return
+        
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        await self.async_state.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": f"{namespace}:{key}"},
+                    {"$set": {"key": key, "value": value, "expires_at": expires_at}},
+                    upsert=True
+                )
+                for key, value in items.items()
+            ],
+            ordered=False
+        )
+    
+    async def delete_state(self, namespace, keys):
+        """Delete state values"""
+        if keys:
+            await self.async_state.delete_many({"_id": {"$in": [f"{namespace}:{key}" for key in keys]}})
+    
+    # Pending deadline methods
+    async def get_deadlines(self):
+        """Get every pending deadline"""
+        cursor = self.async_deadlines.find({}, projection={"_id": False})
+        return [doc async for doc in cursor]
+    
+    async def save_deadlines(self, name, writes):
+        """Store (deadline, data) entries by key and delete keys mapped to None, in one round trip
+        
+        Keys are tuples starting with the chat ID.
+        """
+        operations = []
+        for key, entry in writes.items():
+            deadline_id = f"{name}:" + ":".join(str(part) for part in key)
+            if entry is None:
+                operations.append(DeleteOne({"_id": deadline_id}))
+            else:
+                deadline, data = entry
+                operations.append(UpdateOne(
+                    {"_id": deadline_id},
+                    {"$set": {"name": name, "key": list(key), "chat_id": key[0], "deadline": deadline, "data": data}},
+                    upsert=True
+                ))
+        
+        if operations:
+            await self.async_deadlines.bulk_write(operations, ordered=False)
+
+class SyncMongoDB:
+    """Blocking access to MongoDB methods for code running outside the event loop
+    
+    Calls are run on the loop the client is used from and waited for, so
+    there is still only one client and one pool.
+    """
+    
+    def __init__(self, database, loop, timeout=60):
+        """Initialize the adapter"""
+        self.database = database
+        self.loop = loop
+        self.timeout = timeout
+    
+    def __getattr__(self, name):
+        method = getattr(self.database, name)
+        if not inspect.iscoroutinefunction(method):
+            return method
+        
+        def call(*args, **kwargs):
+            future = asyncio.run_coroutine_threadsafe(method(*args, **kwargs), self.loop)
+            return future.result(self.timeout)
+        return call
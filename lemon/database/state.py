@@ -0,0 +1,330 @@
+import os
+import json
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+from lemon.utils.cache import TTLCache
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Shared state configuration
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", 50000))
+
+# Seconds write-behind stores buffer writes before flushing them in one batch
+FLUSH_INTERVAL = 1
+
+# Seconds values read from a write-behind store's backend stay cached locally
+LOAD_TTL = 60
+
+def state_key(*parts):
+    """Build a state key, e.g. state_key(chat_id, user_id)"""
+    return ":".join(str(part) for part in parts)
+
+class StateStore(ABC):
+    """Key-value store for short-lived state, namespaced and with TTL semantics
+
+    Keys are strings and values must be JSON or BSON serializable for the
+    persistent backends. Subclasses implement the batch operations, single
+    key operations are built on top of them.
+    """
+
+    @abstractmethod
+    async def get_many(self, namespace, keys) -> dict:
+        """Get the unexpired values of keys, missing keys are left out"""
+
+    @abstractmethod
+    async def set_many(self, namespace, items, ttl) -> None:
+        """Store a dict of values that expire after ttl seconds"""
+
+    @abstractmethod
+    async def delete(self, namespace, *keys) -> None:
+        """Delete values"""
+
+    async def get(self, namespace, key, default=None):
+        """Get a value"""
+        return (await self.get_many(namespace, [key])).get(key, default)
+
+    async def set(self, namespace, key, value, ttl) -> None:
+        """Store a value that expires after ttl seconds"""
+        await self.set_many(namespace, {key: value}, ttl)
+
+class MemoryStateStore(StateStore):
+    """In-process store, state is lost on restart and not shared between processes"""
+
+    def __init__(self, maxsize=STATE_CACHE_SIZE):
+        """Initialize the store"""
+        self.maxsize = maxsize
+        self._namespaces = {}
+
+    def _cache(self, namespace):
+        cache = self._namespaces.get(namespace)
+        if cache is None:
+            cache = self._namespaces[namespace] = TTLCache(maxsize=self.maxsize)
+        return cache
+
+    async def get(self, namespace, key, default=None):
+        return self._cache(namespace).get(key, default)
+
+    async def get_many(self, namespace, keys) -> dict:
+        cache = self._cache(namespace)
+        found = {}
+        for key in keys:
+            value = cache.get(key, self)
+            if value is not self:
+                found[key] = value
+        return found
+
+    async def set(self, namespace, key, value, ttl) -> None:
+        self._cache(namespace).set(key, value, ttl=ttl)
+
+    async def set_many(self, namespace, items, ttl) -> None:
+        cache = self._cache(namespace)
+        for key, value in items.items():
+            cache.set(key, value, ttl=ttl)
+
+    async def delete(self, namespace, *keys) -> None:
+        cache = self._cache(namespace)
+        for key in keys:
+            cache.pop(key)
+
+    def stats(self) -> dict:
+        """Get cache statistics per namespace"""
+        return {namespace: cache.stats() for namespace, cache in self._namespaces.items()}
+
+class MongoStateStore(StateStore):
+    """Persistent store in the state collection, expired documents are removed by a TTL index"""
+
+    def __init__(self, database=None):
+        """Initialize the store"""
+        if database is None:
+            from lemon.database import db as database
+        self.db = database
+
+    async def get_many(self, namespace, keys) -> dict:
+        return await self.db.get_state(namespace, list(keys))
+
+    async def set_many(self, namespace, items, ttl) -> None:
+        await self.db.set_state(namespace, items, ttl)
+
+    async def delete(self, namespace, *keys) -> None:
+        await self.db.delete_state(namespace, list(keys))
+
+class RedisStateStore(StateStore):
+    """Persistent store on a Redis-compatible server, spoken to over RESP
+
+    Commands of a batch are pipelined on a single connection, values are
+    stored as JSON with a millisecond expiry.
+    """
+
+    def __init__(self, url=STATE_REDIS_URL, prefix="lemon"):
+        """Initialize the store"""
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.strip("/") or 0)
+        self.prefix = prefix
+
+        # Created on first use so they bind to the event loop running the handlers
+        self._lock = None
+        self._reader = None
+        self._writer = None
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    @staticmethod
+    def _encode(*args):
+        """Encode a command as a RESP array of bulk strings"""
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        """Read one RESP reply"""
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by state server")
+
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RuntimeError(f"State server error: {payload.decode()}")
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from state server: {line!r}")
+
+    async def _execute(self, *commands):
+        """Pipeline commands over the connection and return their replies"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                setup = []
+                if self.password:
+                    setup.append(("AUTH", self.password))
+                if self.database:
+                    setup.append(("SELECT", self.database))
+                commands = tuple(setup) + commands
+            else:
+                setup = []
+
+            try:
+                self._writer.write(b"".join(self._encode(*command) for command in commands))
+                await self._writer.drain()
+                replies = [await self._read_reply() for _ in commands]
+            except BaseException:
+                # A reply left unread, by an error or a cancellation, would be taken
+                # for the next command's, so reconnect on the next call
+                self._writer.close()
+                self._reader = self._writer = None
+                raise
+
+            return replies[len(setup):]
+
+    async def get_many(self, namespace, keys) -> dict:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        [values] = await self._execute(("MGET", *(self._key(namespace, key) for key in keys)))
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    async def set_many(self, namespace, items, ttl) -> None:
+        if not items:
+            return
+
+        milliseconds = max(int(ttl * 1000), 1)
+        await self._execute(*(
+            ("SET", self._key(namespace, key), json.dumps(value), "PX", milliseconds)
+            for key, value in items.items()
+        ))
+
+    async def delete(self, namespace, *keys) -> None:
+        if keys:
+            await self._execute(("DEL", *(self._key(namespace, key) for key in keys)))
+
+class WriteBehindStore(StateStore):
+    """Local cache in front of a persistent store for state touched on every message
+
+    Writes land in memory right away and are flushed to the backend in one
+    batch per namespace every FLUSH_INTERVAL seconds. Reads are served
+    locally and only go to the backend for keys not seen recently.
+    """
+
+    def __init__(self, backend, maxsize=STATE_CACHE_SIZE, flush_interval=FLUSH_INTERVAL):
+        """Initialize the store"""
+        self.backend = backend
+        self.local = MemoryStateStore(maxsize)
+        self.flush_interval = flush_interval
+
+        # (namespace, key) -> (value, ttl), a value of None marks a deletion
+        self._pending = {}
+        self._flush_task = None
+
+    async def get_many(self, namespace, keys) -> dict:
+        found = {}
+        missing = []
+        for key in keys:
+            if (namespace, key) in self._pending:
+                value, _ = self._pending[(namespace, key)]
+                if value is not None:
+                    found[key] = value
+                continue
+
+            value = await self.local.get(namespace, key, self)
+            if value is self:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            loaded = await self.backend.get_many(namespace, missing)
+            await self.local.set_many(namespace, loaded, LOAD_TTL)
+            found.update(loaded)
+        return found
+
+    async def set_many(self, namespace, items, ttl) -> None:
+        await self.local.set_many(namespace, items, ttl)
+        for key, value in items.items():
+            self._pending[(namespace, key)] = (value, ttl)
+        self._schedule_flush()
+
+    async def delete(self, namespace, *keys) -> None:
+        await self.local.delete(namespace, *keys)
+        for key in keys:
+            self._pending[(namespace, key)] = (None, None)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # A task rather than a timer, so draining the loop on shutdown flushes too
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write buffered changes to the backend"""
+        pending, self._pending = self._pending, {}
+
+        # Group writes so each namespace and TTL takes a single round trip
+        writes = {}
+        deletes = {}
+        for (namespace, key), (value, ttl) in pending.items():
+            if value is None:
+                deletes.setdefault(namespace, []).append(key)
+            else:
+                writes.setdefault((namespace, ttl), {})[key] = value
+
+        try:
+            for (namespace, ttl), items in writes.items():
+                await self.backend.set_many(namespace, items, ttl)
+            for namespace, keys in deletes.items():
+                await self.backend.delete(namespace, *keys)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(pending)} state changes: {e}")
+
+def create_state_store(backend=STATE_BACKEND):
+    """Create the state store for a backend name, memory, mongo or redis"""
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "mongo":
+        return MongoStateStore()
+    if backend == "redis":
+        return RedisStateStore()
+    raise ValueError(f"Unknown state backend {backend}, expected memory, mongo or redis")
+
+def hot_path(store):
+    """Get a store suitable for state touched on every message"""
+    if isinstance(store, MemoryStateStore):
+        return store
+    return WriteBehindStore(store)
+
+# Shared state store
+state = create_state_store()
@@ -2,12 +2,17 @@ import os
 import json
 import logging
 from pathlib import Path
+from string import Formatter
+from types import MappingProxyType
 
 logger = logging.getLogger(__name__)
 
 # Default language
 DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "en")
 
+# Language every other one falls back to last
+BASE_LANGUAGE = "en"
+
 # Available languages
 LANGUAGES = {
     "en": "English",
@@ -22,65 +27,167 @@ LANGUAGES = {
     "bn": "বাংলা"
 }
 
-# Language data cache
-_language_data = {}
-
-def load_language_file(lang_code):
-    """Load language data from file"""
-    try:
-        # Get the directory of the current file
-        current_dir = Path(__file__).parent
-        
-        # Construct path to language file
-        lang_file = current_dir / f"{lang_code}.json"
-        
-        # If language file doesn't exist, use English
-        if not lang_file.exists():
-            if lang_code != "en":
-                logger.warning(f"Language file for {lang_code} not found, using English")
-                return load_language_file("en")
-            else:
-                logger.error("English language file not found")
-                return {}
-        
-        # Load language data from file
-        with open(lang_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    
-    except Exception as e:
-        logger.error(f"Error loading language file: {e}")
-        return {}
+class Template:
+    """Translation text parsed once into literal and placeholder parts"""
+
+    __slots__ = ("text", "fields", "_compiled", "_plain")
+
+    def __init__(self, text):
+        """Parse the text, raises ValueError if it is not a valid format string"""
+        self.text = text
+        parts = list(Formatter().parse(text))
+        self.fields = tuple(field for _, field, _, _ in parts if field is not None)
+
+        # Text returned without substitutions, escaped braces resolved when nothing can be substituted
+        self._plain = "".join(literal for literal, _, _, _ in parts) if not self.fields else text
+
+        if not self.fields:
+            # Nothing to substitute
+            self._compiled = None
+        elif all(field.isidentifier() and not spec and conversion is None for _, field, spec, conversion in parts if field is not None):
+            # Plain placeholders become a printf-style template, which skips parsing on render
+            self._compiled = "".join(
+                literal.replace("%", "%%") + (f"%({field})s" if field is not None else "")
+                for literal, field, _, _ in parts
+            )
+        else:
+            # Indexing, attributes or format specs are left to str.format
+            self._compiled = ""
+
+    @classmethod
+    def literal(cls, text):
+        """Build a template that is never formatted"""
+        template = cls("")
+        template.text = template._plain = text
+        return template
+
+    def format(self, **kwargs):
+        """Substitute the placeholders, missing ones leave the text unformatted"""
+        if self._compiled is None or not kwargs:
+            return self._plain
+
+        try:
+            if self._compiled:
+                return self._compiled % kwargs
+            return self.text.format(**kwargs)
+        except KeyError as e:
+            logger.error(f"Error formatting text: {e}")
+            return self.text
+
+class Catalogue:
+    """Immutable translations of every language, fallbacks resolved at build time
+
+    Each language falls back to the default language and then to English key
+    by key, so a lookup is a single dict hit on (language, key).
+    """
+
+    def __init__(self, entries, languages, missing, invalid):
+        self._entries = MappingProxyType(entries)
+        self.languages = MappingProxyType(languages)
+        self.missing = MappingProxyType(missing)
+        self.invalid = MappingProxyType(invalid)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, lang_code, key):
+        """Get the template of a key, or None"""
+        return self._entries.get((lang_code, key))
+
+    def missing_key_report(self):
+        """Get a readable report of keys served by a fallback language and unparsable texts"""
+        lines = []
+        for lang_code, keys in sorted(self.missing.items()):
+            lines.append(f"{lang_code}: {len(keys)} missing keys: {', '.join(keys)}")
+        for lang_code, keys in sorted(self.invalid.items()):
+            lines.append(f"{lang_code}: {len(keys)} invalid templates: {', '.join(keys)}")
+        return "\n".join(lines) or "All translations are complete"
+
+def load_language_files(directory):
+    """Load every language file in a directory at once, by language code"""
+    data = {}
+    for lang_file in sorted(Path(directory).glob("*.json")):
+        try:
+            with open(lang_file, "r", encoding="utf-8") as f:
+                data[lang_file.stem.lower()] = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading language file {lang_file.name}: {e}")
+    return data
+
+def fallback_chain(lang_code):
+    """Get the languages a language falls back to, in order"""
+    return list(dict.fromkeys([lang_code, DEFAULT_LANGUAGE, BASE_LANGUAGE]))
+
+def build_catalogue(directory=Path(__file__).parent):
+    """Compile the language files of a directory into a catalogue"""
+    files = load_language_files(directory)
+    if BASE_LANGUAGE not in files:
+        logger.error("English language file not found")
+
+    # Parse every text once, texts that can't be parsed are kept as literals
+    parsed = {}
+    invalid = {}
+    for lang_code, texts in files.items():
+        parsed[lang_code] = {}
+        for key, text in texts.items():
+            try:
+                parsed[lang_code][key] = Template(text)
+            except ValueError:
+                invalid.setdefault(lang_code, []).append(key)
+                parsed[lang_code][key] = Template.literal(text)
+
+    all_keys = sorted(set().union(*(texts.keys() for texts in parsed.values())))
+    entries = {}
+    languages = {}
+    missing = {}
+
+    for lang_code in dict.fromkeys([*LANGUAGES, *parsed]):
+        chain = [code for code in fallback_chain(lang_code) if code in parsed]
+        resolved = {}
+        for key in all_keys:
+            for code in chain:
+                if key in parsed[code]:
+                    resolved[key] = parsed[code][key]
+                    break
+            if key not in parsed.get(lang_code, {}):
+                missing.setdefault(lang_code, []).append(key)
+
+        for key, template in resolved.items():
+            entries[(lang_code, key)] = template
+        languages[lang_code] = MappingProxyType({key: template.text for key, template in resolved.items()})
+
+    # No language given means the default one
+    for key in all_keys:
+        template = entries.get((DEFAULT_LANGUAGE, key)) or entries.get((BASE_LANGUAGE, key))
+        if template is not None:
+            entries[(None, key)] = template
+
+    # Languages without any file are reported once rather than key by key
+    for lang_code in LANGUAGES:
+        if lang_code not in parsed:
+            missing[lang_code] = ["(no language file)"]
+
+    return Catalogue(entries, languages, missing, invalid)
+
+# Translations of all languages, compiled at startup
+CATALOGUE = build_catalogue()
+if CATALOGUE.missing or CATALOGUE.invalid:
+    logger.info(f"Translation report:\n{CATALOGUE.missing_key_report()}")
 
 def get_language_data(lang_code=None):
     """Get language data for the specified language code"""
-    global _language_data
-    
-    # Use default language if none specified
-    if not lang_code:
-        lang_code = DEFAULT_LANGUAGE
-    
-    # Normalize language code
-    lang_code = lang_code.lower()
-    
-    # Load language data if not cached
-    if lang_code not in _language_data:
-        _language_data[lang_code] = load_language_file(lang_code)
-    
-    return _language_data[lang_code]
+    lang_code = (lang_code or DEFAULT_LANGUAGE).lower()
+    languages = CATALOGUE.languages
+    return languages.get(lang_code) or languages.get(DEFAULT_LANGUAGE) or languages.get(BASE_LANGUAGE, {})
 
 def get_text(key, lang_code=None, **kwargs):
     """Get text for the specified key in the specified language"""
-    # Get language data
-    lang_data = get_language_data(lang_code)
-    
-    # Get text for key
-    text = lang_data.get(key, key)
-    
-    # Format text with kwargs
-    if kwargs:
-        try:
-            text = text.format(**kwargs)
-        except KeyError as e:
-            logger.error(f"Error formatting text: {e}")
-    
-    return text
\ No newline at end of file
+    template = CATALOGUE.get(lang_code, key)
+
+    if template is None:
+        # Language codes the catalogue doesn't know as given, e.g. "EN" or "pt-br"
+        template = CATALOGUE.get(lang_code.lower() if lang_code else None, key) or CATALOGUE.get(None, key)
+        if template is None:
+            return key
+
+    return template.format(**kwargs)
@@ -1,31 +1,70 @@
-# Import all modules
-from lemon.modules import (
-    admin,
-    antiflood,
-    captcha,
-    filters,
-    notes,
-    start,
-    warns,
-    approval,
-    federation,
-    greetings,
-    cleaning,
-    settings
-)
-
-# Collect all handlers
-ALL_HANDLERS = [
-    admin.HANDLERS,
-    antiflood.HANDLERS,
-    captcha.HANDLERS,
-    filters.HANDLERS,
-    notes.HANDLERS,
-    start.HANDLERS,
-    warns.HANDLERS,
-    approval.HANDLERS,
-    federation.HANDLERS,
-    greetings.HANDLERS,
-    cleaning.HANDLERS,
-    settings.HANDLERS
-]
\ No newline at end of file
+import time
+import logging
+import importlib
+
+from lemon.modules.manifest import MANIFEST, lazy_stage
+
+logger = logging.getLogger(__name__)
+
+# Modules in the order their handlers are registered
+MODULES = [
+    "admin",
+    "antiflood",
+    "captcha",
+    "filters",
+    "notes",
+    "start",
+    "warns",
+    "approval",
+    "federation",
+    "greetings",
+    "cleaning",
+    "settings"
+]
+
+# Handler groups of modules that must also see updates handled by an earlier module, others use group 0.
+# Only the first matching handler of a group runs, e.g. captcha, greetings and cleaning all handle joins.
+HANDLER_GROUPS = {
+    "greetings": 1,
+    "cleaning": 2
+}
+
+# Stages run in order on every text message by the message pipeline, as (module, function)
+MESSAGE_STAGES = [
+    ("antiflood", "check_flood"),
+    ("captcha", "captcha_input"),
+    ("filters", "handle_filters"),
+    ("notes", "get_note")
+]
+
+def load_modules(lazy_modules=()):
+    """Import the modules and collect their handlers and message stages
+
+    Modules named in lazy_modules that have a manifest are registered from
+    it and only imported once one of their handlers runs. Returns the
+    (group, handler list) pairs, the message stages and the import time of
+    each module.
+    """
+    all_handlers = []
+    import_times = {}
+    loaded = {}
+
+    for module_name in MODULES:
+        if module_name in lazy_modules and module_name in MANIFEST:
+            all_handlers.append((HANDLER_GROUPS.get(module_name, 0), MANIFEST[module_name]))
+            continue
+
+        started = time.perf_counter()
+        loaded[module_name] = importlib.import_module(f"lemon.modules.{module_name}")
+        import_times[module_name] = time.perf_counter() - started
+        all_handlers.append((HANDLER_GROUPS.get(module_name, 0), loaded[module_name].HANDLERS))
+
+    for module_name in lazy_modules:
+        if module_name not in MANIFEST:
+            logger.warning(f"Module {module_name} has no manifest and was loaded eagerly")
+
+    stages = [
+        getattr(loaded[module_name], function) if module_name in loaded else lazy_stage(module_name, function)
+        for module_name, function in MESSAGE_STAGES
+    ]
+    return all_handlers, stages, import_times
@@ -1,8 +1,9 @@
 from telegram import Update, ChatMember
-from telegram.ext import CommandHandler, CallbackContext, Filters
+from telegram.ext import CommandHandler, CallbackContext, ChatMemberHandler, Filters
 from telegram.error import BadRequest
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.utils.admins import apply_member_update, invalidate_admins
 from lemon.database import db
 
 # List all admins in the group
@@ -92,6 +93,7 @@ def promote(update: Update, context: CallbackContext) -> None:
             can_restrict_members=True,
             can_pin_messages=True
         )
+        invalidate_admins(chat.id)
         
         message.reply_text(f"Successfully promoted {user_name}!")
         
@@ -167,6 +169,7 @@ def demote(update: Update, context: CallbackContext) -> None:
             can_pin_messages=False,
             can_promote_members=False
         )
+        invalidate_admins(chat.id)
         
         message.reply_text(f"Successfully demoted {user_name}!")
         
@@ -280,6 +283,11 @@ def unpin_all(update: Update, context: CallbackContext) -> None:
     except BadRequest as e:
         message.reply_text(f"Error: {e.message}")
 
+# Track admin changes
+def admin_cache_update(update: Update, context: CallbackContext) -> None:
+    """Keep the cached admin roster in sync with chat member updates"""
+    apply_member_update(update.chat_member or update.my_chat_member)
+
 # Define handlers
 HANDLERS = [
     CommandHandler("adminlist", admin_list, filters=~Filters.private),
@@ -287,5 +295,6 @@ HANDLERS = [
     CommandHandler("demote", demote, filters=~Filters.private),
     CommandHandler("pin", pin, filters=~Filters.private),
     CommandHandler("unpin", unpin, filters=~Filters.private),
-    CommandHandler("unpinall", unpin_all, filters=~Filters.private)
+    CommandHandler("unpinall", unpin_all, filters=~Filters.private),
+    ChatMemberHandler(admin_cache_update, ChatMemberHandler.ANY_CHAT_MEMBER)
 ]
\ No newline at end of file
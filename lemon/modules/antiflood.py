@@ -1,41 +1,80 @@
-import os
 from telegram import Update, ChatPermissions
-from telegram.ext import CommandHandler, CallbackContext, MessageHandler, Filters as TgFilters
+from telegram.ext import CommandHandler, CallbackContext, Filters as TgFilters
 from telegram.error import BadRequest
 import time
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.utils.admins import check_user_admin
+from lemon.core.scheduler import api_call, BULK
 from lemon.database import db
+from lemon.database.state import state, state_key, hot_path
 
 # Default flood settings
 DEFAULT_FLOOD_LIMIT = 5
 DEFAULT_FLOOD_MODE = "mute"
 DEFAULT_FLOOD_TIME = 300  # 5 minutes
+DEFAULT_FLOOD_WINDOW = 10  # Seconds in which the limit applies
 
-# Store user message counts
-flood_data = {}
+# Highest flood limit /setflood accepts
+MAX_FLOOD_LIMIT = 100
+
+# Buckets a flood window is split into, the precision of the window
+FLOOD_BUCKETS = 10
+
+class FloodTracker:
+    """Sliding-window message rate tracking per (chat, user)
+    
+    Each user keeps message counts in a fixed ring of ``buckets`` time
+    buckets covering the window, along with the newest bucket written. A hit
+    clears the buckets that went stale, bumps the current one and sums the
+    ring, so its cost and size don't depend on the limit. The counts live in
+    the shared state store and expire once the window has passed without
+    messages.
+    """
+    
+    def __init__(self, store, buckets=FLOOD_BUCKETS):
+        """Initialize the tracker"""
+        self.store = store
+        self.buckets = buckets
+    
+    async def hit(self, chat_id, user_id, limit, window) -> bool:
+        """Record a message and check if the user sent limit messages within window seconds"""
+        key = state_key(chat_id, user_id)
+        bucket = int(time.time() * self.buckets / window)
+        
+        entry = await self.store.get("flood", key)
+        if entry is None or not 0 <= bucket - entry[0] < self.buckets:
+            # Nothing recent, or the window setting changed
+            counts = [0] * self.buckets
+        else:
+            last, counts = entry
+            for stale in range(last + 1, bucket + 1):
+                counts[stale % self.buckets] = 0
+        
+        counts[bucket % self.buckets] += 1
+        await self.store.set("flood", key, [bucket, counts], window)
+        
+        return sum(counts) >= limit
+    
+    async def reset(self, chat_id, user_id) -> None:
+        """Forget the recent messages of a user"""
+        await self.store.delete("flood", state_key(chat_id, user_id))
+
+# Store user message counts, buffered locally as they change on every message
+flood_data = FloodTracker(hot_path(state))
 
 # Check for flooding
-async def check_flood(update: Update, context: CallbackContext) -> None:
-    """Check if a user is flooding the chat"""
+async def check_flood(update: Update, context: CallbackContext, chat_data: dict) -> bool:
+    """Check if a user is flooding the chat, returns True if action was taken"""
     chat = update.effective_chat
     user = update.effective_user
     message = update.effective_message
     
     # Skip in private chats
     if chat.type == "private":
-        return
-    
-    # Skip for admins
-    try:
-        member = chat.get_member(user.id)
-        if member.status in ["administrator", "creator"]:
-            return
-    except BadRequest:
-        return
+        return False
     
     # Get chat settings
-    chat_data = await db.get_chat(chat.id) or {}
     flood_settings = chat_data.get("flood", {})
     
     # Get flood limit
@@ -43,47 +82,38 @@ async def check_flood(update: Update, context: CallbackContext) -> None:
     
     # Skip if flood protection is disabled
     if flood_limit <= 0:
-        return
+        return False
+    
+    # Skip for admins
+    try:
+        if await check_user_admin(context, chat.id, user.id):
+            return False
+    except BadRequest:
+        return False
     
     # Get flood mode
     flood_mode = flood_settings.get("mode", DEFAULT_FLOOD_MODE)
     flood_time = flood_settings.get("time", DEFAULT_FLOOD_TIME)
-    
-    # Initialize flood data for chat if not exists
-    if chat.id not in flood_data:
-        flood_data[chat.id] = {}
-    
-    # Initialize flood data for user if not exists
-    if user.id not in flood_data[chat.id]:
-        flood_data[chat.id][user.id] = {
-            "count": 0,
-            "last_msg_time": time.time()
-        }
-    
-    # Reset count if more than 5 seconds since last message
-    if time.time() - flood_data[chat.id][user.id]["last_msg_time"] > 5:
-        flood_data[chat.id][user.id]["count"] = 0
-    
-    # Update flood data
-    flood_data[chat.id][user.id]["count"] += 1
-    flood_data[chat.id][user.id]["last_msg_time"] = time.time()
+    flood_window = flood_settings.get("window", DEFAULT_FLOOD_WINDOW)
     
     # Check if user has exceeded flood limit
-    if flood_data[chat.id][user.id]["count"] >= flood_limit:
+    if await flood_data.hit(chat.id, user.id, flood_limit, flood_window):
         # Reset flood count
-        flood_data[chat.id][user.id]["count"] = 0
+        await flood_data.reset(chat.id, user.id)
         
         # Apply flood action
         try:
             if flood_mode == "ban":
-                chat.kick_member(user.id)
-                message.reply_text(f"{user.first_name} has been banned for flooding.")
+                await api_call(context, chat.kick_member, user.id)
+                await api_call(context, message.reply_text, f"{user.first_name} has been banned for flooding.")
             elif flood_mode == "kick":
-                chat.kick_member(user.id)
-                chat.unban_member(user.id)
-                message.reply_text(f"{user.first_name} has been kicked for flooding.")
+                await api_call(context, chat.kick_member, user.id)
+                await api_call(context, chat.unban_member, user.id)
+                await api_call(context, message.reply_text, f"{user.first_name} has been kicked for flooding.")
             elif flood_mode == "mute":
-                chat.restrict_member(
+                await api_call(
+                    context,
+                    chat.restrict_member,
                     user.id,
                     permissions=ChatPermissions(
                         can_send_messages=False,
@@ -93,22 +123,32 @@ async def check_flood(update: Update, context: CallbackContext) -> None:
                     ),
                     until_date=time.time() + flood_time
                 )
-                message.reply_text(
+                await api_call(
+                    context,
+                    message.reply_text,
                     f"{user.first_name} has been muted for {flood_time // 60} minutes for flooding."
                 )
             
             # Log the action
-            if context.bot.log_channel:
-                context.bot.send_message(
-                    chat_id=context.bot.log_channel,
+            log_channel = context.bot_data.get("log_channel")
+            if log_channel:
+                await api_call(
+                    context,
+                    context.bot.send_message,
+                    chat_id=log_channel,
+                    priority=BULK,
                     text=f"#FLOOD_CONTROL\n"
                          f"User: {user.first_name} (ID: {user.id})\n"
                          f"Chat: {chat.title} (ID: {chat.id})\n"
                          f"Action: {flood_mode.capitalize()}\n"
-                         f"Flood limit: {flood_limit} messages"
+                         f"Flood limit: {flood_limit} messages in {flood_window} seconds"
                 )
         except BadRequest as e:
-            message.reply_text(f"Error applying flood action: {e.message}")
+            await api_call(context, message.reply_text, f"Error applying flood action: {e.message}")
+        
+        return True
+    
+    return False
 
 # Set flood limit
 @send_typing
@@ -120,7 +160,7 @@ async def set_flood(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if command has arguments
@@ -132,18 +172,19 @@ async def set_flood(update: Update, context: CallbackContext) -> None:
         flood_limit = flood_settings.get("limit", DEFAULT_FLOOD_LIMIT)
         flood_mode = flood_settings.get("mode", DEFAULT_FLOOD_MODE)
         flood_time = flood_settings.get("time", DEFAULT_FLOOD_TIME)
+        flood_window = flood_settings.get("window", DEFAULT_FLOOD_WINDOW)
         
         if flood_limit <= 0:
-            message.reply_text("Flood control is currently disabled in this chat.")
+            await api_call(context, message.reply_text, "Flood control is currently disabled in this chat.")
         else:
-            message.reply_text(
+            await api_call(context, message.reply_text,
                 f"Current flood settings:\n"
-                f"Limit: {flood_limit} messages\n"
+                f"Limit: {flood_limit} messages in {flood_window} seconds\n"
                 f"Mode: {flood_mode}\n"
                 f"Time (for mute): {flood_time // 60} minutes\n\n"
                 f"To change settings, use:\n"
-                f"/setflood [limit] [mode] [time]\n"
-                f"Example: /setflood 5 mute 300\n"
+                f"/setflood [limit] [mode] [time] [window]\n"
+                f"Example: /setflood 5 mute 300 10\n"
                 f"Set limit to 0 to disable flood control."
             )
         return
@@ -154,7 +195,10 @@ async def set_flood(update: Update, context: CallbackContext) -> None:
         
         # Check if limit is valid
         if flood_limit < 0:
-            message.reply_text("Flood limit must be 0 or higher.")
+            await api_call(context, message.reply_text, "Flood limit must be 0 or higher.")
+            return
+        if flood_limit > MAX_FLOOD_LIMIT:
+            await api_call(context, message.reply_text, f"Flood limit can be at most {MAX_FLOOD_LIMIT}.")
             return
         
         # Get mode if provided
@@ -174,6 +218,16 @@ async def set_flood(update: Update, context: CallbackContext) -> None:
             except ValueError:
                 pass
         
+        # Get window if provided
+        flood_window = DEFAULT_FLOOD_WINDOW
+        if len(context.args) > 3:
+            try:
+                flood_window = int(context.args[3])
+                if flood_window < 1:
+                    flood_window = 1  # Minimum 1 second
+            except ValueError:
+                pass
+        
         # Update chat settings
         chat_data = await db.get_chat(chat.id) or {}
         if "flood" not in chat_data:
@@ -182,20 +236,21 @@ async def set_flood(update: Update, context: CallbackContext) -> None:
         chat_data["flood"]["limit"] = flood_limit
         chat_data["flood"]["mode"] = flood_mode
         chat_data["flood"]["time"] = flood_time
+        chat_data["flood"]["window"] = flood_window
         
         await db.update_chat(chat.id, chat_data)
         
         if flood_limit == 0:
-            message.reply_text("Flood control has been disabled in this chat.")
+            await api_call(context, message.reply_text, "Flood control has been disabled in this chat.")
         else:
-            message.reply_text(
+            await api_call(context, message.reply_text,
                 f"Flood settings updated:\n"
-                f"Limit: {flood_limit} messages\n"
+                f"Limit: {flood_limit} messages in {flood_window} seconds\n"
                 f"Mode: {flood_mode}\n"
                 f"Time (for mute): {flood_time // 60} minutes"
             )
     except ValueError:
-        message.reply_text("Please provide a valid number for the flood limit.")
+        await api_call(context, message.reply_text, "Please provide a valid number for the flood limit.")
 
 # Get flood settings
 @send_typing
@@ -205,7 +260,7 @@ async def get_flood(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get current settings
@@ -215,13 +270,14 @@ async def get_flood(update: Update, context: CallbackContext) -> None:
     flood_limit = flood_settings.get("limit", DEFAULT_FLOOD_LIMIT)
     flood_mode = flood_settings.get("mode", DEFAULT_FLOOD_MODE)
     flood_time = flood_settings.get("time", DEFAULT_FLOOD_TIME)
+    flood_window = flood_settings.get("window", DEFAULT_FLOOD_WINDOW)
     
     if flood_limit <= 0:
-        message.reply_text("Flood control is currently disabled in this chat.")
+        await api_call(context, message.reply_text, "Flood control is currently disabled in this chat.")
     else:
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"Current flood settings:\n"
-            f"Limit: {flood_limit} messages\n"
+            f"Limit: {flood_limit} messages in {flood_window} seconds\n"
             f"Mode: {flood_mode}\n"
             f"Time (for mute): {flood_time // 60} minutes"
         )
@@ -229,6 +285,5 @@ async def get_flood(update: Update, context: CallbackContext) -> None:
 # Define handlers
 HANDLERS = [
     CommandHandler("setflood", set_flood, filters=~TgFilters.private),
-    CommandHandler("flood", get_flood, filters=~TgFilters.private),
-    MessageHandler(TgFilters.text & ~TgFilters.command & ~TgFilters.private, check_flood)
+    CommandHandler("flood", get_flood, filters=~TgFilters.private)
 ]
\ No newline at end of file
@@ -1,31 +1,40 @@
 import os
 import time
-import random
-import string
+import asyncio
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
-from captcha.image import ImageCaptcha
 from telegram import Update, ChatPermissions, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler, Filters as TgFilters, MessageHandler
 from telegram.error import BadRequest
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.core.scheduler import api_call, BULK
 from lemon.database import db
+from lemon.database.state import state, state_key
+from lemon.utils.captcha_pool import captcha_pool
+from lemon.utils.raid import JoinRateMonitor, JoinBatcher, Sweeper, join_names, kick_member
 
-# Store captcha data
-captcha_data = {}
+# Seconds pending CAPTCHA data outlives its timeout, so the timeout job still finds it
+CAPTCHA_GRACE = 60
 
-# Generate a random captcha code
-def generate_captcha_code(length=6):
-    """Generate a random captcha code"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+def captcha_ttl(captcha_info):
+    """Get the seconds left before pending CAPTCHA data can expire"""
+    return max(captcha_info["time"] + captcha_info["timeout"] + CAPTCHA_GRACE - time.time(), 1)
 
-# Generate a captcha image
-def generate_captcha_image(text):
-    """Generate a captcha image"""
-    image = ImageCaptcha(width=280, height=90)
-    data = image.generate(text)
-    return BytesIO(data.read())
+# Permissions of members until they solve the CAPTCHA
+RESTRICTED = ChatPermissions(
+    can_send_messages=False,
+    can_send_media_messages=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False
+)
+
+# Permissions given back once the CAPTCHA is solved
+UNRESTRICTED = ChatPermissions(
+    can_send_messages=True,
+    can_send_media_messages=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True
+)
 
 # Handle new chat members
 async def new_chat_member(update: Update, context: CallbackContext) -> None:
@@ -49,44 +58,38 @@ async def new_chat_member(update: Update, context: CallbackContext) -> None:
     # Get CAPTCHA timeout
     captcha_timeout = captcha_settings.get("timeout", 300)  # Default 5 minutes
     
+    # Skip the bot itself
+    new_members = [member for member in message.new_chat_members if member.id != context.bot.id]
+    
+    # During a raid new members share one CAPTCHA per batch
+    if join_monitor.record(chat.id, len(new_members)):
+        await join_batcher.add(context, message, new_members)
+        return
+    
     # Process each new member
-    for new_member in message.new_chat_members:
-        # Skip if the new member is the bot itself
-        if new_member.id == context.bot.id:
+    for new_member in new_members:
+        # Take a pre-rendered CAPTCHA first, so nobody is restricted without one to solve
+        try:
+            captcha_code, captcha_png = await captcha_pool.get()
+        except Exception as e:
+            print(f"Error getting CAPTCHA: {e}")
             continue
         
         # Restrict the user
         try:
-            chat.restrict_member(
-                new_member.id,
-                permissions=ChatPermissions(
-                    can_send_messages=False,
-                    can_send_media_messages=False,
-                    can_send_other_messages=False,
-                    can_add_web_page_previews=False
-                )
-            )
+            await api_call(context, chat.restrict_member, new_member.id, permissions=RESTRICTED)
         except BadRequest as e:
             # Log the error but continue
             print(f"Error restricting user: {e}")
             continue
         
-        # Generate CAPTCHA code
-        captcha_code = generate_captcha_code()
-        
-        # Store CAPTCHA data
-        if chat.id not in captcha_data:
-            captcha_data[chat.id] = {}
-        
-        captcha_data[chat.id][new_member.id] = {
+        # CAPTCHA data, stored once the message is sent
+        captcha_info = {
             "code": captcha_code,
             "time": time.time(),
             "timeout": captcha_timeout
         }
         
-        # Generate CAPTCHA image
-        captcha_image = generate_captcha_image(captcha_code)
-        
         # Create keyboard with verify button
         keyboard = [
             [InlineKeyboardButton("Verify", callback_data=f"captcha_{new_member.id}")]
@@ -95,61 +98,151 @@ async def new_chat_member(update: Update, context: CallbackContext) -> None:
         
         # Send CAPTCHA message
         try:
-            sent_message = message.reply_photo(
-                photo=captcha_image,
+            sent_message = await api_call(context, message.reply_photo,
+                photo=BytesIO(captcha_png),
                 caption=f"Welcome {new_member.first_name}! Please solve this CAPTCHA to verify you're human.\n"
                         f"You have {captcha_timeout // 60} minutes to complete this.",
                 reply_markup=reply_markup
             )
-            
-            # Store message ID for later deletion
-            captcha_data[chat.id][new_member.id]["message_id"] = sent_message.message_id
-            
-            # Schedule job to check CAPTCHA timeout
-            context.job_queue.run_once(
-                check_captcha_timeout,
-                captcha_timeout,
-                context={
-                    "chat_id": chat.id,
-                    "user_id": new_member.id,
-                    "message_id": sent_message.message_id
-                }
-            )
         except Exception as e:
             print(f"Error sending CAPTCHA: {e}")
+            await lift_restrictions(context, chat.id, [new_member])
+            continue
+        
+        # Store message ID for later deletion
+        captcha_info["message_id"] = sent_message.message_id
+        
+        # Check the CAPTCHA once it times out, scheduled first so a restricted member always has a deadline
+        captcha_sweeper.schedule(context.job_queue, (chat.id, new_member.id), captcha_timeout, captcha_info)
+        await state.set(
+            "captcha", state_key(chat.id, new_member.id), captcha_info, captcha_ttl(captcha_info)
+        )
+
+# Give members back their permissions when their CAPTCHA couldn't be sent
+async def lift_restrictions(context: CallbackContext, chat_id, members) -> None:
+    """Unrestrict members that were restricted for a CAPTCHA they never got"""
+    results = await asyncio.gather(*(
+        api_call(context, context.bot.restrict_chat_member, chat_id, member.id, permissions=UNRESTRICTED, priority=BULK)
+        for member in members
+    ), return_exceptions=True)
+    for member, result in zip(members, results):
+        if isinstance(result, Exception):
+            print(f"Error unrestricting user {member.id}: {result}")
+
+# Challenge a batch of members joining during a raid
+async def challenge_batch(context: CallbackContext, message, new_members) -> None:
+    """Restrict a batch of new members and send them one CAPTCHA to reply to"""
+    chat = message.chat
+    
+    # Settings may have changed while the batch was collected
+    chat_data = await db.get_chat(chat.id) or {}
+    captcha_timeout = chat_data.get("captcha", {}).get("timeout", 300)
+    
+    # Take the CAPTCHA first, so nobody is restricted without one to solve
+    try:
+        captcha_code, captcha_png = await captcha_pool.get()
+    except Exception as e:
+        print(f"Error getting CAPTCHA: {e}")
+        return
+    
+    # Restrict the whole batch as bulk work, members that can't be restricted aren't challenged
+    results = await asyncio.gather(*(
+        api_call(context, context.bot.restrict_chat_member, chat.id, member.id, permissions=RESTRICTED, priority=BULK)
+        for member in new_members
+    ), return_exceptions=True)
+    new_members = [member for member, result in zip(new_members, results) if not isinstance(result, Exception)]
+    if not new_members:
+        return
+    
+    # Send one CAPTCHA message for the batch
+    try:
+        sent_message = await api_call(
+            context,
+            message.reply_photo,
+            photo=BytesIO(captcha_png),
+            caption=f"Welcome {join_names([member.first_name for member in new_members])}! Please solve this CAPTCHA to verify you're human.\n"
+                    f"Reply to this message with the code within {captcha_timeout // 60} minutes."
+        )
+    except Exception as e:
+        print(f"Error sending CAPTCHA: {e}")
+        await lift_restrictions(context, chat.id, new_members)
+        return
+    
+    # Members answer the shared message directly, without pressing a button first
+    captcha_info = {
+        "code": captcha_code,
+        "time": time.time(),
+        "timeout": captcha_timeout,
+        "message_id": sent_message.message_id,
+        "waiting_input": True,
+        "batch": True
+    }
+    await state.set_many(
+        "captcha",
+        {state_key(chat.id, member.id): dict(captcha_info) for member in new_members},
+        captcha_ttl(captcha_info)
+    )
+    
+    # Members are cancelled as they solve it, the shared message expires on its own
+    for member in new_members:
+        captcha_sweeper.schedule(context.job_queue, (chat.id, member.id), captcha_timeout, dict(captcha_info))
+    captcha_sweeper.schedule(context.job_queue, (chat.id, "message", sent_message.message_id), captcha_timeout)
 
-# Check CAPTCHA timeout
-async def check_captcha_timeout(context: CallbackContext) -> None:
-    """Check if CAPTCHA has timed out"""
-    job = context.job
-    data = job.context
-    
-    chat_id = data["chat_id"]
-    user_id = data["user_id"]
-    message_id = data["message_id"]
-    
-    # Check if user has completed CAPTCHA
-    if chat_id in captcha_data and user_id in captcha_data[chat_id]:
-        # User has not completed CAPTCHA, kick them
+# Handle timed out CAPTCHAs
+async def expire_captchas(context: CallbackContext, expired) -> None:
+    """Kick members who didn't complete their CAPTCHA in time and remove the CAPTCHA messages"""
+    # Solved CAPTCHAs are cancelled, so every expired member is still pending
+    members = []
+    messages = set()
+    for key, captcha_info in expired:
+        if key[1] == "message":
+            messages.add((key[0], key[2]))
+        else:
+            members.append(key)
+            # A batch message is deleted by its own deadline
+            if not captcha_info.get("batch"):
+                messages.add((key[0], captcha_info["message_id"]))
+    
+    kicked = {}
+    calls = []
+    for chat_id, user_id in members:
+        kicked[chat_id] = kicked.get(chat_id, 0) + 1
+        calls.append(kick_member(context, chat_id, user_id))
+    
+    for chat_id, message_id in messages:
+        calls.append(api_call(context, context.bot.delete_message, chat_id, message_id, priority=BULK))
+    
+    for result in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"Error handling CAPTCHA timeout: {result}")
+    
+    if members:
+        await state.delete("captcha", *(state_key(chat_id, user_id) for chat_id, user_id in members))
+    
+    # Send one notification per chat
+    for chat_id, count in kicked.items():
+        text = (
+            "User was kicked for not completing CAPTCHA verification in time." if count == 1
+            else f"{count} users were kicked for not completing CAPTCHA verification in time."
+        )
         try:
-            # Kick the user
-            context.bot.kick_chat_member(chat_id, user_id)
-            context.bot.unban_chat_member(chat_id, user_id)  # Unban so they can rejoin
-            
-            # Delete CAPTCHA message
-            context.bot.delete_message(chat_id, message_id)
-            
-            # Send notification
-            context.bot.send_message(
-                chat_id=chat_id,
-                text=f"User was kicked for not completing CAPTCHA verification in time."
-            )
-            
-            # Remove CAPTCHA data
-            del captcha_data[chat_id][user_id]
+            await api_call(context, context.bot.send_message, chat_id=chat_id, text=text, priority=BULK)
         except Exception as e:
             print(f"Error handling CAPTCHA timeout: {e}")
 
+# Raid detection, batching of raid joins and CAPTCHA timeouts
+join_monitor = JoinRateMonitor()
+join_batcher = JoinBatcher(challenge_batch)
+captcha_sweeper = Sweeper(expire_captchas, "captcha")
+
+# Look up a pending CAPTCHA
+async def pending_captcha(chat_id, user_id):
+    """Get the CAPTCHA data of a member, from its deadline when the state store lost it in a restart"""
+    captcha_info = await state.get("captcha", state_key(chat_id, user_id))
+    if captcha_info is None:
+        captcha_info = captcha_sweeper.get((chat_id, user_id))
+    return None if captcha_info is None else dict(captcha_info)
+
 # Handle CAPTCHA button click
 async def captcha_button(update: Update, context: CallbackContext) -> None:
     """Handle CAPTCHA verification button click"""
@@ -160,96 +253,102 @@ async def captcha_button(update: Update, context: CallbackContext) -> None:
     # Extract user ID from callback data
     data = query.data.split("_")
     if len(data) != 2:
-        query.answer("Invalid CAPTCHA data.")
+        await api_call(context, query.answer, "Invalid CAPTCHA data.")
         return
     
     target_user_id = int(data[1])
     
     # Check if the user clicking is the one who needs to verify
     if user.id != target_user_id:
-        query.answer("This CAPTCHA is not for you.")
+        await api_call(context, query.answer, "This CAPTCHA is not for you.")
         return
     
     # Check if CAPTCHA data exists
-    if chat.id not in captcha_data or target_user_id not in captcha_data[chat.id]:
-        query.answer("CAPTCHA session expired or not found.")
+    key = state_key(chat.id, target_user_id)
+    captcha_info = await pending_captcha(chat.id, target_user_id)
+    if captcha_info is None:
+        await api_call(context, query.answer, "CAPTCHA session expired or not found.")
         return
     
     # Show CAPTCHA input dialog
-    query.answer()
-    query.edit_message_caption(
+    await api_call(context, query.answer)
+    await api_call(context, query.edit_message_caption,
         caption=f"Please enter the CAPTCHA code shown in the image.\n"
                 f"Reply to this message with the code."
     )
     
     # Update CAPTCHA data to indicate waiting for input
-    captcha_data[chat.id][target_user_id]["waiting_input"] = True
+    captcha_info["waiting_input"] = True
+    await state.set("captcha", key, captcha_info, captcha_ttl(captcha_info))
 
 # Handle CAPTCHA code input
-async def captcha_input(update: Update, context: CallbackContext) -> None:
-    """Handle CAPTCHA code input"""
+async def captcha_input(update: Update, context: CallbackContext, chat_data: dict) -> bool:
+    """Handle CAPTCHA code input, returns True if the message was a CAPTCHA answer"""
     message = update.effective_message
     chat = update.effective_chat
     user = update.effective_user
     
     # Skip if not replying to a message
     if not message.reply_to_message:
-        return
+        return False
     
     # Check if the replied message is from the bot
     if message.reply_to_message.from_user.id != context.bot.id:
-        return
+        return False
     
     # Check if the caption contains CAPTCHA text
     caption = message.reply_to_message.caption
     if not caption or "CAPTCHA" not in caption:
-        return
+        return False
     
     # Check if user has a pending CAPTCHA
-    if chat.id not in captcha_data or user.id not in captcha_data[chat.id]:
-        return
+    key = state_key(chat.id, user.id)
+    captcha_info = await pending_captcha(chat.id, user.id)
+    if captcha_info is None:
+        return False
     
     # Check if waiting for input
-    if not captcha_data[chat.id][user.id].get("waiting_input", False):
-        return
+    if not captcha_info.get("waiting_input", False):
+        return False
     
     # Get the entered code
     entered_code = message.text.strip().upper()
     
     # Get the correct code
-    correct_code = captcha_data[chat.id][user.id]["code"]
+    correct_code = captcha_info["code"]
     
     # Check if the code is correct
     if entered_code == correct_code:
         # Unrestrict the user
         try:
-            chat.restrict_member(
+            await api_call(context, chat.restrict_member,
                 user.id,
-                permissions=ChatPermissions(
-                    can_send_messages=True,
-                    can_send_media_messages=True,
-                    can_send_other_messages=True,
-                    can_add_web_page_previews=True
-                )
+                permissions=UNRESTRICTED
             )
             
-            # Delete CAPTCHA messages
-            message.reply_to_message.delete()
-            message.delete()
+            # Stop the timeout right away
+            captcha_sweeper.cancel((chat.id, user.id))
+            
+            # Delete CAPTCHA messages, a batch CAPTCHA is left to the other members
+            if not captcha_info.get("batch"):
+                await api_call(context, message.reply_to_message.delete)
+            await api_call(context, message.delete)
             
             # Send welcome message
-            context.bot.send_message(
+            await api_call(context, context.bot.send_message,
                 chat_id=chat.id,
                 text=f"Welcome {user.first_name}! You have been verified."
             )
             
             # Remove CAPTCHA data
-            del captcha_data[chat.id][user.id]
+            await state.delete("captcha", key)
         except Exception as e:
             print(f"Error completing CAPTCHA: {e}")
     else:
         # Wrong code
-        message.reply_text("Incorrect code. Please try again.")
+        await api_call(context, message.reply_text, "Incorrect code. Please try again.")
+    
+    return True
 
 # Enable/disable CAPTCHA
 @send_typing
@@ -261,7 +360,7 @@ async def set_captcha(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if command has arguments
@@ -274,14 +373,14 @@ async def set_captcha(update: Update, context: CallbackContext) -> None:
         captcha_timeout = captcha_settings.get("timeout", 300)
         
         if captcha_enabled:
-            message.reply_text(
+            await api_call(context, message.reply_text,
                 f"CAPTCHA is currently enabled in this chat.\n"
                 f"Timeout: {captcha_timeout // 60} minutes\n\n"
                 f"To disable, use: /setcaptcha off\n"
                 f"To change timeout, use: /setcaptcha timeout [seconds]"
             )
         else:
-            message.reply_text(
+            await api_call(context, message.reply_text,
                 f"CAPTCHA is currently disabled in this chat.\n\n"
                 f"To enable, use: /setcaptcha on\n"
                 f"To set timeout, use: /setcaptcha timeout [seconds]"
@@ -299,12 +398,13 @@ async def set_captcha(update: Update, context: CallbackContext) -> None:
     if arg == "on":
         chat_data["captcha"]["enabled"] = True
         await db.update_chat(chat.id, chat_data)
-        message.reply_text("CAPTCHA has been enabled in this chat.")
+        captcha_pool.warm()
+        await api_call(context, message.reply_text, "CAPTCHA has been enabled in this chat.")
     
     elif arg == "off":
         chat_data["captcha"]["enabled"] = False
         await db.update_chat(chat.id, chat_data)
-        message.reply_text("CAPTCHA has been disabled in this chat.")
+        await api_call(context, message.reply_text, "CAPTCHA has been disabled in this chat.")
     
     elif arg == "timeout" and len(context.args) > 1:
         try:
@@ -315,12 +415,12 @@ async def set_captcha(update: Update, context: CallbackContext) -> None:
             chat_data["captcha"]["timeout"] = timeout
             await db.update_chat(chat.id, chat_data)
             
-            message.reply_text(f"CAPTCHA timeout has been set to {timeout // 60} minutes.")
+            await api_call(context, message.reply_text, f"CAPTCHA timeout has been set to {timeout // 60} minutes.")
         except ValueError:
-            message.reply_text("Please provide a valid number for the timeout in seconds.")
+            await api_call(context, message.reply_text, "Please provide a valid number for the timeout in seconds.")
     
     else:
-        message.reply_text(
+        await api_call(context, message.reply_text,
             "Invalid argument. Use:\n"
             "/setcaptcha on - Enable CAPTCHA\n"
             "/setcaptcha off - Disable CAPTCHA\n"
@@ -331,6 +431,5 @@ async def set_captcha(update: Update, context: CallbackContext) -> None:
 HANDLERS = [
     CommandHandler("setcaptcha", set_captcha, filters=~TgFilters.private),
     MessageHandler(TgFilters.status_update.new_chat_members, new_chat_member),
-    CallbackQueryHandler(captcha_button, pattern=r"^captcha_"),
-    MessageHandler(TgFilters.text & ~TgFilters.command, captcha_input)
+    CallbackQueryHandler(captcha_button, pattern=r"^captcha_")
 ]
\ No newline at end of file
@@ -1,10 +1,105 @@
-import time
-from telegram import Update, ChatPermissions
-from telegram.ext import CommandHandler, CallbackContext, Filters as TgFilters, MessageHandler
+import asyncio
+from telegram import Update, ChatPermissions, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler, Filters as TgFilters, MessageHandler
 from telegram.error import BadRequest
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.utils.admins import check_user_admin
+from lemon.utils.deletion import DeletionJob
+from lemon.utils.history import message_history, HISTORY_PERSIST
+from lemon.core.dispatch import async_job
+from lemon.core.scheduler import api_call, BULK
 from lemon.database import db
+from lemon.database.state import state
+
+# Running deletion jobs by chat ID
+deletion_jobs = {}
+
+# Button shown under the status of a running deletion
+CANCEL_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Cancel", callback_data="cleaning_cancel")]])
+
+async def start_deletion(update: Update, context: CallbackContext, message_ids, log_text) -> None:
+    """Delete messages in the background, reporting progress in a status message"""
+    chat = update.effective_chat
+    message = update.effective_message
+    
+    if chat.id in deletion_jobs:
+        await api_call(context, message.reply_text, "A deletion is already running in this chat.")
+        return
+    
+    status_message = await api_call(
+        context,
+        message.reply_text,
+        f"Deleting {len(message_ids)} messages...",
+        reply_markup=CANCEL_MARKUP
+    )
+    
+    job = DeletionJob(
+        context.bot_data["request_scheduler"],
+        context.bot,
+        chat.id,
+        message_ids,
+        progress=lambda done, total: status_message.edit_text(
+            f"Deleting messages: {done}/{total} processed...",
+            reply_markup=CANCEL_MARKUP
+        )
+    )
+    deletion_jobs[chat.id] = job
+    
+    # Run outside the chat's lane, so the cancel button is handled meanwhile
+    asyncio.get_running_loop().create_task(finish_deletion(context, job, status_message, log_text))
+
+async def finish_deletion(context: CallbackContext, job: DeletionJob, status_message, log_text) -> None:
+    """Run a deletion job and report its outcome"""
+    try:
+        result = await job.run()
+    finally:
+        del deletion_jobs[job.chat_id]
+    
+    # Gone or not, /clean shouldn't try these again
+    message_history.forget(job.chat_id, job.message_ids)
+    
+    try:
+        await api_call(context, status_message.edit_text, result.summary())
+    except BadRequest:
+        # The status message was deleted meanwhile
+        return
+    
+    # Delete the status message after 5 seconds
+    context.job_queue.run_once(
+        async_job(delete_message),
+        5,
+        context={"chat_id": job.chat_id, "message_id": status_message.message_id}
+    )
+    
+    # Log the action
+    log_channel = context.bot_data.get("log_channel")
+    if log_channel:
+        await api_call(
+            context,
+            context.bot.send_message,
+            chat_id=log_channel,
+            priority=BULK,
+            text=f"{log_text}\nMessages deleted: {result.deleted}"
+        )
+
+# Cancel a running deletion
+async def cancel_deletion(update: Update, context: CallbackContext) -> None:
+    """Cancel the deletion running in the chat"""
+    query = update.callback_query
+    chat = query.message.chat
+    
+    if not await check_user_admin(context, chat.id, query.from_user.id):
+        await api_call(context, query.answer, "Only admins can cancel this.")
+        return
+    
+    job = deletion_jobs.get(chat.id)
+    if job is None:
+        await api_call(context, query.answer, "Nothing to cancel.")
+        return
+    
+    job.cancel()
+    await api_call(context, query.answer, "Cancelling...")
 
 # Purge messages
 @send_typing
@@ -17,62 +112,33 @@ async def purge(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if the bot has permission to delete messages
-    bot_member = chat.get_member(context.bot.id)
+    bot_member = await api_call(context, chat.get_member, context.bot.id)
     if not bot_member.can_delete_messages:
-        message.reply_text("I don't have permission to delete messages!")
+        await api_call(context, message.reply_text, "I don't have permission to delete messages!")
         return
     
     # Check if replying to a message
     if not message.reply_to_message:
-        message.reply_text("Reply to a message to start purging from.")
+        await api_call(context, message.reply_text, "Reply to a message to start purging from.")
         return
     
     # Get the message IDs to delete
     start_message_id = message.reply_to_message.message_id
     end_message_id = message.message_id
     
-    # Count deleted messages
-    deleted_count = 0
-    
-    try:
-        # Delete messages in range
-        for msg_id in range(start_message_id, end_message_id + 1):
-            try:
-                context.bot.delete_message(chat_id=chat.id, message_id=msg_id)
-                deleted_count += 1
-                
-                # Add a small delay to avoid hitting rate limits
-                if deleted_count % 5 == 0:
-                    time.sleep(0.1)
-            except BadRequest:
-                # Skip messages that can't be deleted
-                pass
-        
-        # Send confirmation message
-        confirm_message = message.reply_text(f"Purged {deleted_count} messages.")
-        
-        # Delete confirmation message after 5 seconds
-        context.job_queue.run_once(
-            lambda ctx: delete_message(ctx, chat.id, confirm_message.message_id),
-            5,
-        )
-        
-        # Log the action
-        log_channel = context.bot_data.get("log_channel")
-        if log_channel:
-            context.bot.send_message(
-                chat_id=log_channel,
-                text=f"#PURGE\n"
-                     f"Admin: {user.first_name} (ID: {user.id})\n"
-                     f"Chat: {chat.title} (ID: {chat.id})\n"
-                     f"Messages deleted: {deleted_count}"
-            )
-    except Exception as e:
-        message.reply_text(f"Error purging messages: {e}")
+    # Delete messages in range
+    await start_deletion(
+        update,
+        context,
+        range(start_message_id, end_message_id + 1),
+        f"#PURGE\n"
+        f"Admin: {user.first_name} (ID: {user.id})\n"
+        f"Chat: {chat.title} (ID: {chat.id})"
+    )
 
 # Delete a specific message
 @send_typing
@@ -84,34 +150,38 @@ async def delete_message_cmd(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if the bot has permission to delete messages
-    bot_member = chat.get_member(context.bot.id)
+    bot_member = await api_call(context, chat.get_member, context.bot.id)
     if not bot_member.can_delete_messages:
-        message.reply_text("I don't have permission to delete messages!")
+        await api_call(context, message.reply_text, "I don't have permission to delete messages!")
         return
     
     # Check if replying to a message
     if not message.reply_to_message:
-        message.reply_text("Reply to a message to delete it.")
+        await api_call(context, message.reply_text, "Reply to a message to delete it.")
         return
     
     try:
         # Delete the replied message
-        context.bot.delete_message(
+        await api_call(
+            context,
+            context.bot.delete_message,
             chat_id=chat.id,
             message_id=message.reply_to_message.message_id
         )
         
         # Delete the command message
-        context.bot.delete_message(
+        await api_call(
+            context,
+            context.bot.delete_message,
             chat_id=chat.id,
             message_id=message.message_id
         )
     except BadRequest as e:
-        message.reply_text(f"Error deleting message: {e.message}")
+        await api_call(context, message.reply_text, f"Error deleting message: {e.message}")
 
 # Clean bot messages
 @send_typing
@@ -124,13 +194,13 @@ async def clean(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if the bot has permission to delete messages
-    bot_member = chat.get_member(context.bot.id)
+    bot_member = await api_call(context, chat.get_member, context.bot.id)
     if not bot_member.can_delete_messages:
-        message.reply_text("I don't have permission to delete messages!")
+        await api_call(context, message.reply_text, "I don't have permission to delete messages!")
         return
     
     # Default to cleaning bot messages
@@ -154,54 +224,30 @@ async def clean(update: Update, context: CallbackContext) -> None:
                     pass
     
     try:
-        # Get recent messages
-        deleted_count = 0
+        if HISTORY_PERSIST:
+            await message_history.load(state, chat.id)
         
-        # We need to iterate through messages manually since there's no API to get messages by type
-        async for msg in context.bot.get_chat_history(chat.id, limit=limit):
-            delete_msg = False
-            
-            if clean_type == "bot" and msg.from_user and msg.from_user.id == context.bot.id:
-                delete_msg = True
-            elif clean_type == "commands" and msg.text and msg.text.startswith("/"):
-                delete_msg = True
+        # Scan the messages the bot has seen, the Bot API can't list them
+        message_ids = []
+        for entry in message_history.recent(chat.id, limit):
+            if clean_type == "bot" and entry.sender_id == context.bot.id:
+                message_ids.append(entry.message_id)
+            elif clean_type == "commands" and entry.is_command:
+                message_ids.append(entry.message_id)
             elif clean_type == "all":
-                delete_msg = True
-            
-            if delete_msg:
-                try:
-                    context.bot.delete_message(chat_id=chat.id, message_id=msg.message_id)
-                    deleted_count += 1
-                    
-                    # Add a small delay to avoid hitting rate limits
-                    if deleted_count % 5 == 0:
-                        time.sleep(0.1)
-                except BadRequest:
-                    # Skip messages that can't be deleted
-                    pass
-        
-        # Send confirmation message
-        confirm_message = message.reply_text(f"Cleaned {deleted_count} messages.")
+                message_ids.append(entry.message_id)
         
-        # Delete confirmation message after 5 seconds
-        context.job_queue.run_once(
-            lambda ctx: delete_message(ctx, chat.id, confirm_message.message_id),
-            5,
+        await start_deletion(
+            update,
+            context,
+            message_ids,
+            f"#CLEAN\n"
+            f"Admin: {user.first_name} (ID: {user.id})\n"
+            f"Chat: {chat.title} (ID: {chat.id})\n"
+            f"Type: {clean_type}"
         )
-        
-        # Log the action
-        log_channel = context.bot_data.get("log_channel")
-        if log_channel:
-            context.bot.send_message(
-                chat_id=log_channel,
-                text=f"#CLEAN\n"
-                     f"Admin: {user.first_name} (ID: {user.id})\n"
-                     f"Chat: {chat.title} (ID: {chat.id})\n"
-                     f"Type: {clean_type}\n"
-                     f"Messages deleted: {deleted_count}"
-            )
     except Exception as e:
-        message.reply_text(f"Error cleaning messages: {e}")
+        await api_call(context, message.reply_text, f"Error cleaning messages: {e}")
 
 # Set clean service settings
 @send_typing
@@ -213,7 +259,7 @@ async def set_clean_service(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get chat settings
@@ -234,7 +280,7 @@ async def set_clean_service(update: Update, context: CallbackContext) -> None:
         status = "enabled" if enabled else "disabled"
         pin_status = "enabled" if pin_silence else "disabled"
         
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"Clean service is currently {status}.\n"
             f"Silent pin notifications: {pin_status}\n\n"
             f"To enable/disable: /cleanservice on/off\n"
@@ -246,31 +292,31 @@ async def set_clean_service(update: Update, context: CallbackContext) -> None:
     if context.args[0].lower() == "on":
         chat_data["clean_service"]["enabled"] = True
         await db.update_chat(chat.id, chat_data)
-        message.reply_text("Clean service has been enabled. Service messages will be automatically removed.")
+        await api_call(context, message.reply_text, "Clean service has been enabled. Service messages will be automatically removed.")
     
     elif context.args[0].lower() == "off":
         chat_data["clean_service"]["enabled"] = False
         await db.update_chat(chat.id, chat_data)
-        message.reply_text("Clean service has been disabled.")
+        await api_call(context, message.reply_text, "Clean service has been disabled.")
     
     elif context.args[0].lower() == "pin":
         if len(context.args) < 2:
-            message.reply_text("Please specify on/off for pin silence setting.")
+            await api_call(context, message.reply_text, "Please specify on/off for pin silence setting.")
             return
             
         if context.args[1].lower() == "on":
             chat_data["clean_service"]["pin_silence"] = True
             await db.update_chat(chat.id, chat_data)
-            message.reply_text("Silent pin notifications enabled. Pin messages will not send notifications.")
+            await api_call(context, message.reply_text, "Silent pin notifications enabled. Pin messages will not send notifications.")
         elif context.args[1].lower() == "off":
             chat_data["clean_service"]["pin_silence"] = False
             await db.update_chat(chat.id, chat_data)
-            message.reply_text("Silent pin notifications disabled. Pin messages will send notifications.")
+            await api_call(context, message.reply_text, "Silent pin notifications disabled. Pin messages will send notifications.")
         else:
-            message.reply_text("Invalid option. Use 'on' or 'off'.")
+            await api_call(context, message.reply_text, "Invalid option. Use 'on' or 'off'.")
     
     else:
-        message.reply_text("Invalid option. Use 'on', 'off', or 'pin on/off'.")
+        await api_call(context, message.reply_text, "Invalid option. Use 'on', 'off', or 'pin on/off'.")
 
 # Handle service messages
 async def clean_service_handler(update: Update, context: CallbackContext) -> None:
@@ -309,7 +355,7 @@ async def clean_service_handler(update: Update, context: CallbackContext) -> Non
     if message.pinned_message and clean_service.get("pin_silence", False):
         try:
             # Delete the service message but keep the pinned message
-            context.bot.delete_message(chat_id=chat.id, message_id=message.message_id)
+            await api_call(context, context.bot.delete_message, chat_id=chat.id, message_id=message.message_id)
         except BadRequest:
             pass
         return
@@ -317,15 +363,27 @@ async def clean_service_handler(update: Update, context: CallbackContext) -> Non
     # Delete service message
     if is_service:
         try:
-            context.bot.delete_message(chat_id=chat.id, message_id=message.message_id)
+            await api_call(context, context.bot.delete_message, chat_id=chat.id, message_id=message.message_id)
         except BadRequest:
             pass
 
+# Remember incoming messages
+def record_message(update: Update, context: CallbackContext) -> None:
+    """Record message metadata in the history /clean scans"""
+    message_history.record_message(update.message)
+
 # Helper function to delete messages
-def delete_message(context: CallbackContext, chat_id, message_id):
-    """Delete a message after a delay"""
+async def delete_message(context: CallbackContext) -> None:
+    """Delete the message of a delayed job, given by the chat_id and message_id of its context"""
+    job_context = context.job.context
     try:
-        context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+        await api_call(
+            context,
+            context.bot.delete_message,
+            chat_id=job_context["chat_id"],
+            message_id=job_context["message_id"],
+            priority=BULK
+        )
     except BadRequest:
         pass
 
@@ -335,5 +393,6 @@ HANDLERS = [
     CommandHandler("del", delete_message_cmd, filters=~TgFilters.private),
     CommandHandler("clean", clean, filters=~TgFilters.private),
     CommandHandler("cleanservice", set_clean_service, filters=~TgFilters.private),
+    CallbackQueryHandler(cancel_deletion, pattern=r"^cleaning_cancel$"),
     MessageHandler(TgFilters.status_update, clean_service_handler)
 ]
\ No newline at end of file
@@ -1,9 +1,12 @@
 import uuid
+import asyncio
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import CommandHandler, CallbackContext, Filters as TgFilters
 from telegram.error import BadRequest
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.core.scheduler import api_call
+from lemon.utils.fanout import fan_out
 from lemon.database import db
 
 # Create a new federation
@@ -16,12 +19,12 @@ async def new_federation(update: Update, context: CallbackContext) -> None:
     
     # Only allow in private chat
     if chat.type != "private":
-        message.reply_text("This command can only be used in private chat with the bot.")
+        await api_call(context, message.reply_text, "This command can only be used in private chat with the bot.")
         return
     
     # Check if command has arguments
     if not context.args:
-        message.reply_text("Please provide a name for the federation.")
+        await api_call(context, message.reply_text, "Please provide a name for the federation.")
         return
     
     # Get federation name
@@ -34,7 +37,7 @@ async def new_federation(update: Update, context: CallbackContext) -> None:
         # Create federation in database
         await db.create_federation(fed_id, user.id, fed_name)
         
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"Federation created successfully!\n\n"
             f"Name: {fed_name}\n"
             f"ID: `{fed_id}`\n"
@@ -45,14 +48,14 @@ async def new_federation(update: Update, context: CallbackContext) -> None:
         
         # Log the action
         if context.bot.log_channel:
-            context.bot.send_message(
+            await api_call(context, context.bot.send_message,
                 chat_id=context.bot.log_channel,
                 text=f"#NEW_FEDERATION\n"
                      f"User: {user.first_name} (ID: {user.id})\n"
                      f"Federation: {fed_name} (ID: {fed_id})"
             )
     except Exception as e:
-        message.reply_text(f"An error occurred: {e}")
+        await api_call(context, message.reply_text, f"An error occurred: {e}")
 
 # Join a federation
 @send_typing
@@ -65,12 +68,12 @@ async def join_federation(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if command has arguments
     if not context.args:
-        message.reply_text("Please provide a federation ID to join.")
+        await api_call(context, message.reply_text, "Please provide a federation ID to join.")
         return
     
     # Get federation ID
@@ -81,19 +84,19 @@ async def join_federation(update: Update, context: CallbackContext) -> None:
         federation = await db.get_federation(fed_id)
         
         if not federation:
-            message.reply_text("Federation not found. Please check the ID and try again.")
+            await api_call(context, message.reply_text, "Federation not found. Please check the ID and try again.")
             return
         
         # Check if user is federation owner or admin
         if user.id != federation.get("owner_id") and user.id not in federation.get("admins", []):
-            message.reply_text("Only federation owner or admins can add groups to the federation.")
+            await api_call(context, message.reply_text, "Only federation owner or admins can add groups to the federation.")
             return
         
         # Check if chat is already in a federation
         existing_feds = await db.async_federations.find({"chats": chat.id}).to_list(length=100)
         
         if existing_feds:
-            message.reply_text(
+            await api_call(context, message.reply_text,
                 f"This chat is already in federation: {existing_feds[0].get('name')}\n"
                 f"Leave it first with /leavefed command."
             )
@@ -102,13 +105,13 @@ async def join_federation(update: Update, context: CallbackContext) -> None:
         # Add chat to federation
         await db.add_fed_chat(fed_id, chat.id)
         
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"This chat has joined the federation: {federation.get('name')}"
         )
         
         # Log the action
         if context.bot.log_channel:
-            context.bot.send_message(
+            await api_call(context, context.bot.send_message,
                 chat_id=context.bot.log_channel,
                 text=f"#JOIN_FEDERATION\n"
                      f"Admin: {user.first_name} (ID: {user.id})\n"
@@ -116,7 +119,7 @@ async def join_federation(update: Update, context: CallbackContext) -> None:
                      f"Federation: {federation.get('name')} (ID: {fed_id})"
             )
     except Exception as e:
-        message.reply_text(f"An error occurred: {e}")
+        await api_call(context, message.reply_text, f"An error occurred: {e}")
 
 # Leave a federation
 @send_typing
@@ -129,7 +132,7 @@ async def leave_federation(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     try:
@@ -137,19 +140,19 @@ async def leave_federation(update: Update, context: CallbackContext) -> None:
         federation = await db.async_federations.find_one({"chats": chat.id})
         
         if not federation:
-            message.reply_text("This chat is not in any federation.")
+            await api_call(context, message.reply_text, "This chat is not in any federation.")
             return
         
         # Remove chat from federation
         await db.remove_fed_chat(federation.get("_id"), chat.id)
         
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"This chat has left the federation: {federation.get('name')}"
         )
         
         # Log the action
         if context.bot.log_channel:
-            context.bot.send_message(
+            await api_call(context, context.bot.send_message,
                 chat_id=context.bot.log_channel,
                 text=f"#LEAVE_FEDERATION\n"
                      f"Admin: {user.first_name} (ID: {user.id})\n"
@@ -157,7 +160,7 @@ async def leave_federation(update: Update, context: CallbackContext) -> None:
                      f"Federation: {federation.get('name')} (ID: {federation.get('_id')})"
             )
     except Exception as e:
-        message.reply_text(f"An error occurred: {e}")
+        await api_call(context, message.reply_text, f"An error occurred: {e}")
 
 # Get federation info
 @send_typing
@@ -172,13 +175,13 @@ async def federation_info(update: Update, context: CallbackContext) -> None:
     else:
         # If no ID provided, try to get federation for current chat
         if chat.type == "private":
-            message.reply_text("Please provide a federation ID.")
+            await api_call(context, message.reply_text, "Please provide a federation ID.")
             return
         
         federation = await db.async_federations.find_one({"chats": chat.id})
         
         if not federation:
-            message.reply_text("This chat is not in any federation. Please provide a federation ID.")
+            await api_call(context, message.reply_text, "This chat is not in any federation. Please provide a federation ID.")
             return
         
         fed_id = federation.get("_id")
@@ -188,12 +191,12 @@ async def federation_info(update: Update, context: CallbackContext) -> None:
         federation = await db.get_federation(fed_id)
         
         if not federation:
-            message.reply_text("Federation not found. Please check the ID and try again.")
+            await api_call(context, message.reply_text, "Federation not found. Please check the ID and try again.")
             return
         
         # Get federation owner
         try:
-            owner = await context.bot.get_chat(federation.get("owner_id"))
+            owner = await api_call(context, context.bot.get_chat, federation.get("owner_id"))
             owner_name = owner.first_name
             if owner.username:
                 owner_name = f"@{owner.username}"
@@ -218,9 +221,9 @@ async def federation_info(update: Update, context: CallbackContext) -> None:
                    f"Admins: {admin_count}\n" \
                    f"Banned Users: {banned_count}"
         
-        message.reply_text(info_text, parse_mode="Markdown")
+        await api_call(context, message.reply_text, info_text, parse_mode="Markdown")
     except Exception as e:
-        message.reply_text(f"An error occurred: {e}")
+        await api_call(context, message.reply_text, f"An error occurred: {e}")
 
 # Ban a user from federation
 @send_typing
@@ -235,14 +238,14 @@ async def federation_ban(update: Update, context: CallbackContext) -> None:
         federation = await db.async_federations.find_one({"chats": chat.id})
         
         if not federation:
-            message.reply_text("This chat is not in any federation.")
+            await api_call(context, message.reply_text, "This chat is not in any federation.")
             return
         
         fed_id = federation.get("_id")
     else:
         # In private chat, require federation ID
         if not context.args or len(context.args) < 2:
-            message.reply_text("Please provide a federation ID and a user to ban.")
+            await api_call(context, message.reply_text, "Please provide a federation ID and a user to ban.")
             return
         
         fed_id = context.args[0]
@@ -252,17 +255,17 @@ async def federation_ban(update: Update, context: CallbackContext) -> None:
         federation = await db.get_federation(fed_id)
         
         if not federation:
-            message.reply_text("Federation not found. Please check the ID and try again.")
+            await api_call(context, message.reply_text, "Federation not found. Please check the ID and try again.")
             return
     
     # Check if user is federation owner or admin
     if user.id != federation.get("owner_id") and user.id not in federation.get("admins", []):
-        message.reply_text("Only federation owner or admins can ban users from the federation.")
+        await api_call(context, message.reply_text, "Only federation owner or admins can ban users from the federation.")
         return
     
     # Get the user to ban
     if not message.reply_to_message and not context.args:
-        message.reply_text("Reply to a user or provide a username to ban from the federation.")
+        await api_call(context, message.reply_text, "Reply to a user or provide a username to ban from the federation.")
         return
     
     try:
@@ -277,18 +280,18 @@ async def federation_ban(update: Update, context: CallbackContext) -> None:
             
             # Try to get user by username
             try:
-                target_user = await context.bot.get_chat(username)
+                target_user = await api_call(context, context.bot.get_chat, username)
                 target_id = target_user.id
                 target_name = target_user.first_name
             except BadRequest:
                 # Try to get user by ID
                 try:
                     user_id = int(username)
-                    target_user = await context.bot.get_chat(user_id)
+                    target_user = await api_call(context, context.bot.get_chat, user_id)
                     target_id = target_user.id
                     target_name = target_user.first_name
                 except (ValueError, BadRequest):
-                    message.reply_text("User not found. Please check the username or ID.")
+                    await api_call(context, message.reply_text, "User not found. Please check the username or ID.")
                     return
         
         # Get reason for ban
@@ -297,40 +300,56 @@ async def federation_ban(update: Update, context: CallbackContext) -> None:
         # Check if user is already banned
         is_banned = await db.is_user_fed_banned(fed_id, target_id)
         if is_banned:
-            message.reply_text(f"{target_name} is already banned in this federation.")
+            await api_call(context, message.reply_text, f"{target_name} is already banned in this federation.")
             return
         
         # Ban user in federation
         await db.fed_ban_user(fed_id, target_id, reason)
         
         # Ban user from all chats in federation
-        ban_count = 0
-        for chat_id in federation.get("chats", []):
-            try:
-                await context.bot.kick_chat_member(chat_id, target_id)
-                ban_count += 1
-            except BadRequest:
-                continue
+        chats = federation.get("chats", [])
+        status_message = await api_call(context, message.reply_text, f"Banning {target_name} in {len(chats)} chats...")
         
-        message.reply_text(
+        # Run outside the chat's lane, a large federation takes minutes
+        asyncio.get_running_loop().create_task(
+            finish_federation_ban(context, federation, user, target_id, target_name, reason, status_message)
+        )
+    except Exception as e:
+        await api_call(context, message.reply_text, f"An error occurred: {e}")
+
+async def finish_federation_ban(context: CallbackContext, federation, admin, target_id, target_name, reason, status_message) -> None:
+    """Ban a user in every chat of a federation and report the outcome"""
+    try:
+        result = await fan_out(
+            context.bot_data["request_scheduler"],
+            lambda chat_id: context.bot.kick_chat_member(chat_id, target_id),
+            federation.get("chats", []),
+            progress=lambda done, total: status_message.edit_text(
+                f"Banning {target_name}: {done}/{total} chats processed..."
+            )
+        )
+        ban_count = result.succeeded
+        
+        await api_call(context, status_message.edit_text,
             f"{target_name} has been banned from the federation: {federation.get('name')}\n"
             f"Banned in {ban_count} chats.\n"
+            f"{result.summary()}\n"
             f"Reason: {reason}"
         )
         
         # Log the action
         if context.bot.log_channel:
-            context.bot.send_message(
+            await api_call(context, context.bot.send_message,
                 chat_id=context.bot.log_channel,
                 text=f"#FEDBAN\n"
-                     f"Admin: {user.first_name} (ID: {user.id})\n"
+                     f"Admin: {admin.first_name} (ID: {admin.id})\n"
                      f"User: {target_name} (ID: {target_id})\n"
-                     f"Federation: {federation.get('name')} (ID: {fed_id})\n"
+                     f"Federation: {federation.get('name')} (ID: {federation.get('_id')})\n"
                      f"Banned in: {ban_count} chats\n"
                      f"Reason: {reason}"
             )
     except Exception as e:
-        message.reply_text(f"An error occurred: {e}")
+        print(f"Error banning {target_id} from federation {federation.get('_id')}: {e}")
 
 # Unban a user from federation
 @send_typing
@@ -345,14 +364,14 @@ async def federation_unban(update: Update, context: CallbackContext) -> None:
         federation = await db.async_federations.find_one({"chats": chat.id})
         
         if not federation:
-            message.reply_text("This chat is not in any federation.")
+            await api_call(context, message.reply_text, "This chat is not in any federation.")
             return
         
         fed_id = federation.get("_id")
     else:
         # In private chat, require federation ID
         if not context.args or len(context.args) < 2:
-            message.reply_text("Please provide a federation ID and a user to unban.")
+            await api_call(context, message.reply_text, "Please provide a federation ID and a user to unban.")
             return
         
         fed_id = context.args[0]
@@ -362,17 +381,17 @@ async def federation_unban(update: Update, context: CallbackContext) -> None:
         federation = await db.get_federation(fed_id)
         
         if not federation:
-            message.reply_text("Federation not found. Please check the ID and try again.")
+            await api_call(context, message.reply_text, "Federation not found. Please check the ID and try again.")
             return
     
     # Check if user is federation owner or admin
     if user.id != federation.get("owner_id") and user.id not in federation.get("admins", []):
-        message.reply_text("Only federation owner or admins can unban users from the federation.")
+        await api_call(context, message.reply_text, "Only federation owner or admins can unban users from the federation.")
         return
     
     # Get the user to unban
     if not message.reply_to_message and not context.args:
-        message.reply_text("Reply to a user or provide a username to unban from the federation.")
+        await api_call(context, message.reply_text, "Reply to a user or provide a username to unban from the federation.")
         return
     
     try:
@@ -387,54 +406,80 @@ async def federation_unban(update: Update, context: CallbackContext) -> None:
             
             # Try to get user by username
             try:
-                target_user = await context.bot.get_chat(username)
+                target_user = await api_call(context, context.bot.get_chat, username)
                 target_id = target_user.id
                 target_name = target_user.first_name
             except BadRequest:
                 # Try to get user by ID
                 try:
                     user_id = int(username)
-                    target_user = await context.bot.get_chat(user_id)
+                    target_user = await api_call(context, context.bot.get_chat, user_id)
                     target_id = target_user.id
                     target_name = target_user.first_name
                 except (ValueError, BadRequest):
-                    message.reply_text("User not found. Please check the username or ID.")
+                    await api_call(context, message.reply_text, "User not found. Please check the username or ID.")
                     return
         
         # Check if user is banned
         is_banned = await db.is_user_fed_banned(fed_id, target_id)
         if not is_banned:
-            message.reply_text(f"{target_name} is not banned in this federation.")
+            await api_call(context, message.reply_text, f"{target_name} is not banned in this federation.")
             return
         
         # Unban user in federation
         result = await db.fed_unban_user(fed_id, target_id)
         
         if result:
-            message.reply_text(
-                f"{target_name} has been unbanned from the federation: {federation.get('name')}"
-            )
+            # Unban user from all chats in federation
+            chats = federation.get("chats", [])
+            status_message = await api_call(context, message.reply_text, f"Unbanning {target_name} in {len(chats)} chats...")
             
-            # Log the action
-            if context.bot.log_channel:
-                context.bot.send_message(
-                    chat_id=context.bot.log_channel,
-                    text=f"#FEDUNBAN\n"
-                         f"Admin: {user.first_name} (ID: {user.id})\n"
-                         f"User: {target_name} (ID: {target_id})\n"
-                         f"Federation: {federation.get('name')} (ID: {fed_id})"
-                )
+            # Run outside the chat's lane, a large federation takes minutes
+            asyncio.get_running_loop().create_task(
+                finish_federation_unban(context, federation, user, target_id, target_name, status_message)
+            )
         else:
-            message.reply_text(f"Failed to unban {target_name} from the federation.")
+            await api_call(context, message.reply_text, f"Failed to unban {target_name} from the federation.")
+    except Exception as e:
+        await api_call(context, message.reply_text, f"An error occurred: {e}")
+
+async def finish_federation_unban(context: CallbackContext, federation, admin, target_id, target_name, status_message) -> None:
+    """Unban a user in every chat of a federation and report the outcome"""
+    try:
+        unban_result = await fan_out(
+            context.bot_data["request_scheduler"],
+            lambda chat_id: context.bot.unban_chat_member(chat_id, target_id, only_if_banned=True),
+            federation.get("chats", []),
+            progress=lambda done, total: status_message.edit_text(
+                f"Unbanning {target_name}: {done}/{total} chats processed..."
+            )
+        )
+        
+        await api_call(context, status_message.edit_text,
+            f"{target_name} has been unbanned from the federation: {federation.get('name')}\n"
+            f"Unbanned in {unban_result.succeeded} chats.\n"
+            f"{unban_result.summary()}"
+        )
+        
+        # Log the action
+        if context.bot.log_channel:
+            await api_call(context, context.bot.send_message,
+                chat_id=context.bot.log_channel,
+                text=f"#FEDUNBAN\n"
+                     f"Admin: {admin.first_name} (ID: {admin.id})\n"
+                     f"User: {target_name} (ID: {target_id})\n"
+                     f"Federation: {federation.get('name')} (ID: {federation.get('_id')})\n"
+                     f"Unbanned in: {unban_result.succeeded} chats"
+            )
     except Exception as e:
-        message.reply_text(f"An error occurred: {e}")
+        print(f"Error unbanning {target_id} from federation {federation.get('_id')}: {e}")
 
 # Define handlers
 HANDLERS = [
-    CommandHandler("newfed", lambda update, context: context.dispatcher.run_async(new_federation, update, context)),
-    CommandHandler("joinfed", lambda update, context: context.dispatcher.run_async(join_federation, update, context), filters=~TgFilters.private),
-    CommandHandler("leavefed", lambda update, context: context.dispatcher.run_async(leave_federation, update, context), filters=~TgFilters.private),
-    CommandHandler("fedinfo", lambda update, context: context.dispatcher.run_async(federation_info, update, context)),
-    CommandHandler("fban", lambda update, context: context.dispatcher.run_async(federation_ban, update, context)),
-    CommandHandler("unfban", lambda update, context: context.dispatcher.run_async(federation_unban, update, context))
+    CommandHandler("newfed", new_federation),
+    CommandHandler("joinfed", join_federation, filters=~TgFilters.private),
+    CommandHandler("leavefed", leave_federation, filters=~TgFilters.private),
+    CommandHandler("fedinfo", federation_info),
+    CommandHandler("fban", federation_ban),
+    CommandHandler("unfban", federation_unban)
 ]
\ No newline at end of file
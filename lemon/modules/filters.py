@@ -1,8 +1,41 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import CommandHandler, CallbackContext, MessageHandler, Filters as TgFilters
+from telegram.ext import CommandHandler, CallbackContext, Filters as TgFilters
 
 from lemon.utils.decorators import admin_only, send_typing
+from lemon.core.scheduler import api_call
+from lemon.utils.cache import TTLCache
+from lemon.utils.matcher import KeywordMatcher
 from lemon.database import db
+from lemon.database.mongo import CHAT_CACHE_SIZE, CHAT_CACHE_TTL
+
+# Compiled keyword matchers per chat
+filter_matchers = TTLCache(maxsize=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL)
+
+# Get the compiled filter matcher for a chat
+async def get_filter_matcher(chat_id) -> KeywordMatcher:
+    """Get the keyword matcher for a chat, building it on first use"""
+    matcher = filter_matchers.get(chat_id)
+    if matcher is None:
+        filters = await db.get_filters(chat_id, limit=None)
+        matcher = KeywordMatcher(
+            (filter_item.get("keyword", ""), filter_item) for filter_item in filters
+        )
+        filter_matchers.set(chat_id, matcher)
+    return matcher
+
+# Split a filter keyword from command arguments
+def split_keyword(args):
+    """Get the keyword and remaining arguments, quoted keywords may span several words"""
+    if not args[0].startswith('"'):
+        return args[0].lower(), args[1:]
+    
+    for end, arg in enumerate(args):
+        if arg.endswith('"') and (end > 0 or len(arg) > 1):
+            keyword = " ".join(args[:end + 1])[1:-1]
+            return " ".join(keyword.lower().split()), args[end + 1:]
+    
+    # Unterminated quote, treat it as a plain keyword
+    return args[0].lower(), args[1:]
 
 # Add a new filter
 @send_typing
@@ -13,16 +46,19 @@ async def add_filter(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if command has arguments
     if not context.args:
-        message.reply_text("Please provide a keyword for the filter.")
+        await api_call(context, message.reply_text, "Please provide a keyword for the filter.")
         return
     
     # Get filter keyword and content
-    keyword = context.args[0].lower()
+    keyword, content_args = split_keyword(context.args)
+    if not keyword:
+        await api_call(context, message.reply_text, "Please provide a keyword for the filter.")
+        return
     
     # Check if replying to a message for content
     if message.reply_to_message:
@@ -41,7 +77,7 @@ async def add_filter(update: Update, context: CallbackContext) -> None:
             elif message.reply_to_message.sticker:
                 content = f"[STICKER]{message.reply_to_message.sticker.file_id}"
             else:
-                message.reply_text("Unsupported message type for filter.")
+                await api_call(context, message.reply_text, "Unsupported message type for filter.")
                 return
         
         # Check for reply markup
@@ -50,16 +86,17 @@ async def add_filter(update: Update, context: CallbackContext) -> None:
             reply_markup = message.reply_to_message.reply_markup.to_dict()
     else:
         # If not replying, use the rest of the command as content
-        if len(context.args) < 2:
-            message.reply_text("Please provide content for the filter or reply to a message.")
+        if not content_args:
+            await api_call(context, message.reply_text, "Please provide content for the filter or reply to a message.")
             return
-        content = " ".join(context.args[1:])
+        content = " ".join(content_args)
         reply_markup = None
     
     # Add filter to database
     await db.add_filter(chat.id, keyword, content, reply_markup)
+    filter_matchers.pop(chat.id)
     
-    message.reply_text(f"Filter '{keyword}' added successfully!")
+    await api_call(context, message.reply_text, f"Filter '{keyword}' added successfully!")
 
 # Remove a filter
 @send_typing
@@ -70,24 +107,25 @@ async def remove_filter(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if command has arguments
     if not context.args:
-        message.reply_text("Please provide a keyword to remove.")
+        await api_call(context, message.reply_text, "Please provide a keyword to remove.")
         return
     
     # Get filter keyword
-    keyword = context.args[0].lower()
+    keyword, _ = split_keyword(context.args)
     
     # Remove filter from database
     result = await db.remove_filter(chat.id, keyword)
+    filter_matchers.pop(chat.id)
     
     if result:
-        message.reply_text(f"Filter '{keyword}' removed successfully!")
+        await api_call(context, message.reply_text, f"Filter '{keyword}' removed successfully!")
     else:
-        message.reply_text(f"No filter found with keyword '{keyword}'.")
+        await api_call(context, message.reply_text, f"No filter found with keyword '{keyword}'.")
 
 # List all filters
 @send_typing
@@ -97,14 +135,14 @@ async def list_filters(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get all filters from database
     filters = await db.get_filters(chat.id)
     
     if not filters:
-        message.reply_text("No filters in this chat.")
+        await api_call(context, message.reply_text, "No filters in this chat.")
         return
     
     # Format filter list
@@ -113,83 +151,93 @@ async def list_filters(update: Update, context: CallbackContext) -> None:
         keyword = filter_item.get("keyword", "unknown")
         filter_list += f"{i}. {keyword}\n"
     
-    message.reply_text(filter_list)
+    await api_call(context, message.reply_text, filter_list)
 
 # Handle incoming messages for filters
-async def handle_filters(update: Update, context: CallbackContext) -> None:
-    """Check incoming messages for filters"""
+async def handle_filters(update: Update, context: CallbackContext, chat_data: dict) -> bool:
+    """Check incoming messages for filters, returns True if a filter replied"""
     chat = update.effective_chat
     message = update.effective_message
     
     # Skip in private chats
     if chat.type == "private":
-        return
+        return False
     
     # Skip commands
     if message.text and message.text.startswith("/"):
-        return
+        return False
     
-    # Get all filters from database
-    filters = await db.get_filters(chat.id)
+    # Get the compiled matcher for this chat
+    matcher = await get_filter_matcher(chat.id)
     
-    if not filters:
-        return
+    if not matcher:
+        return False
     
     # Check if message matches any filter
     if message.text:
-        text = message.text.lower()
-        for filter_item in filters:
-            keyword = filter_item.get("keyword", "").lower()
+        filter_item = matcher.find(message.text)
+        
+        if filter_item:
+            content = filter_item.get("content", "")
+            reply_markup = filter_item.get("reply_markup")
             
-            # Check if keyword is in message
-            if keyword in text.split():
-                content = filter_item.get("content", "")
-                reply_markup = filter_item.get("reply_markup")
-                
-                # Handle different content types
-                if content.startswith("[PHOTO]"):
-                    file_id = content[7:]
-                    message.reply_photo(
-                        photo=file_id,
-                        reply_markup=reply_markup
-                    )
-                elif content.startswith("[DOCUMENT]"):
-                    file_id = content[10:]
-                    message.reply_document(
-                        document=file_id,
-                        reply_markup=reply_markup
-                    )
-                elif content.startswith("[AUDIO]"):
-                    file_id = content[7:]
-                    message.reply_audio(
-                        audio=file_id,
-                        reply_markup=reply_markup
-                    )
-                elif content.startswith("[VIDEO]"):
-                    file_id = content[7:]
-                    message.reply_video(
-                        video=file_id,
-                        reply_markup=reply_markup
-                    )
-                elif content.startswith("[STICKER]"):
-                    file_id = content[9:]
-                    message.reply_sticker(
-                        sticker=file_id
-                    )
-                else:
-                    # Text content
-                    message.reply_text(
-                        content,
-                        reply_markup=reply_markup
-                    )
-                
-                # Only respond to the first matching filter
-                break
+            # Handle different content types
+            if content.startswith("[PHOTO]"):
+                file_id = content[7:]
+                await api_call(
+                    context,
+                    message.reply_photo,
+                    photo=file_id,
+                    reply_markup=reply_markup
+                )
+            elif content.startswith("[DOCUMENT]"):
+                file_id = content[10:]
+                await api_call(
+                    context,
+                    message.reply_document,
+                    document=file_id,
+                    reply_markup=reply_markup
+                )
+            elif content.startswith("[AUDIO]"):
+                file_id = content[7:]
+                await api_call(
+                    context,
+                    message.reply_audio,
+                    audio=file_id,
+                    reply_markup=reply_markup
+                )
+            elif content.startswith("[VIDEO]"):
+                file_id = content[7:]
+                await api_call(
+                    context,
+                    message.reply_video,
+                    video=file_id,
+                    reply_markup=reply_markup
+                )
+            elif content.startswith("[STICKER]"):
+                file_id = content[9:]
+                await api_call(
+                    context,
+                    message.reply_sticker,
+                    sticker=file_id
+                )
+            else:
+                # Text content
+                await api_call(
+                    context,
+                    message.reply_text,
+                    content,
+                    reply_markup=reply_markup
+                )
+            
+            # Only the highest priority filter responds
+            return True
+    
+    return False
 
 # Define handlers
 HANDLERS = [
     CommandHandler("filter", add_filter, filters=~TgFilters.private),
     CommandHandler("stop", remove_filter, filters=~TgFilters.private),
-    CommandHandler("filters", list_filters, filters=~TgFilters.private),
-    MessageHandler(TgFilters.text & ~TgFilters.command & ~TgFilters.private, handle_filters)
+    CommandHandler("filters", list_filters, filters=~TgFilters.private)
 ]
\ No newline at end of file
@@ -1,12 +1,142 @@
 import os
 import time
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ParseMode
+import asyncio
+from telegram import Update, ChatPermissions, InlineKeyboardMarkup, InlineKeyboardButton, ParseMode
 from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler, Filters as TgFilters, MessageHandler
 from telegram.error import BadRequest
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.utils.cache import TTLCache
+from lemon.core.scheduler import api_call, BULK
 from lemon.database import db
+from lemon.database.mongo import CHAT_CACHE_SIZE, CHAT_CACHE_TTL
+from lemon.utils.raid import JoinRateMonitor, JoinBatcher, Sweeper, join_names, kick_member
 from lemon.languages import get_text
+from lemon.languages.language import Template
+
+# Placeholders welcome and farewell messages can use
+PLACEHOLDERS = ("user", "id", "username", "chat", "count")
+
+# Reply to a message that can't be compiled
+INVALID_GREETING = (
+    "That message has an invalid placeholder. Use {user}, {id}, {username}, {chat} or {count}, "
+    "and {{ or }} for literal braces."
+)
+
+# Messages sent when a chat hasn't set its own
+DEFAULT_WELCOME = "Welcome {user} to {chat}!"
+DEFAULT_FAREWELL = "Goodbye {user}! We'll miss you."
+
+# Build the inline keyboard of a welcome message
+def build_keyboard(welcome_buttons):
+    """Build keyboard rows from the stored welcome buttons"""
+    keyboard = []
+    for row in welcome_buttons:
+        keyboard_row = []
+        for button in row:
+            if button.get("url"):
+                keyboard_row.append(
+                    InlineKeyboardButton(button.get("text", ""), url=button.get("url"))
+                )
+            elif button.get("callback_data"):
+                keyboard_row.append(
+                    InlineKeyboardButton(button.get("text", ""), callback_data=button.get("callback_data"))
+                )
+        if keyboard_row:
+            keyboard.append(keyboard_row)
+    return keyboard
+
+class Greeting:
+    """Welcome or farewell message compiled once, with its keyboard"""
+    
+    __slots__ = ("content", "buttons", "template", "keyboard", "needs_count")
+    
+    def __init__(self, content, buttons=(), literal=False):
+        """Compile a message, raises ValueError for invalid or unknown placeholders"""
+        self.content = content
+        self.buttons = buttons
+        
+        if literal:
+            self.template = Template.literal(content)
+        else:
+            self.template = Template(content)
+            unknown = [field for field in self.template.fields if field not in PLACEHOLDERS]
+            if unknown:
+                raise ValueError(f"Unknown placeholder {{{unknown[0]}}}")
+        
+        self.keyboard = build_keyboard(buttons)
+        self.needs_count = "count" in self.template.fields
+    
+    def render(self, **values):
+        """Substitute the placeholders"""
+        return self.template.format(**values)
+    
+    def reply_markup(self, *extra_rows):
+        """Get the keyboard with extra rows below it"""
+        keyboard = self.keyboard + list(extra_rows)
+        return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+# Compiled greetings per chat and kind
+compiled_greetings = TTLCache(maxsize=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL)
+
+# Get the compiled greeting of a chat
+def get_greeting(chat_id, kind, settings, default) -> Greeting:
+    """Get the compiled greeting of a chat, compiling it if its settings changed"""
+    content = settings.get("content") or default
+    buttons = settings.get("buttons", [])
+    
+    greeting = compiled_greetings.get((chat_id, kind))
+    if greeting is None or greeting.content != content or greeting.buttons != buttons:
+        try:
+            greeting = Greeting(content, buttons)
+        except ValueError as e:
+            # Saved before placeholders were checked, sent as it is
+            print(f"Invalid {kind} message in chat {chat_id}: {e}")
+            greeting = Greeting(content, buttons, literal=True)
+        compiled_greetings.set((chat_id, kind), greeting)
+    return greeting
+
+# Pick how a welcome message is sent
+def welcome_reply(message, welcome_settings, content, reply_markup):
+    """Get the reply method and its arguments for the configured welcome type"""
+    welcome_type = welcome_settings.get("type", "text")
+    media_id = welcome_settings.get("media_id")
+    
+    if welcome_type == "photo" and media_id:
+        return message.reply_photo, {
+            "photo": media_id,
+            "caption": content,
+            "reply_markup": reply_markup,
+            "parse_mode": ParseMode.MARKDOWN
+        }
+    if welcome_type == "video" and media_id:
+        return message.reply_video, {
+            "video": media_id,
+            "caption": content,
+            "reply_markup": reply_markup,
+            "parse_mode": ParseMode.MARKDOWN
+        }
+    return message.reply_text, {
+        "text": content,
+        "reply_markup": reply_markup,
+        "parse_mode": ParseMode.MARKDOWN
+    }
+
+# Permissions of members until they verify
+RESTRICTED = ChatPermissions(
+    can_send_messages=False,
+    can_send_media_messages=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False
+)
+
+# Permissions given back once they verify
+UNRESTRICTED = ChatPermissions(
+    can_send_messages=True,
+    can_send_media_messages=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True
+)
 
 # Handle new chat members
 async def welcome_new_members(update: Update, context: CallbackContext) -> None:
@@ -27,78 +157,44 @@ async def welcome_new_members(update: Update, context: CallbackContext) -> None:
     if not welcome_enabled:
         return
     
+    # Skip the bot itself
+    new_members = [member for member in message.new_chat_members if member.id != context.bot.id]
+    
+    # During a raid new members are welcomed in batches
+    if join_monitor.record(chat.id, len(new_members)):
+        await join_batcher.add(context, message, new_members)
+        return
+    
+    # Compiled once for all new members
+    greeting = get_greeting(chat.id, "welcome", welcome_settings, DEFAULT_WELCOME)
+    captcha_enabled = welcome_settings.get("captcha_enabled", False)
+    captcha_timeout = welcome_settings.get("captcha_timeout", 60)
+    count = await api_call(context, chat.get_member_count) if greeting.needs_count else None
+    
     # Process each new member
-    for new_member in message.new_chat_members:
-        # Skip if the new member is the bot itself
-        if new_member.id == context.bot.id:
-            continue
-        
-        # Get welcome message
-        welcome_type = welcome_settings.get("type", "text")
-        welcome_content = welcome_settings.get("content", "")
-        welcome_buttons = welcome_settings.get("buttons", [])
-        
-        # Create reply markup if buttons exist
-        reply_markup = None
-        if welcome_buttons:
-            keyboard = []
-            for row in welcome_buttons:
-                keyboard_row = []
-                for button in row:
-                    if button.get("url"):
-                        keyboard_row.append(
-                            InlineKeyboardButton(button.get("text", ""), url=button.get("url"))
-                        )
-                    elif button.get("callback_data"):
-                        keyboard_row.append(
-                            InlineKeyboardButton(button.get("text", ""), callback_data=button.get("callback_data"))
-                        )
-                if keyboard_row:
-                    keyboard.append(keyboard_row)
-            
-            if keyboard:
-                reply_markup = InlineKeyboardMarkup(keyboard)
-        
+    for new_member in new_members:
         # Add verification button if CAPTCHA is enabled
-        captcha_enabled = welcome_settings.get("captcha_enabled", False)
-        captcha_timeout = welcome_settings.get("captcha_timeout", 60)
-        
         if captcha_enabled:
-            # Create or update keyboard with verify button
-            if not reply_markup:
-                keyboard = [[InlineKeyboardButton("Verify ✅", callback_data=f"verify_{new_member.id}")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-            else:
-                # Add verify button to existing keyboard
-                keyboard = reply_markup.inline_keyboard
-                keyboard.append([InlineKeyboardButton("Verify ✅", callback_data=f"verify_{new_member.id}")])
-                reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = greeting.reply_markup(
+                [InlineKeyboardButton("Verify ✅", callback_data=f"verify_{new_member.id}")]
+            )
             
             # Restrict user until verified
             try:
-                chat.restrict_member(
-                    new_member.id,
-                    permissions={
-                        "can_send_messages": False,
-                        "can_send_media_messages": False,
-                        "can_send_other_messages": False,
-                        "can_add_web_page_previews": False
-                    }
-                )
+                await api_call(context, chat.restrict_member, new_member.id, permissions=RESTRICTED)
             except BadRequest:
                 pass
+        else:
+            reply_markup = greeting.reply_markup()
         
         # Format welcome message
-        if welcome_content:
-            welcome_content = welcome_content.format(
-                user=new_member.first_name,
-                id=new_member.id,
-                username=new_member.username or new_member.first_name,
-                chat=chat.title,
-                count=chat.get_member_count()
-            )
-        else:
-            welcome_content = f"Welcome {new_member.first_name} to {chat.title}!"
+        welcome_content = greeting.render(
+            user=new_member.first_name,
+            id=new_member.id,
+            username=new_member.username or new_member.first_name,
+            chat=chat.title,
+            count=count
+        )
         
         # Add CAPTCHA message if enabled
         if captcha_enabled:
@@ -106,63 +202,69 @@ async def welcome_new_members(update: Update, context: CallbackContext) -> None:
         
         # Send welcome message based on type
         try:
-            if welcome_type == "text":
-                sent_msg = message.reply_text(
-                    welcome_content,
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif welcome_type == "photo":
-                photo_id = welcome_settings.get("media_id")
-                if photo_id:
-                    sent_msg = message.reply_photo(
-                        photo=photo_id,
-                        caption=welcome_content,
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    sent_msg = message.reply_text(
-                        welcome_content,
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-            elif welcome_type == "video":
-                video_id = welcome_settings.get("media_id")
-                if video_id:
-                    sent_msg = message.reply_video(
-                        video=video_id,
-                        caption=welcome_content,
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    sent_msg = message.reply_text(
-                        welcome_content,
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-            else:
-                sent_msg = message.reply_text(
-                    welcome_content,
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+            reply, kwargs = welcome_reply(message, welcome_settings, welcome_content, reply_markup)
+            sent_msg = await api_call(context, reply, **kwargs)
             
-            # Schedule job to check CAPTCHA timeout if enabled
+            # Check the verification once it times out
             if captcha_enabled:
-                context.job_queue.run_once(
-                    check_verification_timeout,
-                    captcha_timeout,
-                    context={
-                        "chat_id": chat.id,
-                        "user_id": new_member.id,
-                        "message_id": sent_msg.message_id
-                    }
+                verification_sweeper.schedule(
+                    context.job_queue, (chat.id, new_member.id), captcha_timeout, sent_msg.message_id
                 )
         except Exception as e:
             print(f"Error sending welcome message: {e}")
 
+# Welcome a batch of members joining during a raid
+async def welcome_batch(context: CallbackContext, message, new_members) -> None:
+    """Send one welcome message to a batch of new members, restricting them first if CAPTCHA is enabled"""
+    chat = message.chat
+    
+    # Settings may have changed while the batch was collected
+    chat_data = await db.get_chat(chat.id) or {}
+    welcome_settings = chat_data.get("welcome", {})
+    if not welcome_settings.get("enabled", False):
+        return
+    
+    greeting = get_greeting(chat.id, "welcome", welcome_settings, DEFAULT_WELCOME)
+    captcha_enabled = welcome_settings.get("captcha_enabled", False)
+    captcha_timeout = welcome_settings.get("captcha_timeout", 60)
+    
+    if captcha_enabled:
+        # Restrict the whole batch as bulk work, members that can't be restricted don't need to verify
+        results = await asyncio.gather(*(
+            api_call(context, context.bot.restrict_chat_member, chat.id, member.id, permissions=RESTRICTED, priority=BULK)
+            for member in new_members
+        ), return_exceptions=True)
+        restricted = [member for member, result in zip(new_members, results) if not isinstance(result, Exception)]
+        
+        # Every member of the batch verifies with the same button
+        reply_markup = greeting.reply_markup([InlineKeyboardButton("Verify ✅", callback_data="verify_batch")])
+    else:
+        reply_markup = greeting.reply_markup()
+    
+    # Format one welcome message for everyone
+    welcome_content = greeting.render(
+        user=join_names([member.first_name for member in new_members]),
+        id=", ".join(str(member.id) for member in new_members),
+        username=join_names([member.username or member.first_name for member in new_members]),
+        chat=chat.title,
+        count=await api_call(context, chat.get_member_count) if greeting.needs_count else None
+    )
+    
+    if captcha_enabled:
+        welcome_content += f"\n\nPlease verify you're human by clicking the button below within {captcha_timeout} seconds."
+    
+    try:
+        reply, kwargs = welcome_reply(message, welcome_settings, welcome_content, reply_markup)
+        sent_msg = await api_call(context, reply, **kwargs)
+    except Exception as e:
+        print(f"Error sending welcome message: {e}")
+        return
+    
+    if captcha_enabled and restricted:
+        # The deadlines also tell who may verify with the shared button
+        for member in restricted:
+            verification_sweeper.schedule(context.job_queue, (chat.id, member.id), captcha_timeout, sent_msg.message_id)
+
 # Handle members leaving chat
 async def farewell_members(update: Update, context: CallbackContext) -> None:
     """Send farewell message when members leave the chat"""
@@ -189,62 +291,53 @@ async def farewell_members(update: Update, context: CallbackContext) -> None:
     if user.id == context.bot.id:
         return
     
-    # Get farewell message
-    farewell_content = farewell_settings.get("content", "")
-    
     # Format farewell message
-    if farewell_content:
-        farewell_content = farewell_content.format(
-            user=user.first_name,
-            id=user.id,
-            username=user.username or user.first_name,
-            chat=chat.title,
-            count=chat.get_member_count()
-        )
-    else:
-        farewell_content = f"Goodbye {user.first_name}! We'll miss you."
+    greeting = get_greeting(chat.id, "farewell", farewell_settings, DEFAULT_FAREWELL)
+    farewell_content = greeting.render(
+        user=user.first_name,
+        id=user.id,
+        username=user.username or user.first_name,
+        chat=chat.title,
+        count=await api_call(context, chat.get_member_count) if greeting.needs_count else None
+    )
     
     # Send farewell message
     try:
-        message.reply_text(
+        await api_call(context, message.reply_text,
             farewell_content,
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
         print(f"Error sending farewell message: {e}")
 
-# Check verification timeout
-async def check_verification_timeout(context: CallbackContext) -> None:
-    """Check if user has verified within the time limit"""
-    job = context.job
-    data = job.context
-    
-    chat_id = data["chat_id"]
-    user_id = data["user_id"]
-    message_id = data["message_id"]
-    
-    # Get chat settings
-    chat_data = await db.get_chat(chat_id) or {}
-    welcome_settings = chat_data.get("welcome", {})
-    
-    # Check if user has been verified
-    user_verified = welcome_settings.get(f"verified_{user_id}", False)
+# Handle timed out verifications
+async def expire_verifications(context: CallbackContext, expired) -> None:
+    """Kick members who didn't verify in time and update their welcome messages"""
+    # Verified members are cancelled, so every expired member is still unverified
+    removed = {}
+    calls = []
+    for (chat_id, user_id), message_id in expired:
+        removed[(chat_id, message_id)] = removed.get((chat_id, message_id), 0) + 1
+        calls.append(kick_member(context, chat_id, user_id))
+    
+    # Update each verification message once
+    for (chat_id, message_id), count in removed.items():
+        text = (
+            "User was removed for not verifying in time." if count == 1
+            else f"{count} users were removed for not verifying in time."
+        )
+        calls.append(api_call(
+            context, context.bot.edit_message_text, chat_id=chat_id, message_id=message_id, text=text, priority=BULK
+        ))
     
-    if not user_verified:
-        # User has not verified, kick them
-        try:
-            # Kick the user
-            context.bot.kick_chat_member(chat_id, user_id)
-            context.bot.unban_chat_member(chat_id, user_id)  # Unban so they can rejoin
-            
-            # Update the verification message
-            context.bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=message_id,
-                text="User was removed for not verifying in time."
-            )
-        except Exception as e:
-            print(f"Error handling verification timeout: {e}")
+    for result in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"Error handling verification timeout: {result}")
+
+# Raid detection, batching of raid joins and verification timeouts
+join_monitor = JoinRateMonitor()
+join_batcher = JoinBatcher(welcome_batch)
+verification_sweeper = Sweeper(expire_verifications, "greetings")
 
 # Handle verification button click
 async def verify_button_callback(update: Update, context: CallbackContext) -> None:
@@ -256,44 +349,44 @@ async def verify_button_callback(update: Update, context: CallbackContext) -> No
     # Extract user ID from callback data
     data = query.data.split("_")
     if len(data) != 2:
-        query.answer("Invalid verification data.")
+        await api_call(context, query.answer, "Invalid verification data.")
         return
     
-    target_user_id = int(data[1])
+    # Members welcomed in a batch share one button
+    batch = data[1] == "batch"
+    if batch:
+        # Pending deadlines are persisted, so this holds across restarts
+        if verification_sweeper.get((chat.id, user.id)) != query.message.message_id:
+            await api_call(context, query.answer, "This verification is not for you.")
+            return
+        target_user_id = user.id
+    else:
+        target_user_id = int(data[1])
     
     # Check if the user clicking is the one who needs to verify
     if user.id != target_user_id:
-        query.answer("This verification is not for you.")
+        await api_call(context, query.answer, "This verification is not for you.")
         return
     
-    # Mark user as verified
-    chat_data = await db.get_chat(chat.id) or {}
-    if "welcome" not in chat_data:
-        chat_data["welcome"] = {}
-    
-    chat_data["welcome"][f"verified_{user.id}"] = True
-    await db.update_chat(chat.id, chat_data)
-    
     # Unrestrict the user
     try:
-        chat.restrict_member(
+        await api_call(context, chat.restrict_member,
             user.id,
-            permissions={
-                "can_send_messages": True,
-                "can_send_media_messages": True,
-                "can_send_other_messages": True,
-                "can_add_web_page_previews": True
-            }
+            permissions=UNRESTRICTED
         )
         
-        # Update the message
-        query.edit_message_text(
-            text=f"{user.first_name} has been verified. Welcome to the group!"
-        )
+        # Mark user as verified by stopping the timeout, kept if they couldn't be unrestricted
+        verification_sweeper.cancel((chat.id, user.id))
         
-        query.answer("You have been verified!")
+        # Update the message, a batch message is left to the other members
+        if not batch:
+            await api_call(context, query.edit_message_text,
+                text=f"{user.first_name} has been verified. Welcome to the group!"
+            )
+        
+        await api_call(context, query.answer, "You have been verified!")
     except Exception as e:
-        query.answer(f"Error: {e}")
+        await api_call(context, query.answer, f"Error: {e}")
 
 # Set welcome message
 @send_typing
@@ -305,7 +398,7 @@ async def set_welcome(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get chat settings
@@ -324,7 +417,7 @@ async def set_welcome(update: Update, context: CallbackContext) -> None:
         status = "enabled" if welcome_enabled else "disabled"
         captcha = "enabled" if captcha_enabled else "disabled"
         
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"Welcome messages are currently {status}.\n"
             f"Type: {welcome_type}\n"
             f"CAPTCHA: {captcha}\n\n"
@@ -345,13 +438,13 @@ async def set_welcome(update: Update, context: CallbackContext) -> None:
         if context.args[0].lower() == "on":
             chat_data["welcome"]["enabled"] = True
             await db.update_chat(chat.id, chat_data)
-            message.reply_text("Welcome messages have been enabled.")
+            await api_call(context, message.reply_text, "Welcome messages have been enabled.")
             return
         
         elif context.args[0].lower() == "off":
             chat_data["welcome"]["enabled"] = False
             await db.update_chat(chat.id, chat_data)
-            message.reply_text("Welcome messages have been disabled.")
+            await api_call(context, message.reply_text, "Welcome messages have been disabled.")
             return
         
         elif context.args[0].lower() == "captcha":
@@ -362,12 +455,12 @@ async def set_welcome(update: Update, context: CallbackContext) -> None:
                     if "captcha_timeout" not in chat_data["welcome"]:
                         chat_data["welcome"]["captcha_timeout"] = 60
                     await db.update_chat(chat.id, chat_data)
-                    message.reply_text("CAPTCHA verification has been enabled.")
+                    await api_call(context, message.reply_text, "CAPTCHA verification has been enabled.")
                     return
                 elif context.args[1].lower() == "off":
                     chat_data["welcome"]["captcha_enabled"] = False
                     await db.update_chat(chat.id, chat_data)
-                    message.reply_text("CAPTCHA verification has been disabled.")
+                    await api_call(context, message.reply_text, "CAPTCHA verification has been disabled.")
                     return
                 elif context.args[1].lower() == "timeout" and len(context.args) > 2:
                     try:
@@ -376,10 +469,10 @@ async def set_welcome(update: Update, context: CallbackContext) -> None:
                             timeout = 10  # Minimum 10 seconds
                         chat_data["welcome"]["captcha_timeout"] = timeout
                         await db.update_chat(chat.id, chat_data)
-                        message.reply_text(f"CAPTCHA timeout set to {timeout} seconds.")
+                        await api_call(context, message.reply_text, f"CAPTCHA timeout set to {timeout} seconds.")
                         return
                     except ValueError:
-                        message.reply_text("Please provide a valid number for timeout in seconds.")
+                        await api_call(context, message.reply_text, "Please provide a valid number for timeout in seconds.")
                         return
     
     # Set welcome message content
@@ -388,24 +481,32 @@ async def set_welcome(update: Update, context: CallbackContext) -> None:
         if message.reply_to_message.photo:
             chat_data["welcome"]["type"] = "photo"
             chat_data["welcome"]["media_id"] = message.reply_to_message.photo[-1].file_id
-            content = message.reply_to_message.caption or "Welcome {user} to {chat}!"
+            content = message.reply_to_message.caption or DEFAULT_WELCOME
         elif message.reply_to_message.video:
             chat_data["welcome"]["type"] = "video"
             chat_data["welcome"]["media_id"] = message.reply_to_message.video.file_id
-            content = message.reply_to_message.caption or "Welcome {user} to {chat}!"
+            content = message.reply_to_message.caption or DEFAULT_WELCOME
         else:
             chat_data["welcome"]["type"] = "text"
-            content = message.reply_to_message.text or "Welcome {user} to {chat}!"
+            content = message.reply_to_message.text or DEFAULT_WELCOME
     else:
         chat_data["welcome"]["type"] = "text"
         content = " ".join(context.args)
     
+    # Compile it now, so mistakes are reported here rather than on every join
+    try:
+        greeting = Greeting(content, chat_data["welcome"].get("buttons", []))
+    except ValueError as e:
+        await api_call(context, message.reply_text, f"{INVALID_GREETING}\n{e}")
+        return
+    
     # Save welcome message
     chat_data["welcome"]["content"] = content
     chat_data["welcome"]["enabled"] = True
     await db.update_chat(chat.id, chat_data)
+    compiled_greetings.set((chat.id, "welcome"), greeting)
     
-    message.reply_text("Welcome message has been set!")
+    await api_call(context, message.reply_text, "Welcome message has been set!")
 
 # Set farewell message
 @send_typing
@@ -417,7 +518,7 @@ async def set_farewell(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get chat settings
@@ -433,7 +534,7 @@ async def set_farewell(update: Update, context: CallbackContext) -> None:
         
         status = "enabled" if farewell_enabled else "disabled"
         
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"Farewell messages are currently {status}.\n\n"
             f"To enable/disable: /setfarewell on/off\n"
             f"To set message: /setfarewell <message>\n\n"
@@ -451,27 +552,35 @@ async def set_farewell(update: Update, context: CallbackContext) -> None:
         if context.args[0].lower() == "on":
             chat_data["farewell"]["enabled"] = True
             await db.update_chat(chat.id, chat_data)
-            message.reply_text("Farewell messages have been enabled.")
+            await api_call(context, message.reply_text, "Farewell messages have been enabled.")
             return
         
         elif context.args[0].lower() == "off":
             chat_data["farewell"]["enabled"] = False
             await db.update_chat(chat.id, chat_data)
-            message.reply_text("Farewell messages have been disabled.")
+            await api_call(context, message.reply_text, "Farewell messages have been disabled.")
             return
     
     # Set farewell message content
     if message.reply_to_message:
-        content = message.reply_to_message.text or "Goodbye {user}! We'll miss you."
+        content = message.reply_to_message.text or DEFAULT_FAREWELL
     else:
         content = " ".join(context.args)
     
+    # Compile it now, so mistakes are reported here rather than on every leave
+    try:
+        greeting = Greeting(content, chat_data["farewell"].get("buttons", []))
+    except ValueError as e:
+        await api_call(context, message.reply_text, f"{INVALID_GREETING}\n{e}")
+        return
+    
     # Save farewell message
     chat_data["farewell"]["content"] = content
     chat_data["farewell"]["enabled"] = True
     await db.update_chat(chat.id, chat_data)
+    compiled_greetings.set((chat.id, "farewell"), greeting)
     
-    message.reply_text("Farewell message has been set!")
+    await api_call(context, message.reply_text, "Farewell message has been set!")
 
 # Define handlers
 HANDLERS = [
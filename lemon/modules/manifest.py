@@ -0,0 +1,78 @@
+import time
+import logging
+import importlib
+from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, Filters as TgFilters
+
+logger = logging.getLogger(__name__)
+
+class LazyCallback:
+    """Stands in for a module function, importing the module on first call"""
+
+    def __init__(self, module_name, attribute):
+        self.module_name = module_name
+        self.attribute = attribute
+        self.__name__ = attribute
+        self.__qualname__ = f"{module_name}.{attribute}"
+        self._target = None
+
+    def __call__(self, *args, **kwargs):
+        if self._target is None:
+            started = time.perf_counter()
+            module = importlib.import_module(f"lemon.modules.{self.module_name}")
+            self._target = getattr(module, self.attribute)
+            logger.info(
+                f"Loaded module {self.module_name} on first use "
+                f"in {time.perf_counter() - started:.3f}s"
+            )
+        return self._target(*args, **kwargs)
+
+class LazyStage(LazyCallback):
+    """Stands in for a message stage, importing the module only for messages passing check"""
+
+    def __init__(self, module_name, attribute, check):
+        super().__init__(module_name, attribute)
+        self.check = check
+
+    async def __call__(self, update, context, chat_data):
+        if not self.check(update, context):
+            return False
+        return await super().__call__(update, context, chat_data)
+
+def lazy(module_name, attribute):
+    """Reference a module function without importing the module"""
+    return LazyCallback(module_name, attribute)
+
+def lazy_stage(module_name, attribute):
+    """Reference a message stage without importing the module, prechecked if it has a check"""
+    check = STAGE_CHECKS.get((module_name, attribute))
+    if check is None:
+        return LazyCallback(module_name, attribute)
+    return LazyStage(module_name, attribute, check)
+
+def is_captcha_reply(update, context):
+    """Check if a message replies to a CAPTCHA of the bot, the first test of captcha_input"""
+    reply = update.effective_message.reply_to_message
+    return bool(
+        reply
+        and reply.from_user
+        and reply.from_user.id == context.bot.id
+        and reply.caption
+        and "CAPTCHA" in reply.caption
+    )
+
+# Handlers of modules that can be loaded on first use, mirroring their HANDLERS.
+# Keep these in sync when changing a module's handlers.
+MANIFEST = {
+    # Only needed in chats with CAPTCHA enabled
+    "captcha": [
+        CommandHandler("setcaptcha", lazy("captcha", "set_captcha"), filters=~TgFilters.private),
+        MessageHandler(TgFilters.status_update.new_chat_members, lazy("captcha", "new_chat_member")),
+        CallbackQueryHandler(lazy("captcha", "captcha_button"), pattern=r"^captcha_")
+    ]
+}
+
+# Cheap tests run before a lazy message stage, so messages it would skip don't import its module.
+# Keep these in sync with the checks at the start of the stage.
+STAGE_CHECKS = {
+    ("captcha", "captcha_input"): is_captcha_reply
+}
@@ -1,9 +1,14 @@
+import re
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import CommandHandler, CallbackContext, MessageHandler, Filters as TgFilters
+from telegram.ext import CommandHandler, CallbackContext, Filters as TgFilters
 
 from lemon.utils.decorators import admin_only, send_typing
+from lemon.core.scheduler import api_call
 from lemon.database import db
 
+# Messages that request a note
+NOTE_PATTERN = re.compile(r"^#\w+")
+
 # Save a note
 @send_typing
 @admin_only
@@ -13,12 +18,12 @@ async def save_note(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if command has arguments
     if not context.args:
-        message.reply_text("Please provide a name for the note.")
+        await api_call(context, message.reply_text, "Please provide a name for the note.")
         return
     
     # Get note name and content
@@ -41,7 +46,7 @@ async def save_note(update: Update, context: CallbackContext) -> None:
             elif message.reply_to_message.sticker:
                 content = f"[STICKER]{message.reply_to_message.sticker.file_id}"
             else:
-                message.reply_text("Unsupported message type for note.")
+                await api_call(context, message.reply_text, "Unsupported message type for note.")
                 return
         
         # Check for reply markup
@@ -51,7 +56,7 @@ async def save_note(update: Update, context: CallbackContext) -> None:
     else:
         # If not replying, use the rest of the command as content
         if len(context.args) < 2:
-            message.reply_text("Please provide content for the note or reply to a message.")
+            await api_call(context, message.reply_text, "Please provide content for the note or reply to a message.")
             return
         content = " ".join(context.args[1:])
         reply_markup = None
@@ -59,18 +64,17 @@ async def save_note(update: Update, context: CallbackContext) -> None:
     # Save note to database
     await db.save_note(chat.id, note_name, content, reply_markup)
     
-    message.reply_text(f"Note '{note_name}' saved successfully!")
+    await api_call(context, message.reply_text, f"Note '{note_name}' saved successfully!")
 
 # Get a note
-@send_typing
-async def get_note(update: Update, context: CallbackContext) -> None:
-    """Get a note from the chat"""
+async def get_note(update: Update, context: CallbackContext, chat_data: dict) -> bool:
+    """Get a note from the chat, returns True if a note was sent"""
     chat = update.effective_chat
     message = update.effective_message
     
     # Check if message starts with #
-    if not message.text or not message.text.startswith("#"):
-        return
+    if not message.text or not NOTE_PATTERN.match(message.text):
+        return False
     
     # Get note name
     note_name = message.text[1:].lower().split()[0]
@@ -80,7 +84,7 @@ async def get_note(update: Update, context: CallbackContext) -> None:
     
     if not note:
         # Note not found
-        return
+        return False
     
     content = note.get("content", "")
     reply_markup = note.get("reply_markup")
@@ -88,39 +92,53 @@ async def get_note(update: Update, context: CallbackContext) -> None:
     # Handle different content types
     if content.startswith("[PHOTO]"):
         file_id = content[7:]
-        message.reply_photo(
+        await api_call(
+            context,
+            message.reply_photo,
             photo=file_id,
             reply_markup=reply_markup
         )
     elif content.startswith("[DOCUMENT]"):
         file_id = content[10:]
-        message.reply_document(
+        await api_call(
+            context,
+            message.reply_document,
             document=file_id,
             reply_markup=reply_markup
         )
     elif content.startswith("[AUDIO]"):
         file_id = content[7:]
-        message.reply_audio(
+        await api_call(
+            context,
+            message.reply_audio,
             audio=file_id,
             reply_markup=reply_markup
         )
     elif content.startswith("[VIDEO]"):
         file_id = content[7:]
-        message.reply_video(
+        await api_call(
+            context,
+            message.reply_video,
             video=file_id,
             reply_markup=reply_markup
         )
     elif content.startswith("[STICKER]"):
         file_id = content[9:]
-        message.reply_sticker(
+        await api_call(
+            context,
+            message.reply_sticker,
             sticker=file_id
         )
     else:
         # Text content
-        message.reply_text(
+        await api_call(
+            context,
+            message.reply_text,
             content,
             reply_markup=reply_markup
         )
+    
+    return True
 
 # List all notes
 @send_typing
@@ -130,14 +148,14 @@ async def list_notes(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get all notes from database
     notes = await db.get_all_notes(chat.id)
     
     if not notes:
-        message.reply_text("No notes in this chat.")
+        await api_call(context, message.reply_text, "No notes in this chat.")
         return
     
     # Format note list
@@ -146,7 +164,7 @@ async def list_notes(update: Update, context: CallbackContext) -> None:
         name = note.get("name", "unknown")
         note_list += f"{i}. #{name}\n"
     
-    message.reply_text(note_list)
+    await api_call(context, message.reply_text, note_list)
 
 # Delete a note
 @send_typing
@@ -157,12 +175,12 @@ async def delete_note(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if command has arguments
     if not context.args:
-        message.reply_text("Please provide a name for the note to delete.")
+        await api_call(context, message.reply_text, "Please provide a name for the note to delete.")
         return
     
     # Get note name
@@ -172,9 +190,9 @@ async def delete_note(update: Update, context: CallbackContext) -> None:
     result = await db.delete_note(chat.id, note_name)
     
     if result:
-        message.reply_text(f"Note '{note_name}' deleted successfully!")
+        await api_call(context, message.reply_text, f"Note '{note_name}' deleted successfully!")
     else:
-        message.reply_text(f"No note found with name '{note_name}'.")
+        await api_call(context, message.reply_text, f"No note found with name '{note_name}'.")
 
 # Delete all notes
 @send_typing
@@ -185,12 +203,12 @@ async def clear_notes(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Confirm deletion
     if not context.args or context.args[0].lower() != "confirm":
-        message.reply_text(
+        await api_call(context, message.reply_text,
             "This will delete ALL notes in this chat.\n"
             "To confirm, use /clearnotes confirm"
         )
@@ -200,7 +218,7 @@ async def clear_notes(update: Update, context: CallbackContext) -> None:
     notes = await db.get_all_notes(chat.id)
     
     if not notes:
-        message.reply_text("No notes in this chat.")
+        await api_call(context, message.reply_text, "No notes in this chat.")
         return
     
     # Delete all notes
@@ -208,13 +226,12 @@ async def clear_notes(update: Update, context: CallbackContext) -> None:
         name = note.get("name", "")
         await db.delete_note(chat.id, name)
     
-    message.reply_text("All notes have been deleted.")
+    await api_call(context, message.reply_text, "All notes have been deleted.")
 
 # Define handlers
 HANDLERS = [
     CommandHandler("note", save_note, filters=~TgFilters.private),
     CommandHandler("notes", list_notes, filters=~TgFilters.private),
     CommandHandler("clear", delete_note, filters=~TgFilters.private),
-    CommandHandler("clearnotes", clear_notes, filters=~TgFilters.private),
-    MessageHandler(TgFilters.text & TgFilters.regex(r"^#\w+"), get_note)
+    CommandHandler("clearnotes", clear_notes, filters=~TgFilters.private)
 ]
\ No newline at end of file
@@ -3,6 +3,7 @@ from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler,
 from telegram.error import BadRequest
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.core.scheduler import api_call
 from lemon.database import db
 from lemon.languages import get_text
 
@@ -16,7 +17,7 @@ async def settings(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get chat settings
@@ -39,7 +40,7 @@ async def settings(update: Update, context: CallbackContext) -> None:
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    message.reply_text(
+    await api_call(context, message.reply_text,
         f"Settings for {chat.title}\n\n"
         f"Select a category to configure:",
         reply_markup=reply_markup
@@ -49,7 +50,7 @@ async def settings(update: Update, context: CallbackContext) -> None:
 async def settings_button(update: Update, context: CallbackContext) -> None:
     """Handle settings button callbacks"""
     query = update.callback_query
-    query.answer()
+    await api_call(context, query.answer)
     
     # Get the category from callback data
     data = query.data.split("_")
@@ -72,7 +73,7 @@ async def settings_button(update: Update, context: CallbackContext) -> None:
             [InlineKeyboardButton("Back", callback_data="settings_back")]
         ]
         
-        query.edit_message_text(
+        await api_call(context, query.edit_message_text,
             text="Select a language for the bot:",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
@@ -94,14 +95,14 @@ async def settings_button(update: Update, context: CallbackContext) -> None:
             ]
         ]
         
-        query.edit_message_text(
+        await api_call(context, query.edit_message_text,
             text=f"Settings for {query.message.chat.title}\n\n"
                  f"Select a category to configure:",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     
     else:
-        query.edit_message_text(
+        await api_call(context, query.edit_message_text,
             text=f"Settings for {category} will be available soon.",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
@@ -110,7 +111,7 @@ async def settings_button(update: Update, context: CallbackContext) -> None:
 async def set_language(update: Update, context: CallbackContext) -> None:
     """Set language for the chat"""
     query = update.callback_query
-    query.answer()
+    await api_call(context, query.answer)
     
     # Get the language code from callback data
     data = query.data.split("_")
@@ -134,7 +135,7 @@ async def set_language(update: Update, context: CallbackContext) -> None:
         [InlineKeyboardButton("Back", callback_data="settings_back")]
     ]
     
-    query.edit_message_text(
+    await api_call(context, query.edit_message_text,
         text=f"Language has been set to {lang_code.upper()}.",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
@@ -158,7 +159,7 @@ async def language_command(update: Update, context: CallbackContext) -> None:
     
     if chat.type == "private":
         # For private chats, set user language
-        message.reply_text(
+        await api_call(context, message.reply_text,
             "Select your preferred language:",
             reply_markup=reply_markup
         )
@@ -167,7 +168,7 @@ async def language_command(update: Update, context: CallbackContext) -> None:
         chat_data = await db.get_chat(chat.id) or {}
         group_lang = chat_data.get("language", "en").upper()
         
-        message.reply_text(
+        await api_call(context, message.reply_text,
             f"Current group language: {group_lang}\n\n"
             f"To set your personal language preference, select below:",
             reply_markup=reply_markup
@@ -177,7 +178,7 @@ async def language_command(update: Update, context: CallbackContext) -> None:
 async def user_language(update: Update, context: CallbackContext) -> None:
     """Set user language preference"""
     query = update.callback_query
-    query.answer()
+    await api_call(context, query.answer)
     
     # Get the language code from callback data
     data = query.data.split("_")
@@ -198,7 +199,7 @@ async def user_language(update: Update, context: CallbackContext) -> None:
     user_data["language"] = lang_code
     await db.update_user(user.id, user_data)
     
-    query.edit_message_text(
+    await api_call(context, query.edit_message_text,
         text=f"Your language preference has been set to {lang_code.upper()}."
     )
 
@@ -211,7 +212,7 @@ async def gdpr_command(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type != "private":
-        message.reply_text("Please use this command in private chat with the bot.")
+        await api_call(context, message.reply_text, "Please use this command in private chat with the bot.")
         return
     
     # Create confirmation keyboard
@@ -223,7 +224,7 @@ async def gdpr_command(update: Update, context: CallbackContext) -> None:
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    message.reply_text(
+    await api_call(context, message.reply_text,
         "This will delete all your personal data stored by the bot.\n\n"
         "This includes:\n"
         "- Your language preferences\n"
@@ -237,7 +238,7 @@ async def gdpr_command(update: Update, context: CallbackContext) -> None:
 async def gdpr_button(update: Update, context: CallbackContext) -> None:
     """Handle GDPR confirmation buttons"""
     query = update.callback_query
-    query.answer()
+    await api_call(context, query.answer)
     
     # Get the action from callback data
     data = query.data.split("_")
@@ -260,14 +261,14 @@ async def gdpr_button(update: Update, context: CallbackContext) -> None:
         # Clear user data from context
         context.user_data.clear()
         
-        query.edit_message_text(
+        await api_call(context, query.edit_message_text,
             text="Your data has been deleted as per GDPR requirements."
         )
         
         # Log the action
         log_channel = context.bot_data.get("log_channel")
         if log_channel:
-            context.bot.send_message(
+            await api_call(context, context.bot.send_message,
                 chat_id=log_channel,
                 text=f"#GDPR_DELETE\n"
                      f"User: {user.first_name} (ID: {user.id})\n"
@@ -275,17 +276,17 @@ async def gdpr_button(update: Update, context: CallbackContext) -> None:
             )
     
     elif action == "cancel":
-        query.edit_message_text(
+        await api_call(context, query.edit_message_text,
             text="Data deletion cancelled. Your data remains stored."
         )
 
 # Define handlers
 HANDLERS = [
-    CommandHandler("settings", lambda update, context: context.dispatcher.run_async(settings, update, context), filters=~TgFilters.private),
-    CommandHandler("language", lambda update, context: context.dispatcher.run_async(language_command, update, context)),
-    CommandHandler("gdpr", lambda update, context: context.dispatcher.run_async(gdpr_command, update, context)),
-    CallbackQueryHandler(lambda update, context: context.dispatcher.run_async(settings_button, update, context), pattern=r"^settings_"),
-    CallbackQueryHandler(lambda update, context: context.dispatcher.run_async(set_language, update, context), pattern=r"^setlang_"),
-    CallbackQueryHandler(lambda update, context: context.dispatcher.run_async(user_language, update, context), pattern=r"^userlang_"),
-    CallbackQueryHandler(lambda update, context: context.dispatcher.run_async(gdpr_button, update, context), pattern=r"^gdpr_")
+    CommandHandler("settings", settings, filters=~TgFilters.private),
+    CommandHandler("language", language_command),
+    CommandHandler("gdpr", gdpr_command),
+    CallbackQueryHandler(settings_button, pattern=r"^settings_"),
+    CallbackQueryHandler(set_language, pattern=r"^setlang_"),
+    CallbackQueryHandler(user_language, pattern=r"^userlang_"),
+    CallbackQueryHandler(gdpr_button, pattern=r"^gdpr_")
 ]
\ No newline at end of file
@@ -4,6 +4,8 @@ from telegram.ext import CommandHandler, CallbackContext, Filters
 from telegram.error import BadRequest
 
 from lemon.utils.decorators import admin_only, bot_admin, send_typing
+from lemon.utils.admins import check_user_admin
+from lemon.core.scheduler import api_call
 from lemon.database import db
 
 # Maximum number of warnings before ban
@@ -20,12 +22,12 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if replying to a message
     if not message.reply_to_message:
-        message.reply_text("Reply to a message to warn the user.")
+        await api_call(context, message.reply_text, "Reply to a message to warn the user.")
         return
     
     # Get the user to warn
@@ -33,12 +35,11 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
     
     # Don't allow warning admins
     try:
-        member = chat.get_member(warned_user.id)
-        if member.status in ["administrator", "creator"]:
-            message.reply_text("I can't warn administrators!")
+        if await check_user_admin(context, chat.id, warned_user.id):
+            await api_call(context, message.reply_text, "I can't warn administrators!")
             return
     except BadRequest as e:
-        message.reply_text(f"Error: {e.message}")
+        await api_call(context, message.reply_text, f"Error: {e.message}")
         return
     
     # Get reason for warning
@@ -51,9 +52,9 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
         # Check if user has reached max warnings
         if warn_count >= MAX_WARNS:
             # Ban the user
-            chat.kick_member(warned_user.id)
+            await api_call(context, chat.kick_member, warned_user.id)
             
-            message.reply_text(
+            await api_call(context, message.reply_text,
                 f"{warned_user.first_name} has been banned after receiving {warn_count} warnings."
             )
             
@@ -62,7 +63,7 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
             
             # Log the action
             if context.bot.log_channel:
-                context.bot.send_message(
+                await api_call(context, context.bot.send_message,
                     chat_id=context.bot.log_channel,
                     text=f"#BAN_AFTER_WARNINGS\n"
                          f"User: {warned_user.first_name} (ID: {warned_user.id})\n"
@@ -77,7 +78,7 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            message.reply_text(
+            await api_call(context, message.reply_text,
                 f"User {warned_user.first_name} has been warned.\n"
                 f"Current warnings: {warn_count}/{MAX_WARNS}\n"
                 f"Reason: {reason}",
@@ -86,7 +87,7 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
             
             # Log the action
             if context.bot.log_channel:
-                context.bot.send_message(
+                await api_call(context, context.bot.send_message,
                     chat_id=context.bot.log_channel,
                     text=f"#WARN\n"
                          f"Admin: {user.first_name} (ID: {user.id})\n"
@@ -96,7 +97,7 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
                          f"Reason: {reason}"
                 )
     except Exception as e:
-        message.reply_text(f"An error occurred: {e}")
+        await api_call(context, message.reply_text, f"An error occurred: {e}")
 
 # Reset warnings for a user
 @send_typing
@@ -109,12 +110,12 @@ async def reset_warns(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get the user to reset warnings for
     if not message.reply_to_message and not context.args:
-        message.reply_text("Reply to a user or provide a username to reset warnings.")
+        await api_call(context, message.reply_text, "Reply to a user or provide a username to reset warnings.")
         return
     
     try:
@@ -128,18 +129,18 @@ async def reset_warns(update: Update, context: CallbackContext) -> None:
                 username = username[1:]
             
             # Try to get user by username
-            chat_member = context.bot.get_chat_member(chat.id, username)
+            chat_member = await api_call(context, context.bot.get_chat_member, chat.id, username)
             target_id = chat_member.user.id
             target_name = chat_member.user.first_name
         
         # Reset warnings in database
         await db.reset_warns(chat.id, target_id)
         
-        message.reply_text(f"Warnings have been reset for {target_name}.")
+        await api_call(context, message.reply_text, f"Warnings have been reset for {target_name}.")
         
         # Log the action
         if context.bot.log_channel:
-            context.bot.send_message(
+            await api_call(context, context.bot.send_message,
                 chat_id=context.bot.log_channel,
                 text=f"#RESETWARNS\n"
                      f"Admin: {user.first_name} (ID: {user.id})\n"
@@ -147,7 +148,7 @@ async def reset_warns(update: Update, context: CallbackContext) -> None:
                      f"Chat: {chat.title} (ID: {chat.id})"
             )
     except BadRequest as e:
-        message.reply_text(f"Error: {e.message}")
+        await api_call(context, message.reply_text, f"Error: {e.message}")
 
 # Check warnings for a user
 @send_typing
@@ -157,12 +158,12 @@ async def check_warns(update: Update, context: CallbackContext) -> None:
     message = update.effective_message
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Get the user to check warnings for
     if not message.reply_to_message and not context.args:
-        message.reply_text("Reply to a user or provide a username to check warnings.")
+        await api_call(context, message.reply_text, "Reply to a user or provide a username to check warnings.")
         return
     
     try:
@@ -176,7 +177,7 @@ async def check_warns(update: Update, context: CallbackContext) -> None:
                 username = username[1:]
             
             # Try to get user by username
-            chat_member = context.bot.get_chat_member(chat.id, username)
+            chat_member = await api_call(context, context.bot.get_chat_member, chat.id, username)
             target_id = chat_member.user.id
             target_name = chat_member.user.first_name
         
@@ -184,7 +185,7 @@ async def check_warns(update: Update, context: CallbackContext) -> None:
         warns_data = await db.get_warns(chat.id, target_id)
         
         if not warns_data or not warns_data.get("warns"):
-            message.reply_text(f"{target_name} has no warnings.")
+            await api_call(context, message.reply_text, f"{target_name} has no warnings.")
             return
         
         warns = warns_data.get("warns", [])
@@ -196,9 +197,9 @@ async def check_warns(update: Update, context: CallbackContext) -> None:
             reason = warn.get("reason", "No reason provided")
             warn_text += f"{i}. {reason}\n"
         
-        message.reply_text(warn_text)
+        await api_call(context, message.reply_text, warn_text)
     except BadRequest as e:
-        message.reply_text(f"Error: {e.message}")
+        await api_call(context, message.reply_text, f"Error: {e.message}")
 
 # Report a message to admins
 @send_typing
@@ -209,12 +210,12 @@ async def report(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     
     if chat.type == "private":
-        message.reply_text("This command can only be used in groups.")
+        await api_call(context, message.reply_text, "This command can only be used in groups.")
         return
     
     # Check if replying to a message
     if not message.reply_to_message:
-        message.reply_text("Reply to a message to report it to admins.")
+        await api_call(context, message.reply_text, "Reply to a message to report it to admins.")
         return
     
     # Get all admins in the group
@@ -234,7 +235,7 @@ async def report(update: Update, context: CallbackContext) -> None:
     admin_mention = " ".join([f"[.](tg://user?id={admin_id})" for admin_id in admin_list])
     
     # Send report
-    message.reply_text(
+    await api_call(context, message.reply_text,
         f"{report_text}\n\n{admin_mention}",
         parse_mode="Markdown"
     )
@@ -0,0 +1,61 @@
+import os
+from telegram import ChatMember
+
+from lemon.core.scheduler import api_call
+from lemon.utils.cache import TTLCache
+
+# Admin roster cache configuration
+ADMIN_CACHE_SIZE = int(os.getenv("ADMIN_CACHE_SIZE", 10000))
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", 600))
+
+# Administrators per chat, keyed by user ID
+admin_cache = TTLCache(maxsize=ADMIN_CACHE_SIZE, ttl=ADMIN_CACHE_TTL)
+
+def get_admins(bot, chat_id) -> dict:
+    """Get the administrators of a chat keyed by user ID"""
+    admins = admin_cache.get(chat_id)
+    if admins is None:
+        admins = {member.user.id: member for member in bot.get_chat_administrators(chat_id)}
+        admin_cache.set(chat_id, admins)
+    return admins
+
+async def fetch_admins(context, chat_id) -> dict:
+    """Get the administrators of a chat keyed by user ID, for coroutine handlers
+
+    A roster missing from the cache is fetched through the request scheduler
+    instead of blocking the event loop.
+    """
+    admins = admin_cache.get(chat_id)
+    if admins is None:
+        members = await api_call(context, context.bot.get_chat_administrators, chat_id)
+        admins = {member.user.id: member for member in members}
+        admin_cache.set(chat_id, admins)
+    return admins
+
+def get_admin(bot, chat_id, user_id):
+    """Get the ChatMember of an administrator, or None if the user is not one"""
+    return get_admins(bot, chat_id).get(user_id)
+
+def is_user_admin(bot, chat_id, user_id) -> bool:
+    """Check if a user is an administrator of a chat"""
+    return user_id in get_admins(bot, chat_id)
+
+async def check_user_admin(context, chat_id, user_id) -> bool:
+    """Check if a user is an administrator of a chat, for coroutine handlers"""
+    return user_id in await fetch_admins(context, chat_id)
+
+def invalidate_admins(chat_id) -> None:
+    """Drop the cached administrators of a chat"""
+    admin_cache.pop(chat_id)
+
+def apply_member_update(chat_member_updated) -> None:
+    """Apply a chat member update to the cached roster of its chat"""
+    admins = admin_cache.get(chat_member_updated.chat.id)
+    if admins is None:
+        return
+
+    member = chat_member_updated.new_chat_member
+    if member.status in [ChatMember.ADMINISTRATOR, ChatMember.CREATOR]:
+        admins[member.user.id] = member
+    else:
+        admins.pop(member.user.id, None)
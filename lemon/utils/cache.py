@@ -0,0 +1,87 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Size bounded LRU cache whose entries expire after a fixed TTL
+
+    Caches are shared by the PTB worker threads and the event loop thread,
+    so every access holds a lock.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        """Initialize the cache"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Cache statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def get(self, key, default=None):
+        """Get a value, refreshing its LRU position"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            # Drop expired entries on access
+            if entry[1] <= time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting expired and least recently used entries"""
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+
+            # Entries are kept in access order, so expired ones collect at the front
+            while self._data:
+                oldest_key, (_, expires) = next(iter(self._data.items()))
+                if expires > now and len(self._data) <= self.maxsize:
+                    break
+                del self._data[oldest_key]
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove a value and return it"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        """Remove all values"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+from lemon.core.dispatch import SERVICE_TASK_PREFIX
+from lemon.utils.captcha_render import render_captchas
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Captcha pool configuration
+CAPTCHA_POOL_SIZE = int(os.getenv("CAPTCHA_POOL_SIZE", 200))
+CAPTCHA_POOL_PROCESSES = int(os.getenv("CAPTCHA_POOL_PROCESSES", 2))
+
+# Images rendered per process pool task, amortizing the transfer between processes
+RENDER_BATCH = 10
+
+class CaptchaPool:
+    """Bounded buffer of pre-rendered captchas, refilled by a process pool
+
+    Joins take a ready captcha from the buffer. Only when it has run dry is
+    one rendered on demand, still in the process pool so the event loop
+    never does PIL work.
+    """
+
+    def __init__(self, size=CAPTCHA_POOL_SIZE, processes=CAPTCHA_POOL_PROCESSES, code_length=6):
+        """Initialize the pool"""
+        self.size = size
+        self.processes = processes
+        self.code_length = code_length
+        self._buffer = deque(maxlen=size)
+        self._executor = None
+        self._refill_task = None
+
+        # Pool statistics
+        self.hits = 0
+        self.misses = 0
+        self.rendered = 0
+        self.refilled = 0
+        self.refill_seconds = 0.0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def _render(self, count):
+        """Render captchas in the process pool"""
+        if self._executor is None:
+            # Spawned workers don't inherit the bot's threads and connections
+            self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return asyncio.get_running_loop().run_in_executor(self._executor, render_captchas, count, self.code_length)
+
+    def warm(self):
+        """Start refilling the buffer in the background if it isn't full"""
+        if len(self._buffer) < self.size and (self._refill_task is None or self._refill_task.done()):
+            self._refill_task = asyncio.get_running_loop().create_task(
+                self._refill(), name=f"{SERVICE_TASK_PREFIX}captcha_refill"
+            )
+
+    async def _refill(self):
+        """Fill the buffer, keeping every process busy"""
+        started = time.monotonic()
+        try:
+            while len(self._buffer) < self.size:
+                missing = self.size - len(self._buffer)
+                batches = [
+                    self._render(min(RENDER_BATCH, missing - offset))
+                    for offset in range(0, min(missing, RENDER_BATCH * self.processes), RENDER_BATCH)
+                ]
+                for captchas in await asyncio.gather(*batches):
+                    self._buffer.extend(captchas)
+                    self.rendered += len(captchas)
+                    self.refilled += len(captchas)
+        except Exception as e:
+            logger.error(f"Failed to refill captcha pool: {e}")
+        finally:
+            self.refill_seconds += time.monotonic() - started
+
+    async def get(self):
+        """Get a (code, PNG bytes) captcha"""
+        try:
+            captcha = self._buffer.popleft()
+            self.hits += 1
+        except IndexError:
+            self.misses += 1
+            [captcha] = await self._render(1)
+            self.rendered += 1
+
+        self.warm()
+        return captcha
+
+    def stats(self) -> dict:
+        """Get buffer and refill statistics"""
+        return {
+            "buffered": len(self._buffer),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rendered": self.rendered,
+            "refill_rate": self.refilled / self.refill_seconds if self.refill_seconds else 0.0
+        }
+
+    async def close(self):
+        """Stop refilling and shut down the worker processes"""
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Captchas served to new members
+captcha_pool = CaptchaPool()
@@ -0,0 +1,21 @@
+import random
+import string
+
+# Runs in the captcha pool's spawned processes, which import this module by
+# name, so it must not import the bot, the database or anything else heavy
+
+def generate_captcha_code(length=6):
+    """Generate a random captcha code"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+
+def render_captchas(count, length=6):
+    """Render count (code, PNG bytes) pairs"""
+    # Imported here so the bot process only loads PIL when it renders itself
+    from captcha.image import ImageCaptcha
+
+    image = ImageCaptcha(width=280, height=90)
+    captchas = []
+    for _ in range(count):
+        code = generate_captcha_code(length)
+        captchas.append((code, image.generate(code).getvalue()))
+    return captchas
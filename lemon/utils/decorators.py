@@ -1,22 +1,64 @@
+import inspect
 import functools
 from typing import Callable, Any
 from telegram import Update, ChatMember
 from telegram.ext import CallbackContext
 
+from lemon.core.scheduler import api_call
+from lemon.utils.admins import get_admin, is_user_admin, fetch_admins, check_user_admin
+
 def send_typing(func: Callable) -> Callable:
     """Send typing action while processing command."""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(update: Update, context: CallbackContext, *args, **kwargs) -> Any:
+            if update.effective_chat.type != "private":
+                await api_call(
+                    context,
+                    context.bot.send_chat_action,
+                    chat_id=update.effective_chat.id,
+                    action="typing"
+                )
+            return await func(update, context, *args, **kwargs)
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(update: Update, context: CallbackContext, *args, **kwargs) -> Any:
         if update.effective_chat.type != "private":
-            context.bot.send_chat_action(
+            # Sent through the scheduler on the loop, the command doesn't wait for it
+            context.bot_data["async_dispatcher"].submit(api_call(
+                context,
+                context.bot.send_chat_action,
                 chat_id=update.effective_chat.id,
                 action="typing"
-            )
+            ))
         return func(update, context, *args, **kwargs)
     return wrapper
 
 def admin_only(func: Callable) -> Callable:
     """Restrict command to admins only."""
+    if inspect.iscoroutinefunction(func):
+        # Checked on the event loop, where the admin cache lives
+        @functools.wraps(func)
+        async def async_wrapper(update: Update, context: CallbackContext, *args, **kwargs) -> Any:
+            user_id = update.effective_user.id
+            chat_id = update.effective_chat.id
+            
+            if user_id in context.bot_data.get("sudo_users", []):
+                return await func(update, context, *args, **kwargs)
+            
+            try:
+                is_admin = await check_user_admin(context, chat_id, user_id)
+            except Exception as e:
+                await api_call(context, update.message.reply_text, f"Error checking admin status: {e}")
+                return None
+            
+            if is_admin:
+                return await func(update, context, *args, **kwargs)
+            await api_call(context, update.message.reply_text, "This command is restricted to admins only.")
+            return None
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(update: Update, context: CallbackContext, *args, **kwargs) -> Any:
         user_id = update.effective_user.id
@@ -30,8 +72,7 @@ def admin_only(func: Callable) -> Callable:
         
         # Check if user is a chat admin
         try:
-            member = context.bot.get_chat_member(chat_id, user_id)
-            if member.status in ["administrator", "creator"]:
+            if is_user_admin(context.bot, chat_id, user_id):
                 return func(update, context, *args, **kwargs)
             else:
                 update.message.reply_text("This command is restricted to admins only.")
@@ -43,6 +84,25 @@ def admin_only(func: Callable) -> Callable:
 
 def bot_admin(func: Callable) -> Callable:
     """Check if bot is admin in the chat."""
+    if inspect.iscoroutinefunction(func):
+        # Checked on the event loop, where the admin cache lives
+        @functools.wraps(func)
+        async def async_wrapper(update: Update, context: CallbackContext, *args, **kwargs) -> Any:
+            if update.effective_chat.type == "private":
+                return await func(update, context, *args, **kwargs)
+            
+            try:
+                bot_member = (await fetch_admins(context, update.effective_chat.id)).get(context.bot.id)
+            except Exception as e:
+                await api_call(context, update.message.reply_text, f"Error checking bot admin status: {e}")
+                return None
+            
+            if not bot_member or bot_member.status != "administrator":
+                await api_call(context, update.message.reply_text, "I need to be an administrator to use this command.")
+                return None
+            return await func(update, context, *args, **kwargs)
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(update: Update, context: CallbackContext, *args, **kwargs) -> Any:
         chat_id = update.effective_chat.id
@@ -53,8 +113,8 @@ def bot_admin(func: Callable) -> Callable:
         
         # Check if bot is admin
         try:
-            bot_member = context.bot.get_chat_member(chat_id, context.bot.id)
-            if bot_member.status != "administrator":
+            bot_member = get_admin(context.bot, chat_id, context.bot.id)
+            if not bot_member or bot_member.status != "administrator":
                 update.message.reply_text("I need to be an administrator to use this command.")
                 return None
             return func(update, context, *args, **kwargs)
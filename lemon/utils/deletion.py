@@ -0,0 +1,137 @@
+import time
+import asyncio
+import logging
+from telegram.error import BadRequest, InvalidToken, TelegramError
+
+from lemon.core.scheduler import BULK
+from lemon.utils.fanout import PROGRESS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# deleteMessages takes at most this many message IDs
+BATCH_SIZE = 100
+
+# Cleared once the Bot API server turns out not to know deleteMessages
+batch_supported = True
+
+class DeletionResult:
+    """Outcome of a deletion job"""
+
+    def __init__(self, total):
+        self.total = total
+        self.deleted = 0
+        self.failed = 0
+        self.cancelled = False
+        self.elapsed = 0.0
+
+    @property
+    def done(self):
+        return self.deleted + self.failed
+
+    def summary(self):
+        """Get a short human readable summary"""
+        status = "Cancelled after deleting" if self.cancelled else "Deleted"
+        return f"{status} {self.deleted} of {self.total} messages ({self.elapsed:.1f}s)"
+
+class DeletionJob:
+    """Delete many messages of a chat as bulk work of the request scheduler
+
+    Messages go in batches of BATCH_SIZE through deleteMessages. Servers
+    without that method get concurrent single deletes instead, which the
+    scheduler keeps under the rate limits. A job can be cancelled at any
+    time, work already sent to Telegram still completes.
+    """
+
+    def __init__(self, scheduler, bot, chat_id, message_ids, progress=None, concurrency=16):
+        """Initialize the job"""
+        self.scheduler = scheduler
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_ids = list(dict.fromkeys(message_ids))
+        self.progress = progress
+        self.concurrency = concurrency
+        self.result = DeletionResult(len(self.message_ids))
+
+        self._cancelled = False
+        self._last_report = 0.0
+
+    def cancel(self):
+        """Stop the job before its next request"""
+        self._cancelled = True
+
+    async def run(self) -> DeletionResult:
+        """Delete the messages and return the outcome"""
+        started = self._last_report = time.monotonic()
+
+        for offset in range(0, len(self.message_ids), BATCH_SIZE):
+            if self._cancelled:
+                break
+
+            chunk = self.message_ids[offset:offset + BATCH_SIZE]
+            if not (batch_supported and await self._delete_batch(chunk)):
+                await self._delete_single(chunk)
+            await self._report()
+
+        self.result.cancelled = self._cancelled
+        self.result.elapsed = time.monotonic() - started
+        return self.result
+
+    async def _delete_batch(self, message_ids) -> bool:
+        """Delete messages with one deleteMessages call, returns False to fall back to single deletes"""
+        global batch_supported
+
+        try:
+            # PTB 13 predates deleteMessages, so it is posted directly
+            await self.scheduler.call(
+                self.bot._post,
+                "deleteMessages",
+                {"chat_id": self.chat_id, "message_ids": message_ids},
+                priority=BULK
+            )
+        except InvalidToken:
+            # The Bot API answers unknown methods with 404
+            logger.info("deleteMessages is not available, falling back to single deletes")
+            batch_supported = False
+            return False
+        except BadRequest as e:
+            # None of the messages could be deleted, single deletes tell which ones are left
+            logger.debug(f"Batch delete failed in chat {self.chat_id}: {e}")
+            return False
+
+        # Messages that no longer exist are skipped by Telegram
+        self.result.deleted += len(message_ids)
+        return True
+
+    async def _delete_single(self, message_ids):
+        """Delete messages one call each, concurrently"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def delete(message_id):
+            async with semaphore:
+                if self._cancelled:
+                    return
+                try:
+                    await self.scheduler.call(
+                        self.bot.delete_message,
+                        chat_id=self.chat_id,
+                        message_id=message_id,
+                        priority=BULK
+                    )
+                    self.result.deleted += 1
+                except TelegramError:
+                    # Skip messages that can't be deleted
+                    self.result.failed += 1
+            await self._report()
+
+        await asyncio.gather(*(delete(message_id) for message_id in message_ids))
+
+    async def _report(self):
+        """Call the progress callback, at most every PROGRESS_INTERVAL seconds"""
+        if not self.progress or self._cancelled or time.monotonic() - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = time.monotonic()
+
+        try:
+            await self.scheduler.call(self.progress, self.result.done, self.result.total)
+        except TelegramError as e:
+            logger.warning(f"Failed to report deletion progress: {e}")
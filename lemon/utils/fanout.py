@@ -0,0 +1,73 @@
+import os
+import time
+import asyncio
+import logging
+from telegram.error import TelegramError
+
+from lemon.core.scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+# Calls of one fan-out waiting in the request scheduler at once
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 16))
+
+# Seconds between progress reports, editing one message faster than this gets throttled
+PROGRESS_INTERVAL = 3
+
+class FanOutResult:
+    """Outcome of a fan-out run"""
+
+    def __init__(self, total):
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def done(self):
+        return self.succeeded + self.failed
+
+    def summary(self):
+        """Get a short human readable summary"""
+        return (
+            f"Succeeded in {self.succeeded}/{self.total} chats, "
+            f"failed in {self.failed} ({self.elapsed:.1f}s)"
+        )
+
+async def fan_out(scheduler, func, chat_ids, progress=None, concurrency=FANOUT_CONCURRENCY):
+    """Call func(chat_id) for every chat as bulk work of the request scheduler
+
+    func is a blocking Bot API call, rate limits and flood waits are handled
+    by the scheduler. progress(done, total) is called at most every
+    PROGRESS_INTERVAL seconds.
+    """
+    chat_ids = list(dict.fromkeys(chat_ids))
+    semaphore = asyncio.Semaphore(concurrency)
+    result = FanOutResult(len(chat_ids))
+    started = last_report = time.monotonic()
+
+    async def report():
+        nonlocal last_report
+        if not progress or time.monotonic() - last_report < PROGRESS_INTERVAL:
+            return
+        last_report = time.monotonic()
+        try:
+            await scheduler.call(progress, result.done, result.total)
+        except TelegramError as e:
+            logger.warning(f"Failed to report fan-out progress: {e}")
+
+    async def run(chat_id):
+        async with semaphore:
+            try:
+                await scheduler.call(func, chat_id, priority=BULK)
+                result.succeeded += 1
+            except TelegramError as e:
+                logger.debug(f"Fan-out call failed in chat {chat_id}: {e}")
+                result.failed += 1
+        await report()
+
+    # Only a bounded number of calls wait in the scheduler, interactive calls overtake them anyway
+    await asyncio.gather(*(run(chat_id) for chat_id in chat_ids))
+
+    result.elapsed = time.monotonic() - started
+    return result
@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import OrderedDict, deque, namedtuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Message history configuration
+HISTORY_CHAT_SIZE = int(os.getenv("HISTORY_CHAT_SIZE", 1000))
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", 500000))
+HISTORY_PERSIST = os.getenv("HISTORY_PERSIST", "").lower() in ("1", "true", "yes")
+
+# Seconds persisted history is kept after shutdown
+HISTORY_PERSIST_TTL = 86400
+
+# Metadata kept per message, date is a Unix timestamp
+HistoryEntry = namedtuple("HistoryEntry", ["message_id", "sender_id", "is_bot", "is_command", "date"])
+
+class MessageHistory:
+    """Bounded per-chat ring buffers of recent message metadata
+
+    The Bot API cannot list the messages of a chat, so the bot remembers the
+    ones it sees. Each chat keeps its last ``chat_size`` messages, and when
+    all chats together hold more than ``max_entries`` messages the chats
+    that were quiet the longest are dropped.
+    """
+
+    def __init__(self, chat_size=HISTORY_CHAT_SIZE, max_entries=HISTORY_MAX_ENTRIES):
+        """Initialize the history"""
+        self.chat_size = chat_size
+        self.max_entries = max_entries
+        self._chats = OrderedDict()
+        self._entries = 0
+        self._loaded = set()
+
+        # Recorded from handler threads and from the threads sending the bot's messages
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._entries
+
+    def record(self, chat_id, message_id, sender_id, is_bot, is_command, date) -> None:
+        """Remember a message"""
+        with self._lock:
+            buffer = self._chats.get(chat_id)
+            if buffer is None:
+                buffer = self._chats[chat_id] = deque(maxlen=self.chat_size)
+            else:
+                self._chats.move_to_end(chat_id)
+
+            if len(buffer) == buffer.maxlen:
+                self._entries -= 1
+            buffer.append(HistoryEntry(message_id, sender_id, is_bot, is_command, date))
+            self._entries += 1
+
+            while self._entries > self.max_entries:
+                _, evicted = self._chats.popitem(last=False)
+                self._entries -= len(evicted)
+
+    def record_message(self, message) -> None:
+        """Remember a telegram.Message"""
+        sender = message.from_user
+        text = message.text or message.caption or ""
+        self.record(
+            message.chat_id,
+            message.message_id,
+            sender.id if sender else None,
+            bool(sender and sender.is_bot),
+            text.startswith("/"),
+            int(message.date.timestamp()) if message.date else 0
+        )
+
+    def recent(self, chat_id, limit=None) -> list:
+        """Get up to limit of the most recent messages of a chat, newest first"""
+        with self._lock:
+            buffer = self._chats.get(chat_id)
+            if not buffer:
+                return []
+            entries = list(buffer)
+
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def forget(self, chat_id, message_ids) -> None:
+        """Drop messages, e.g. after deleting them"""
+        message_ids = set(message_ids)
+        with self._lock:
+            buffer = self._chats.get(chat_id)
+            if not buffer:
+                return
+
+            kept = [entry for entry in buffer if entry.message_id not in message_ids]
+            self._entries -= len(buffer) - len(kept)
+            buffer.clear()
+            buffer.extend(kept)
+
+    async def load(self, store, chat_id) -> None:
+        """Merge the history persisted for a chat in front of what was recorded since startup"""
+        if chat_id in self._loaded:
+            return
+        self._loaded.add(chat_id)
+
+        persisted = await store.get("history", str(chat_id))
+        if not persisted:
+            return
+
+        with self._lock:
+            buffer = self._chats.get(chat_id)
+            if buffer is None:
+                buffer = self._chats[chat_id] = deque(maxlen=self.chat_size)
+
+            newest = buffer[0].message_id if buffer else float("inf")
+            older = [HistoryEntry(*entry) for entry in persisted if entry[0] < newest]
+            older = older[-(self.chat_size - len(buffer)):] if len(buffer) < self.chat_size else []
+
+            self._entries += len(older)
+            buffer.extendleft(reversed(older))
+
+    async def save(self, store) -> None:
+        """Persist the history of all chats in one batch"""
+        with self._lock:
+            items = {str(chat_id): [list(entry) for entry in buffer] for chat_id, buffer in self._chats.items()}
+        await store.set_many("history", items, HISTORY_PERSIST_TTL)
+
+    def stats(self) -> dict:
+        """Get the number of chats and messages held"""
+        return {
+            "chats": len(self._chats),
+            "entries": self._entries,
+            "max_entries": self.max_entries
+        }
+
+# Recent messages of all chats
+message_history = MessageHistory()
@@ -0,0 +1,56 @@
+class KeywordMatcher:
+    """Match a set of keywords against a message in a single scan
+
+    Keywords are indexed by their first word, so the cost of a match depends
+    on the message length and not on the number of keywords. Keywords can
+    span several words, in which case they must appear as consecutive words.
+    """
+
+    def __init__(self, items=()):
+        """Build the matcher from (keyword, value) pairs in priority order"""
+        self._index = {}
+        self._size = 0
+
+        for priority, (keyword, value) in enumerate(items):
+            words = keyword.lower().split()
+            if not words:
+                continue
+            self._index.setdefault(words[0], []).append((priority, words, value))
+            self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def find_all(self, text):
+        """Get the values of all keywords found in the text, in priority order"""
+        return [value for _, value in sorted(self._scan(text), key=lambda match: match[0])]
+
+    def find(self, text):
+        """Get the value of the highest priority keyword found in the text"""
+        best = None
+        for priority, value in self._scan(text):
+            if best is None or priority < best[0]:
+                best = (priority, value)
+                if priority == 0:
+                    break
+        return best[1] if best else None
+
+    def _scan(self, text):
+        """Yield (priority, value) for every keyword occurrence in the text"""
+        if not self._index:
+            return
+
+        words = text.lower().split()
+        seen = set()
+        for i, word in enumerate(words):
+            candidates = self._index.get(word)
+            if not candidates:
+                continue
+
+            for priority, keyword_words, value in candidates:
+                if priority in seen:
+                    continue
+                if len(keyword_words) > 1 and words[i:i + len(keyword_words)] != keyword_words:
+                    continue
+                seen.add(priority)
+                yield priority, value
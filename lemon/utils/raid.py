@@ -0,0 +1,243 @@
+import os
+import time
+import asyncio
+import logging
+import importlib
+from collections import deque
+from dotenv import load_dotenv
+
+from lemon.core.dispatch import async_job
+from lemon.core.scheduler import api_call, BULK
+from lemon.database import db
+from lemon.utils.cache import TTLCache
+from lemon.utils.timers import TimerWheel
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Joins within RAID_WINDOW seconds that put a chat in raid mode
+RAID_THRESHOLD = int(os.getenv("RAID_THRESHOLD", 10))
+RAID_WINDOW = float(os.getenv("RAID_WINDOW", 10))
+
+# Seconds a chat stays in raid mode after its last join above the threshold
+RAID_COOLDOWN = int(os.getenv("RAID_COOLDOWN", 60))
+
+# Joins collected before a batch is handled, at most RAID_BATCH_SIZE members or RAID_BATCH_DELAY seconds
+RAID_BATCH_SIZE = int(os.getenv("RAID_BATCH_SIZE", 50))
+RAID_BATCH_DELAY = float(os.getenv("RAID_BATCH_DELAY", 3))
+
+# Seconds between two runs of a sweeper, and the resolution of its deadlines
+SWEEP_INTERVAL = 1
+
+# Names listed in an aggregated message before the rest are counted
+NAMES_SHOWN = 10
+
+def join_names(names, limit=NAMES_SHOWN):
+    """Join names into one readable list, counting those past limit"""
+    if len(names) > limit:
+        return f"{', '.join(names[:limit])} and {len(names) - limit} others"
+    if len(names) > 1:
+        return f"{', '.join(names[:-1])} and {names[-1]}"
+    return "".join(names)
+
+async def kick_member(context, chat_id, user_id):
+    """Kick a member as bulk work, leaving them free to rejoin"""
+    await api_call(context, context.bot.kick_chat_member, chat_id, user_id, priority=BULK)
+    await api_call(context, context.bot.unban_chat_member, chat_id, user_id, priority=BULK)
+
+class JoinRateMonitor:
+    """Detects join raids from the join rate of each chat"""
+
+    def __init__(self, threshold=RAID_THRESHOLD, window=RAID_WINDOW, cooldown=RAID_COOLDOWN, maxsize=10000):
+        """Initialize the monitor"""
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+
+        # The last threshold join times of each chat, and the time raid mode ends in raiding chats
+        self._joins = TTLCache(maxsize, ttl=window)
+        self._raids = TTLCache(maxsize, ttl=cooldown)
+
+        self.raids_detected = 0
+
+    def record(self, chat_id, count=1) -> bool:
+        """Record joins to a chat, returns True if the chat is in raid mode"""
+        now = time.monotonic()
+        joins = self._joins.get(chat_id)
+        if joins is None:
+            joins = deque(maxlen=self.threshold)
+        joins.extend([now] * min(count, self.threshold))
+        self._joins.set(chat_id, joins)
+
+        if len(joins) == self.threshold and now - joins[0] <= self.window:
+            if chat_id not in self._raids:
+                self.raids_detected += 1
+                logger.warning(f"Join raid detected in chat {chat_id}")
+            self._raids.set(chat_id, True)
+
+        return chat_id in self._raids
+
+    def in_raid(self, chat_id) -> bool:
+        """Check if a chat is in raid mode"""
+        return chat_id in self._raids
+
+class JoinBatcher:
+    """Collects the joins of raiding chats and handles them in batches
+
+    handler(context, message, members) is awaited once per batch with the
+    latest join message of the chat.
+    """
+
+    def __init__(self, handler, size=RAID_BATCH_SIZE, delay=RAID_BATCH_DELAY):
+        """Initialize the batcher"""
+        self.handler = handler
+        self.size = size
+        self.delay = delay
+        self._pending = {}
+        self._timers = {}
+
+    async def add(self, context, message, members):
+        """Add joined members to their chat's batch"""
+        chat_id = message.chat_id
+        batch = self._pending.setdefault(chat_id, [context, message, []])
+        batch[1] = message
+        batch[2].extend(members)
+
+        if len(batch[2]) >= self.size:
+            await self.flush(chat_id)
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(
+                self.delay, lambda: asyncio.ensure_future(self.flush(chat_id))
+            )
+
+    async def flush(self, chat_id):
+        """Handle the pending batch of a chat now"""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(chat_id, None)
+        if batch is None:
+            return
+
+        context, message, members = batch
+        try:
+            await self.handler(context, message, members)
+        except Exception as e:
+            logger.error(f"Error handling join batch in chat {chat_id}: {e}")
+
+# Sweepers by name, registered by the modules of the same name
+SWEEPERS = {}
+
+class Sweeper:
+    """Deadlines of many members kept in a timer wheel and expired by one repeating job
+
+    handler(context, expired) is awaited with the (key, data) pairs whose
+    deadline passed since the last sweep. Keys are tuples starting with the
+    chat ID. A named sweeper persists its deadlines, batching the writes of
+    each interval into one round trip, so they survive restarts. Their data
+    is persisted too, so it must hold whatever resolving a key early needs.
+    """
+
+    def __init__(self, handler, name=None, interval=SWEEP_INTERVAL):
+        """Initialize the sweeper"""
+        self.handler = handler
+        self.name = name
+        self.interval = interval
+        self._wheel = TimerWheel(tick=interval)
+        self._job = None
+
+        # Deadlines to store as (deadline, data) by key, None to delete
+        self._writes = {}
+
+        if name is not None:
+            SWEEPERS[name] = self
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def _start(self, job_queue):
+        if self._job is None:
+            self._job = job_queue.run_repeating(async_job(self.sweep), self.interval)
+
+    def schedule(self, job_queue, key, timeout, data=None):
+        """Expire a key after timeout seconds, starting the sweep job on first use"""
+        self._wheel.add(key, timeout, data)
+        if self.name is not None:
+            self._writes[key] = (time.time() + timeout, data)
+        self._start(job_queue)
+
+    def get(self, key, default=None):
+        """Get the data of a pending key, restored deadlines included"""
+        return self._wheel.get(key, default)
+
+    def cancel(self, key):
+        """Stop a key from expiring, freeing its slot"""
+        if self._wheel.cancel(key) and self.name is not None:
+            self._writes[key] = None
+
+    def restore(self, job_queue, deadlines):
+        """Add persisted deadlines back, those that passed expire on the next sweep"""
+        now = time.time()
+        for deadline in deadlines:
+            self._wheel.add(tuple(deadline["key"]), deadline["deadline"] - now, deadline.get("data"))
+        self._start(job_queue)
+
+    async def sweep(self, context):
+        """Hand all expired keys to the handler at once"""
+        expired = self._wheel.advance()
+        if expired:
+            try:
+                await self.handler(context, expired)
+            except Exception as e:
+                logger.error(f"Error handling expired deadlines: {e}")
+
+            if self.name is not None:
+                for key, _ in expired:
+                    self._writes[key] = None
+
+        await self.flush()
+
+    async def flush(self):
+        """Persist the deadline changes since the last flush"""
+        if not self._writes:
+            return
+
+        writes, self._writes = self._writes, {}
+        try:
+            await db.save_deadlines(self.name, writes)
+        except Exception as e:
+            logger.error(f"Failed to persist {self.name} deadlines: {e}")
+            # Keep changes made since for the next try
+            for key, entry in writes.items():
+                self._writes.setdefault(key, entry)
+
+    def stats(self) -> dict:
+        """Get timer wheel statistics"""
+        return self._wheel.stats()
+
+async def restore_sweepers(job_queue, owns=None):
+    """Reload the persisted deadlines of all sweepers in one query
+
+    Only modules with pending deadlines are imported, lazy ones included.
+    owns(chat_id) limits the deadlines to the chats of one cluster worker.
+    Returns the number of deadlines restored.
+    """
+    by_name = {}
+    for deadline in await db.get_deadlines():
+        if owns is None or owns(deadline["chat_id"]):
+            by_name.setdefault(deadline["name"], []).append(deadline)
+
+    for name, deadlines in by_name.items():
+        if name not in SWEEPERS:
+            importlib.import_module(f"lemon.modules.{name}")
+        SWEEPERS[name].restore(job_queue, deadlines)
+
+    return sum(len(deadlines) for deadlines in by_name.values())
+
+async def flush_sweepers():
+    """Persist the pending deadline changes of all sweepers"""
+    for sweeper in SWEEPERS.values():
+        await sweeper.flush()
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """Async token bucket allowing rate calls per second with bursts of up to burst calls"""
+
+    def __init__(self, rate, burst=None):
+        """Initialize the limiter"""
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """Add the tokens earned since the last update"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available without waiting"""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Get the seconds until a token is available"""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds) -> None:
+        """Hold back all callers for a number of seconds, e.g. after a flood wait"""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
@@ -0,0 +1,90 @@
+import math
+import time
+
+
+class TimerWheel:
+    """Hashed timer wheel of keyed deadlines, adding and cancelling one is O(1)
+
+    Time is cut into ticks and every deadline lands in the slot of its tick
+    modulo the number of slots, so advancing only looks at the slots of the
+    ticks that passed. Deadlines further out than one turn of the wheel
+    share a slot with nearer ones and are skipped until their turn comes.
+    """
+
+    def __init__(self, tick=1.0, slots=4096):
+        """Initialize the wheel"""
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._index = {}
+        self._current = self._tick_of(time.time())
+
+        # Wheel statistics
+        self.fired = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def _tick_of(self, timestamp):
+        return int(timestamp // self.tick)
+
+    def add(self, key, timeout, data=None):
+        """Expire a key with its data after timeout seconds, replacing an earlier deadline"""
+        previous = self._index.get(key)
+        if previous is not None:
+            del self._slots[previous][key]
+
+        due = max(math.ceil((time.time() + timeout) / self.tick), self._current + 1)
+        slot = due % len(self._slots)
+        self._slots[slot][key] = (due, data)
+        self._index[key] = slot
+
+    def get(self, key, default=None):
+        """Get the data of a pending key"""
+        slot = self._index.get(key)
+        if slot is None:
+            return default
+        return self._slots[slot][key][1]
+
+    def cancel(self, key) -> bool:
+        """Drop the deadline of a key, returns False if it had none"""
+        slot = self._index.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        self.cancelled += 1
+        return True
+
+    def advance(self, now=None) -> list:
+        """Move the wheel to now and remove the expired (key, data) pairs"""
+        target = self._tick_of(time.time() if now is None else now)
+        if target <= self._current:
+            return []
+
+        # After a gap longer than a turn every slot is due
+        ticks = range(self._current + 1, target + 1)
+        if len(ticks) >= len(self._slots):
+            ticks = range(len(self._slots))
+        self._current = target
+
+        expired = []
+        for tick in ticks:
+            slot = self._slots[tick % len(self._slots)]
+            due_keys = [key for key, (due, _) in slot.items() if due <= target]
+            for key in due_keys:
+                expired.append((key, slot.pop(key)[1]))
+                del self._index[key]
+
+        self.fired += len(expired)
+        return expired
+
+    def stats(self) -> dict:
+        """Get wheel statistics"""
+        return {
+            "pending": len(self._index),
+            "fired": self.fired,
+            "cancelled": self.cancelled
+        }
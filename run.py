@@ -4,7 +4,8 @@ Lemon Bot - Telegram Group Management Bot
 Run this file to start the bot.
 """
 
-from lemon.__main__ import main
-
 if __name__ == "__main__":
+    # Imported here as spawned processes re-run this file without starting the bot
+    from lemon.__main__ import main
+    
     main()
\ No newline at end of file
@@ -0,0 +1,158 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+# Importing the lemon package loads the bot and its dependencies
+pytest.importorskip("telegram")
+pytest.importorskip("motor")
+
+from lemon.modules import greetings
+from lemon.modules.greetings import Greeting
+
+def test_escaped_braces_without_placeholders():
+    greeting = Greeting("Hi {{x}}, read the rules")
+    assert greeting.render() == "Hi {x}, read the rules"
+    assert greeting.render(user="Alice", chat="Lemon") == "Hi {x}, read the rules"
+
+def test_escaped_braces_next_to_placeholders():
+    greeting = Greeting("Hi {user}, {{x}} is not a placeholder")
+    assert greeting.render(user="Alice") == "Hi Alice, {x} is not a placeholder"
+
+def test_literal_greeting_is_sent_as_saved():
+    greeting = Greeting("Hi {{x}} {unknown", literal=True)
+    assert greeting.render(user="Alice") == "Hi {{x}} {unknown"
+
+class FakeScheduler:
+    """Runs Bot API calls right away"""
+
+    async def call(self, func, *args, priority=None, **kwargs):
+        return func(*args, **kwargs)
+
+class FakeJobQueue:
+    def run_repeating(self, callback, interval):
+        return object()
+
+class FakeBot:
+    id = 1
+
+    def __init__(self):
+        self.restrictions = []
+
+    def restrict_chat_member(self, chat_id, user_id, permissions, **kwargs):
+        # PTB serializes the permissions into the request
+        self.restrictions.append((chat_id, user_id, permissions.to_dict()))
+        return True
+
+class FakeChat:
+    type = "supergroup"
+    title = "Lemon"
+
+    def __init__(self, bot, chat_id=-100123):
+        self.bot = bot
+        self.id = chat_id
+
+    def restrict_member(self, user_id, permissions, **kwargs):
+        return self.bot.restrict_chat_member(self.id, user_id, permissions)
+
+    def get_member_count(self):
+        return 3
+
+class FakeMessage:
+    def __init__(self, chat, new_members=(), message_id=0):
+        self.chat = chat
+        self.chat_id = chat.id
+        self.message_id = message_id
+        self.new_chat_members = list(new_members)
+        self.sent = []
+        self.replies = []
+
+    def reply_text(self, text, **kwargs):
+        self.sent.append(text)
+        self.replies.append(FakeMessage(self.chat, message_id=len(self.sent)))
+        return self.replies[-1]
+
+class FakeQuery:
+    def __init__(self, message, user, data):
+        self.message = message
+        self.from_user = user
+        self.data = data
+        self.answers = []
+
+    def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+    def edit_message_text(self, text, **kwargs):
+        self.message.sent.append(text)
+
+class FakeDatabase:
+    async def get_chat(self, chat_id):
+        return {"welcome": {"enabled": True, "captcha_enabled": True, "captcha_timeout": 60}}
+
+def member(user_id):
+    return SimpleNamespace(id=user_id, first_name=f"User {user_id}", username=None)
+
+@pytest.fixture
+def chat(monkeypatch):
+    monkeypatch.setattr(greetings, "db", FakeDatabase())
+    return FakeChat(FakeBot())
+
+def fake_context(chat):
+    return SimpleNamespace(bot=chat.bot, bot_data={"request_scheduler": FakeScheduler()}, job_queue=FakeJobQueue())
+
+def press(chat, message, user, data):
+    query = FakeQuery(message, user, data)
+    asyncio.run(greetings.verify_button_callback(SimpleNamespace(callback_query=query), fake_context(chat)))
+    return query
+
+def test_single_join_restricts_until_verified(chat):
+    message = FakeMessage(chat, [member(42)])
+    update = SimpleNamespace(effective_chat=chat, effective_message=message)
+    asyncio.run(greetings.welcome_new_members(update, fake_context(chat)))
+
+    assert chat.bot.restrictions == [(chat.id, 42, greetings.RESTRICTED.to_dict())]
+    assert len(message.sent) == 1
+    assert (chat.id, 42) in greetings.verification_sweeper._wheel
+
+    query = press(chat, message, member(42), "verify_42")
+    assert chat.bot.restrictions[-1] == (chat.id, 42, greetings.UNRESTRICTED.to_dict())
+    assert query.answers == ["You have been verified!"]
+    assert (chat.id, 42) not in greetings.verification_sweeper._wheel
+
+def test_batch_join_restricts_until_verified(chat):
+    message = FakeMessage(chat)
+    members = [member(7), member(8)]
+    asyncio.run(greetings.welcome_batch(fake_context(chat), message, members))
+
+    assert chat.bot.restrictions == [(chat.id, user_id, greetings.RESTRICTED.to_dict()) for user_id in (7, 8)]
+    assert len(message.sent) == 1
+    assert (chat.id, 7) in greetings.verification_sweeper._wheel
+
+    [welcome] = message.replies
+    query = press(chat, welcome, member(7), "verify_batch")
+    assert chat.bot.restrictions[-1] == (chat.id, 7, greetings.UNRESTRICTED.to_dict())
+    assert query.answers == ["You have been verified!"]
+    assert (chat.id, 7) not in greetings.verification_sweeper._wheel
+    assert (chat.id, 8) in greetings.verification_sweeper._wheel
+
+    # Only the batch's members may use its button
+    query = press(chat, welcome, member(9), "verify_batch")
+    assert query.answers == ["This verification is not for you."]
+
+def test_batch_verification_survives_restart(chat, monkeypatch):
+    # A restarted bot only has the persisted deadlines
+    sweeper = greetings.Sweeper(greetings.expire_verifications)
+    monkeypatch.setattr(greetings, "verification_sweeper", sweeper)
+    sweeper.restore(FakeJobQueue(), [{"key": [chat.id, 5], "deadline": time.time() + 60, "data": 3}])
+
+    welcome = FakeMessage(chat, message_id=3)
+    query = press(chat, welcome, member(5), "verify_batch")
+    assert chat.bot.restrictions == [(chat.id, 5, greetings.UNRESTRICTED.to_dict())]
+    assert query.answers == ["You have been verified!"]
+    assert (chat.id, 5) not in sweeper._wheel
+
+    # The deadline is tied to its own welcome message
+    sweeper.restore(FakeJobQueue(), [{"key": [chat.id, 6], "deadline": time.time() + 60, "data": 3}])
+    query = press(chat, FakeMessage(chat, message_id=4), member(6), "verify_batch")
+    assert query.answers == ["This verification is not for you."]
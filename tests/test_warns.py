@@ -0,0 +1,49 @@
+import os
+import asyncio
+import pytest
+
+# Importing the lemon package loads the bot and its dependencies
+pytest.importorskip("telegram")
+pytest.importorskip("motor")
+
+from lemon.database.mongo import MongoDB, INDEXES
+
+# Warns fired at one user at once
+CONCURRENT_WARNS = 200
+
+async def warns_collection():
+    """Get a scratch warns collection on MONGO_TEST_URI, or an in-memory mock without it"""
+    uri = os.getenv("MONGO_TEST_URI")
+    if uri:
+        import motor.motor_asyncio
+        client = motor.motor_asyncio.AsyncIOMotorClient(uri)
+    else:
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        client = mongomock_motor.AsyncMongoMockClient()
+
+    collection = client["lemon_test"]["warns"]
+    await collection.delete_many({})
+
+    # The same unique index the bot creates, concurrent upserts rely on it
+    for name, keys, options in INDEXES:
+        if name == "warns":
+            await collection.create_index(keys, **options)
+    return collection
+
+def test_concurrent_warns_are_all_counted():
+    async def run():
+        database = MongoDB.__new__(MongoDB)
+        database.async_warns = await warns_collection()
+        try:
+            counts = await asyncio.gather(*(
+                database.add_warn(-100123, 42, f"reason {index}") for index in range(CONCURRENT_WARNS)
+            ))
+            stored = await database.get_warns(-100123, 42)
+        finally:
+            await database.async_warns.delete_many({})
+        return counts, stored
+
+    counts, stored = asyncio.run(run())
+
+    assert len(stored["warns"]) == CONCURRENT_WARNS
+    assert sorted(counts) == list(range(1, CONCURRENT_WARNS + 1))